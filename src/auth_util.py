@@ -1,25 +1,24 @@
 """Utility functions that deal with the sqlite database 'users'."""
 
-import os
-
+from concurrent.futures import Future
 import sqlite3
-import atexit
 import string
-import random
-import base64
+import secrets
+import time
+import hmac
+import traceback
+
+from functools import partial
+from hashlib import sha256
+from typing import Optional, Tuple, Dict, FrozenSet, Callable, Iterable
 
-from hashlib import sha512
-from typing import Optional, Tuple, Dict
+from gi.repository import GObject  # type: ignore
 
+from . import database_util
+from . import password_util
 
-try:
-    os.mkdir(os.path.expanduser("~/.liegensteuerung"))
-except FileExistsError:
-    pass
-finally:
-    os.chdir(os.path.expanduser("~/.liegensteuerung"))
+from .change_util import changes
 
-DATABASE_NAME: str = "liegensteuerung.db"
 
 ACCESS_LEVELS: Dict[str, int] = {"admin": 2, "doctor": 1, "helper": 0}
 ACCESS_LEVEL_NAMES: Dict[int, str] = {2: "admin", 1: "doctor", 0: "helper"}
@@ -29,20 +28,32 @@ ACCESS_LEVEL_TRANSLATIONS: Dict[str, str] = {
     "helper": "Aushilfe",
 }
 
+# The access levels of the other users that a user of an access level can
+# edit (change the password of, delete). Everyone can edit themselves.
+EDITABLE_ACCESS_LEVELS: Dict[str, FrozenSet[str]] = {
+    access_level: frozenset(
+        other_level
+        for other_level in ACCESS_LEVELS
+        if ACCESS_LEVELS[other_level] < ACCESS_LEVELS[access_level]
+    )
+    for access_level in ACCESS_LEVELS
+}
 
-connection = sqlite3.connect(DATABASE_NAME)
-
-cursor = connection.cursor()
+# Called in the main loop once a user change is done, with None or the
+# ValueError that explains why it failed
+ChangeCallback = Callable[[Optional[ValueError]], None]
 
-# Create table
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS users
-         (username TEXT, password_hash TEXT, salt TEXT, access_level INT)"""
-)
+# The number of users of each access level, see get_role_counts()
+role_counts: Optional[Dict[int, int]] = None
 
-connection.commit()
+# How many seconds a verified password is remembered, so that e.g. admin
+# actions shortly after logging in don't hash the admin's password again
+REAUTH_TIMEOUT: float = 300
 
-atexit.register(connection.close)
+# The users' recently verified passwords as (expiry time, HMAC). The key is
+# random per process, the HMACs are worthless outside of it.
+REAUTH_KEY: bytes = secrets.token_bytes(32)
+reauth_tokens: Dict[str, Tuple[float, bytes]] = {}
 
 
 def generate_salt(length: int = 32) -> str:
@@ -55,20 +66,105 @@ def generate_salt(length: int = 32) -> str:
         str: A random string. Can be used as a salt.
     """
     return "".join(
-        [random.choice(string.ascii_letters) for _ in range(length)]
+        [secrets.choice(string.ascii_letters) for _ in range(length)]
     )
 
 
+def get_reauth_token(password: str) -> bytes:
+    """Get the token that proves a password was verified.
+
+    Args:
+        password (str): The password
+
+    Returns:
+        bytes: An HMAC of the password
+    """
+    return hmac.new(REAUTH_KEY, password.encode(), sha256).digest()
+
+
+def remember_password(username: str, password: str) -> None:
+    """Remember that a user's password was verified.
+
+    Args:
+        username (str): The user's username
+        password (str): The user's password
+    """
+    reauth_tokens[username] = (
+        time.monotonic() + REAUTH_TIMEOUT,
+        get_reauth_token(password),
+    )
+
+
+def forget_password(username: str) -> None:
+    """Forget a user's verified password, e.g. because it changed.
+
+    Args:
+        username (str): The user's username
+    """
+    reauth_tokens.pop(username, None)
+
+
+def is_password_remembered(username: str, password: str) -> bool:
+    """Return whether a user's password was verified recently.
+
+    Args:
+        username (str): The user's username
+        password (str): The password to check
+
+    Returns:
+        bool: True if this password was verified in the last REAUTH_TIMEOUT
+            seconds, False if it has to be verified
+    """
+    token: Optional[Tuple[float, bytes]] = reauth_tokens.get(username)
+
+    if token is None or token[0] < time.monotonic():
+        forget_password(username)
+        return False
+
+    return hmac.compare_digest(token[1], get_reauth_token(password))
+
+
+def get_role_counts() -> Dict[int, int]:
+    """Get the number of users of each access level.
+
+    The counts are queried once and then kept up to date by new_user(),
+    delete_user() and modify_access_level() (see count_role()), the only
+    places that change users, so e.g. logging out doesn't query the database.
+
+    Returns:
+        Dict[int, int]: The number of users by access level id
+    """
+    global role_counts
+
+    if role_counts is None:
+        role_counts = {access_level: 0 for access_level in ACCESS_LEVEL_NAMES}
+
+        for access_level, count in database_util.execute(
+            "SELECT access_level, COUNT(*) FROM users GROUP BY access_level"
+        ).fetchall():
+            role_counts[access_level] = count
+
+    return role_counts
+
+
+def count_role(access_level: str, change: int) -> None:
+    """Update the number of users of an access level after a change.
+
+    Args:
+        access_level (str): The access level. One of ACCESS_LEVELS
+        change (int): How many users were added (or removed, if negative)
+    """
+    if role_counts is not None:
+        role_counts[ACCESS_LEVELS[access_level]] += change
+
+
 def does_admin_exist() -> bool:
     """Return whether an admin account exists.
 
     Returns:
         bool: Whether an admin account exists.
     """
-    return cursor.execute(
-        "SELECT COUNT(*) FROM users WHERE access_level = ?",
-        (ACCESS_LEVELS["admin"],),
-    ).fetchone()[0]
+    return get_role_counts()[ACCESS_LEVELS["admin"]] > 0
 
 
 def does_doctor_exist() -> bool:
@@ -77,72 +173,89 @@ def does_doctor_exist() -> bool:
     Returns:
         bool: Whether a doctor account exists.
     """
-    return cursor.execute(
-        "SELECT COUNT(*) FROM users WHERE access_level = ?",
-        (ACCESS_LEVELS["doctor"],),
-    ).fetchone()[0]
+    return get_role_counts()[ACCESS_LEVELS["doctor"]] > 0
 
 
 def new_user(
     username: str,
     password: str,
     access_level: str,
+    callback: ChangeCallback,
     admin_username: Optional[str] = None,
     admin_password: Optional[str] = None,
 ) -> None:
     """Insert a new user into the database.
 
+    The passwords are hashed in a worker thread, see hash_password_async().
+
     Args:
         username (str): The user's username
         password (str): The user's password
         access_level (str): The user's access level. One of ACCESS_LEVELS
+        callback (ChangeCallback): Called in the main loop when done, with a
+            ValueError if the admin credentials are wrong or the user exists
         admin_username (str, optional): An administrator's username
             or None if no admin exists. Defaults to None
         admin_password (str, optional): An administrator's password
             or None if no admin exists. Defaults to None
 
     Raises:
-        ValueError: if admin credentials are wrong or missing.
+        ValueError: if admin credentials are missing or invalid or the user
+            already exists
     """
-    if does_admin_exist() and not (
-        access_level == "doctor" and not does_doctor_exist()
-    ):
-        if admin_username is None or admin_password is None:
-            raise ValueError(
-                "When creating an admin account, "
-                "admin credentials may not be None if an admin exists."
-            )
-        elif not authenticate(admin_username, admin_password):
-            raise ValueError("Admin password invalid")
 
-        elif (
-            ACCESS_LEVELS[access_level]
-            > ACCESS_LEVELS[get_access_level(admin_username)]
-        ):
-            raise ValueError(
-                "Given admin does not have sufficient permissions"
+    def on_authorized(error: Optional[ValueError]) -> None:
+        if error is None:
+            hash_password_async(password, store_user, callback)
+        else:
+            callback(error)
+
+    def store_user(salt: str, password_hash: str) -> None:
+        try:
+            database_util.execute(
+                "INSERT INTO users VALUES (?, ?, ?, ?)",
+                (username, password_hash, salt, ACCESS_LEVELS[access_level]),
             )
+        except sqlite3.IntegrityError:
+            # Another user with the same name was added in the meantime
+            callback(ValueError("User already exists"))
+            return
+        database_util.commit()
 
-    if cursor.execute(
-        "SELECT COUNT(*) FROM users WHERE username = ?", (username,)
-    ).fetchone()[0]:
-        raise ValueError("User already exists")
+        count_role(access_level, 1)
 
-    salt: str = generate_salt()
+        changes.emit("user-added", username)
 
-    password_hash: str = base64.b64encode(
-        sha512((password + salt).encode()).digest()
-    ).decode()
+        callback(None)
 
-    cursor.execute(
-        "INSERT INTO users VALUES (?, ?, ?, ?)",
-        (username, password_hash, salt, ACCESS_LEVELS[access_level]),
+    needs_admin: bool = does_admin_exist() and not (
+        access_level == "doctor" and not does_doctor_exist()
     )
-    connection.commit()
+
+    if needs_admin and (admin_username is None or admin_password is None):
+        raise ValueError(
+            "When creating an admin account, "
+            "admin credentials may not be None if an admin exists."
+        )
+
+    if database_util.execute(
+        "SELECT COUNT(*) FROM users WHERE username = ?", (username,)
+    ).fetchone()[0]:
+        raise ValueError("User already exists")
+
+    if needs_admin:
+        authorize_async(
+            admin_username, admin_password, (access_level,), on_authorized
+        )
+    else:
+        on_authorized(None)
 
 
 def delete_user(
-    username: str, admin_username: str, admin_password: str,
+    username: str,
+    admin_username: str,
+    admin_password: str,
+    callback: ChangeCallback,
 ) -> None:
     """Delete a user from the database.
 
@@ -150,38 +263,46 @@ def delete_user(
         username (str): The user's username
         admin_username (str, optional): An administrator's username
         admin_password (str, optional): An administrator's password
+        callback (ChangeCallback): Called in the main loop when done, with a
+            ValueError if the admin credentials are wrong
 
     Raises:
-        ValueError: if admin credentials are wrong
+        ValueError: if a username is invalid
     """
-    if not authenticate(admin_username, admin_password):
-        raise ValueError("Admin password invalid")
+    access_level: str = get_access_level(username)
 
-    elif (
-        ACCESS_LEVELS[get_access_level(username)]
-        > ACCESS_LEVELS[get_access_level(admin_username)]
-    ):
-        raise ValueError("Given admin does not have sufficient permissions")
+    def on_authorized(error: Optional[ValueError]) -> None:
+        if error is None:
+            database_util.execute(
+                "DELETE FROM users WHERE username = ?", (username,)
+            )
+            database_util.commit()
 
-    else:
-        cursor.execute("DELETE FROM users WHERE username = ?", (username,))
-        connection.commit()
+            count_role(access_level, -1)
+            forget_password(username)
 
+            changes.emit("user-deleted", username)
 
-def authenticate(username: str, password: str) -> bool:
-    """Verify a user's password.
+        callback(error)
+
+    authorize_async(
+        admin_username, admin_password, (access_level,), on_authorized
+    )
+
+
+def get_password_entry(username: str) -> Tuple[str, str]:
+    """Get a user's salt and password hash.
 
     Args:
         username (str): The user's username
-        password (str): The user's password
 
     Returns:
-        bool: True if the password is correct, False otherwise
+        Tuple[str, str]: The salt and the password hash
 
     Raises:
         ValueError: if the username is invalid
     """
-    user_entry: Optional[Tuple[str, str]] = cursor.execute(
+    user_entry: Optional[Tuple[str, str]] = database_util.execute(
         "SELECT salt, password_hash FROM users WHERE username = ?",
         (username,),
     ).fetchone()
@@ -189,15 +310,301 @@ def authenticate(username: str, password: str) -> bool:
     if user_entry is None:
         raise ValueError("Username invalid")
 
+    return user_entry
+
+
+def verify_password(
+    password: str, salt: str, password_hash: str
+) -> Tuple[bool, Optional[Tuple[str, str]]]:
+    """Verify a password and hash it again if its hash is outdated.
+
+    Doesn't use the database, so it can run in a worker thread.
+
+    Args:
+        password (str): The password
+        salt (str): The salt of the password's hash
+        password_hash (str): The password's hash
+
+    Returns:
+        Tuple[bool, Optional[Tuple[str, str]]]: Whether the password is
+            correct and, if it is and its hash is outdated, a new salt and
+            hash made with the configured settings
+    """
+    if not password_util.verify(password, salt, password_hash):
+        return False, None
+
+    if password_util.needs_rehash(password_hash):
+        new_salt: str = generate_salt()
+        new_password_hash: str = password_util.hash_password(
+            password, new_salt
+        )
+
+        return True, (new_salt, new_password_hash)
+
+    return True, None
+
+
+def finish_authentication(
+    username: str,
+    password: str,
+    old_password_hash: str,
+    new_entry: Optional[Tuple[str, str]],
+) -> None:
+    """Remember a verified password and store its new hash, if any.
+
+    Args:
+        username (str): The user's username
+        password (str): The verified password
+        old_password_hash (str): The hash the password was verified with
+        new_entry (Optional[Tuple[str, str]]): The new salt and hash or None
+    """
+    if new_entry is not None:
+        # Unless the password was changed in the meantime
+        database_util.execute(
+            "UPDATE users SET salt = ?, password_hash = ? "
+            "WHERE username = ? AND password_hash = ?",
+            (*new_entry, username, old_password_hash),
+        )
+        database_util.commit()
+
+    remember_password(username, password)
+
+
+def authenticate(username: str, password: str) -> bool:
+    """Verify a user's password.
+
+    A password that was verified in the last REAUTH_TIMEOUT seconds is not
+        hashed again. Use authenticate_async() to not block the main loop.
+
+    Args:
+        username (str): The user's username
+        password (str): The user's password
+
+    Returns:
+        bool: True if the password is correct, False otherwise
+
+    Raises:
+        ValueError: if the username is invalid
+    """
     salt: str
-    correct_password_hash: str
-    salt, correct_password_hash = user_entry
+    password_hash: str
+    salt, password_hash = get_password_entry(username)
+
+    if is_password_remembered(username, password):
+        return True
 
-    password_hash: str = base64.b64encode(
-        sha512((password + salt).encode()).digest()
-    ).decode()
+    is_correct: bool
+    new_entry: Optional[Tuple[str, str]]
+    is_correct, new_entry = verify_password(password, salt, password_hash)
 
-    return password_hash == correct_password_hash
+    if is_correct:
+        finish_authentication(username, password, password_hash, new_entry)
+
+    return is_correct
+
+
+def authenticate_async(
+    username: str, password: str, callback: Callable[[bool], None]
+) -> None:
+    """Verify a user's password (e.g. to log in) in a worker thread.
+
+    The password is always hashed, even if it was verified recently.
+
+    Args:
+        username (str): The user's username
+        password (str): The user's password
+        callback (Callable[[bool], None]): Called in the main loop with True
+            if the password is correct, False otherwise
+
+    Raises:
+        ValueError: if the username is invalid
+    """
+    salt: str
+    password_hash: str
+    salt, password_hash = get_password_entry(username)
+
+    password_util.run_async(
+        verify_password,
+        partial(on_verified, username, password, password_hash, callback),
+        password,
+        salt,
+        password_hash,
+    )
+
+
+def on_verified(
+    username: str,
+    password: str,
+    password_hash: str,
+    callback: Callable[[bool], None],
+    future: Future,
+) -> None:
+    """Finish an authentication started by authenticate_async().
+
+    Args:
+        username (str): The user's username
+        password (str): The user's password
+        password_hash (str): The hash the password was verified with
+        callback (Callable[[bool], None]): The callback to pass the result to
+        future (Future): The finished Future of verify_password()
+    """
+    is_correct: bool
+    new_entry: Optional[Tuple[str, str]]
+
+    try:
+        is_correct, new_entry = future.result()
+    except Exception:
+        # E.g. an unknown hash format or invalid settings in auth.json. The
+        # callback must still be called, LoginPage waits for it.
+        traceback.print_exc()
+        is_correct, new_entry = False, None
+
+    if is_correct:
+        finish_authentication(username, password, password_hash, new_entry)
+
+    callback(is_correct)
+
+
+def reauthenticate_async(
+    username: str, password: str, callback: Callable[[bool], None]
+) -> None:
+    """Verify a user's password again, e.g. before an admin action.
+
+    Like authenticate_async(), but a password that was verified in the last
+        REAUTH_TIMEOUT seconds is not hashed again and the callback is called
+        right away.
+
+    Args:
+        username (str): The user's username
+        password (str): The user's password
+        callback (Callable[[bool], None]): Called in the main loop with True
+            if the password is correct, False otherwise
+
+    Raises:
+        ValueError: if the username is invalid
+    """
+    if is_password_remembered(username, password):
+        callback(True)
+    else:
+        authenticate_async(username, password, callback)
+
+
+def authorize_async(
+    admin_username: str,
+    admin_password: str,
+    access_levels: Iterable[str],
+    callback: ChangeCallback,
+) -> None:
+    """Check that an admin may change users of some access levels.
+
+    Args:
+        admin_username (str): The admin's username
+        admin_password (str): The admin's password
+        access_levels (Iterable[str]): The access levels involved in the
+            change. None of them may be higher than the admin's
+        callback (ChangeCallback): Called in the main loop with None if the
+            admin may make the change, a ValueError otherwise
+
+    Raises:
+        ValueError: if the admin's username is invalid
+    """
+    access_levels = tuple(access_levels)
+
+    def on_authenticated(is_correct: bool) -> None:
+        if not is_correct:
+            callback(ValueError("Admin password invalid"))
+            return
+
+        admin_level: int = ACCESS_LEVELS[get_access_level(admin_username)]
+
+        if any(
+            ACCESS_LEVELS[access_level] > admin_level
+            for access_level in access_levels
+        ):
+            callback(
+                ValueError("Given admin does not have sufficient permissions")
+            )
+        else:
+            callback(None)
+
+    reauthenticate_async(admin_username, admin_password, on_authenticated)
+
+
+def hash_password_async(
+    password: str,
+    callback: Callable[[str, str], None],
+    error_callback: ChangeCallback,
+) -> None:
+    """Hash a new password with a new salt in a worker thread.
+
+    Args:
+        password (str): The password
+        callback (Callable[[str, str], None]): Called in the main loop with
+            the salt and the hash
+        error_callback (ChangeCallback): Called in the main loop instead if
+            the password couldn't be hashed
+    """
+    salt: str = generate_salt()
+
+    password_util.run_async(
+        password_util.hash_password,
+        partial(on_hashed, salt, callback, error_callback),
+        password,
+        salt,
+    )
+
+
+def on_hashed(
+    salt: str,
+    callback: Callable[[str, str], None],
+    error_callback: ChangeCallback,
+    future: Future,
+) -> None:
+    """Finish hashing a password started by hash_password_async().
+
+    Args:
+        salt (str): The salt
+        callback (Callable[[str, str], None]): The callback to pass the salt
+            and hash to
+        error_callback (ChangeCallback): The callback to pass an error to
+        future (Future): The finished Future of password_util.hash_password()
+    """
+    try:
+        password_hash: str = future.result()
+    except Exception:
+        # E.g. invalid settings in auth.json
+        traceback.print_exc()
+        error_callback(ValueError("Password could not be hashed"))
+        return
+
+    callback(salt, password_hash)
+
+
+def set_password(
+    username: str, password: str, callback: ChangeCallback
+) -> None:
+    """Store a user's new password.
+
+    The password is hashed in a worker thread, see hash_password_async().
+
+    Args:
+        username (str): The user's username
+        password (str): The user's new password
+        callback (ChangeCallback): Called in the main loop when done
+    """
+
+    def store_password(salt: str, password_hash: str) -> None:
+        database_util.execute(
+            "UPDATE users SET salt = ?, password_hash = ? WHERE username = ?",
+            (salt, password_hash, username),
+        )
+        database_util.commit()
+
+        forget_password(username)
+
+        callback(None)
+
+    hash_password_async(password, store_password, callback)
 
 
 def get_access_level(username: str) -> str:
@@ -212,7 +619,7 @@ def get_access_level(username: str) -> str:
     Raises:
         ValueError: if the username is invalid
     """
-    user_entry: Optional[Tuple[str, str]] = cursor.execute(
+    user_entry: Optional[Tuple[str, str]] = database_util.execute(
         "SELECT access_level FROM users WHERE username = ?", (username,),
     ).fetchone()
 
@@ -227,95 +634,218 @@ def get_access_level(username: str) -> str:
 
 
 def modify_password(
-    username: str, old_password: str, new_password: str
+    username: str,
+    old_password: str,
+    new_password: str,
+    callback: ChangeCallback,
 ) -> None:
-    """Insert a new user into the database.
+    """Change a user's password.
 
     Args:
         username (str): The user's username
         old_password (str): The user's old password
         new_password (str): The user's new password
+        callback (ChangeCallback): Called in the main loop when done, with a
+            ValueError if the old password is wrong
 
-    No Longer Raises:
-        ValueError: if the old credentials are invalid
+    Raises:
+        ValueError: if the username is invalid
     """
-    if not authenticate(username, old_password):
-        raise ValueError("Password invalid")
 
-    new_salt: str = generate_salt()
+    def on_authenticated(is_correct: bool) -> None:
+        if is_correct:
+            set_password(username, new_password, on_set)
+        else:
+            callback(ValueError("Password invalid"))
 
-    new_password_hash: str = base64.b64encode(
-        sha512((new_password + new_salt).encode()).digest()
-    ).decode()
+    def on_set(error: Optional[ValueError]) -> None:
+        if error is None:
+            remember_password(username, new_password)
 
-    cursor.execute(
-        "UPDATE users SET salt = ?, password_hash = ? WHERE username = ?",
-        (new_salt, new_password_hash, username),
-    )
-    connection.commit()
+        callback(error)
+
+    reauthenticate_async(username, old_password, on_authenticated)
 
 
 def modify_access_level(
-    username: str, access_level: str, admin_username: str, admin_password: str
+    username: str,
+    access_level: str,
+    admin_username: str,
+    admin_password: str,
+    callback: ChangeCallback,
 ) -> None:
-    """Insert a new user into the database.
+    """Change a user's access level.
 
     Args:
         username (str): The user's username
         access_level (str): The new access level for the user
         admin_username (str): An admin's username
         admin_password (str): An admin's password
+        callback (ChangeCallback): Called in the main loop when done, with a
+            ValueError if the admin credentials are wrong
 
-    No Longer Raises:
-        ValueError: if the admin credentials are invalid
+    Raises:
+        ValueError: if a username is invalid
     """
-    if not authenticate(admin_username, admin_password):
-        raise ValueError("Admin password invalid")
-    if (
-        ACCESS_LEVELS[access_level]
-        > ACCESS_LEVELS[get_access_level(admin_username)]
-    ) or (
-        ACCESS_LEVELS[get_access_level(username)]
-        > ACCESS_LEVELS[get_access_level(admin_username)]
-    ):
-        raise ValueError("Given admin does not have sufficient permissions")
-
-    cursor.execute(
-        "UPDATE users SET access_level = ? WHERE username = ?",
-        (ACCESS_LEVELS[access_level], username),
+    old_access_level: str = get_access_level(username)
+
+    def on_authorized(error: Optional[ValueError]) -> None:
+        if error is None:
+            database_util.execute(
+                "UPDATE users SET access_level = ? WHERE username = ?",
+                (ACCESS_LEVELS[access_level], username),
+            )
+            database_util.commit()
+
+            count_role(old_access_level, -1)
+            count_role(access_level, 1)
+
+            changes.emit("user-modified", username)
+
+        callback(error)
+
+    authorize_async(
+        admin_username,
+        admin_password,
+        (access_level, old_access_level),
+        on_authorized,
     )
-    connection.commit()
 
 
 def modify_password_from_admin(
-    username: str, new_password: str, admin_username: str, admin_password: str
+    username: str,
+    new_password: str,
+    admin_username: str,
+    admin_password: str,
+    callback: ChangeCallback,
 ) -> None:
-    """Insert a new user into the database.
+    """Change another user's password as an administrator.
 
     Args:
         username (str): The user's username
         new_password (str): The user's new password
         admin_username (str): An administrator's username
-            or None if no admin exists. Defaults to None
         admin_password (str): An administrator's password
-            or None if no admin exists. Defaults to None
+        callback (ChangeCallback): Called in the main loop when done, with a
+            ValueError if the admin credentials are wrong
+
+    Raises:
+        ValueError: if a username is invalid
     """
-    if not authenticate(admin_username, admin_password):
-        raise ValueError("Admin password invalid")
-    if (
-        ACCESS_LEVELS[get_access_level(username)]
-        > ACCESS_LEVELS[get_access_level(admin_username)]
-    ):
-        raise ValueError("Given admin does not have sufficient permissions")
-
-    new_salt: str = generate_salt()
-
-    new_password_hash: str = base64.b64encode(
-        sha512((new_password + new_salt).encode()).digest()
-    ).decode()
-
-    cursor.execute(
-        "UPDATE users SET salt = ?, password_hash = ? WHERE username = ?",
-        (new_salt, new_password_hash, username),
+
+    def on_authorized(error: Optional[ValueError]) -> None:
+        if error is None:
+            set_password(username, new_password, callback)
+        else:
+            callback(error)
+
+    authorize_async(
+        admin_username,
+        admin_password,
+        (get_access_level(username),),
+        on_authorized,
     )
-    connection.commit()
+
+
+class Session:
+    """The logged in user and their cached access level.
+
+    The access level is queried once and again only after it was modified,
+    so checking permissions (e.g. on every page switch) needs no query.
+
+    Attributes:
+        username (str): The user's username
+    """
+
+    username: str
+
+    def __init__(self, username: str):
+        """Create a new Session for a user that just logged in.
+
+        Args:
+            username (str): The user's username
+        """
+        self.username = username
+
+        self._access_level: Optional[str] = None
+
+        self._handler_id: int = changes.connect(
+            "user-modified", self.on_user_modified
+        )
+
+    @property
+    def access_level(self) -> str:
+        """Get the user's access level.
+
+        Returns:
+            str: The user's access level. One of ACCESS_LEVELS
+        """
+        if self._access_level is None:
+            self._access_level = get_access_level(self.username)
+
+        return self._access_level
+
+    @property
+    def is_admin(self) -> bool:
+        """Return whether the user is an admin.
+
+        Returns:
+            bool: Whether the user is an admin
+        """
+        return self.access_level == "admin"
+
+    @property
+    def is_doctor(self) -> bool:
+        """Return whether the user is a doctor.
+
+        Returns:
+            bool: Whether the user is a doctor
+        """
+        return self.access_level == "doctor"
+
+    def has_access_level(self, access_level: str) -> bool:
+        """Return whether the user has at least an access level.
+
+        Args:
+            access_level (str): The access level. One of ACCESS_LEVELS
+
+        Returns:
+            bool: Whether the user's access level is at least as high
+        """
+        return (
+            ACCESS_LEVELS[self.access_level] >= ACCESS_LEVELS[access_level]
+        )
+
+    def can_edit(self, username: str, access_level: str) -> bool:
+        """Return whether the user can edit another user.
+
+        Args:
+            username (str): The other user's username
+            access_level (str): The other user's access level
+
+        Returns:
+            bool: Whether the user can change the other user's password and
+                delete them
+        """
+        return (
+            username == self.username
+            or access_level in EDITABLE_ACCESS_LEVELS[self.access_level]
+        )
+
+    def on_user_modified(self, hub: GObject.Object, username: str) -> None:
+        """Forget the cached access level if it was modified.
+
+        Args:
+            hub (GObject.Object): The ChangeHub that emitted the signal
+            username (str): The modified user's username
+        """
+        if username == self.username:
+            self.invalidate()
+
+    def invalidate(self) -> None:
+        """Forget the cached access level, it is queried again when needed."""
+        self._access_level = None
+
+    def close(self) -> None:
+        """Stop tracking changes, e.g. when the user logs out."""
+        changes.disconnect(self._handler_id)
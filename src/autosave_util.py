@@ -0,0 +1,113 @@
+"""Save edits after the user stopped typing instead of on every key press.
+
+Every write to the database ends with a commit, which is an fsync on the SD
+card. An Autosaver coalesces all edits of a form into one save that runs
+after AUTOSAVE_DELAY ms without further edits or when the form is left
+(flush()).
+"""
+
+from typing import Callable, Dict, Optional
+
+from gi.repository import GLib  # type: ignore
+
+
+# How many ms to wait after the last edit before saving
+AUTOSAVE_DELAY: int = 1000
+
+# Save states
+SAVED: str = "saved"
+DIRTY: str = "dirty"
+INCOMPLETE: str = "incomplete"
+UNCHANGED: str = "unchanged"
+
+SAVE_STATE_TRANSLATIONS: Dict[str, str] = {
+    SAVED: "Alle Änderungen gespeichert",
+    DIRTY: "Ungespeicherte Änderungen",
+    INCOMPLETE: "Unvollständig, wird nicht gespeichert",
+    UNCHANGED: "",
+}
+
+
+class Autosaver:
+    """Coalesce edits into one delayed save.
+
+    Attributes:
+        state (str): SAVED, DIRTY, INCOMPLETE or UNCHANGED
+    """
+
+    state: str
+
+    def __init__(
+        self,
+        save: Callable[[], bool],
+        on_state_changed: Callable[[str], None],
+        delay: int = AUTOSAVE_DELAY,
+    ):
+        """Create a new Autosaver.
+
+        Args:
+            save (Callable[[], bool]): Saves all edits. Returns False if they
+                are incomplete and weren't saved
+            on_state_changed (Callable[[str], None]): Called with the new
+                state whenever it changes, e.g. to show it to the user
+            delay (int, optional): How many ms to wait after the last edit
+                before saving. Defaults to AUTOSAVE_DELAY
+        """
+        self.save = save
+        self.on_state_changed = on_state_changed
+        self.delay = delay
+
+        self.state = UNCHANGED
+
+        self._timeout_id: Optional[int] = None
+
+    def set_state(self, state: str) -> None:
+        """Set the state and report it if it changed.
+
+        Args:
+            state (str): The new state
+        """
+        if state != self.state:
+            self.state = state
+            self.on_state_changed(state)
+
+    def reset(self, state: str = UNCHANGED) -> None:
+        """Forget all edits without saving them, e.g. for a new form.
+
+        Args:
+            state (str, optional): The state to start in. Defaults to
+                UNCHANGED
+        """
+        self.cancel()
+        self.set_state(state)
+
+    def mark_dirty(self) -> None:
+        """Note an edit and (re)start the delay until the save."""
+        self.cancel()
+        self.set_state(DIRTY)
+
+        self._timeout_id = GLib.timeout_add(self.delay, self._on_timeout)
+
+    def cancel(self) -> None:
+        """Don't run the scheduled save. The edits are still unsaved."""
+        if self._timeout_id is not None:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = None
+
+    def flush(self) -> None:
+        """Save unsaved edits now."""
+        self.cancel()
+
+        if self.state == DIRTY:
+            self.set_state(SAVED if self.save() else INCOMPLETE)
+
+    def _on_timeout(self) -> bool:
+        """Save after the delay.
+
+        Returns:
+            bool: False, to not be called again by GLib
+        """
+        self._timeout_id = None
+        self.flush()
+
+        return False
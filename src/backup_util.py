@@ -0,0 +1,276 @@
+"""Back up the database while the program is running.
+
+Copying the database file while it is written to can produce a torn copy.
+Backups are made with SQLite's online backup API instead, in a worker thread
+with its own connection: BACKUP_STEP_PAGES pages are copied at a time with a
+pause in between, so writers (e.g. a treatment in progress) are never held
+up for long. Every snapshot is verified with PRAGMA integrity_check before
+it replaces the oldest one, BACKUP_COUNT snapshots are kept.
+
+A write by another connection (e.g. the DatabaseWorker) makes the copy
+start over. If that happens more than MAX_RESTARTS times, the rest is copied
+in one step. With the write-ahead log, that only holds a read snapshot, which
+doesn't block writers either.
+
+Once scheduled (see schedule()), a backup is made whenever the newest
+snapshot is older than BACKUP_INTERVAL.
+"""
+
+from typing import List, Optional
+
+from threading import Thread
+import os
+import time
+import traceback
+
+import sqlite3
+
+from gi.repository import GLib  # type: ignore
+
+from . import database_util
+
+
+BACKUP_DIRECTORY: str = os.path.join(
+    database_util.DATABASE_DIRECTORY, "backups"
+)
+BACKUP_PREFIX: str = "liegensteuerung-"
+BACKUP_SUFFIX: str = ".db"
+# Appended to a snapshot's name until it has been verified
+PARTIAL_SUFFIX: str = ".partial"
+
+# How many snapshots are kept
+BACKUP_COUNT: int = 7
+
+# How many seconds may pass between backups
+BACKUP_INTERVAL: int = 24 * 60 * 60
+
+# How many seconds pass between checks whether a backup is due
+CHECK_INTERVAL: int = 10 * 60
+
+# How many pages are copied at a time (1 MiB with 4 KiB pages) and how many
+# seconds to pause in between, so the copy doesn't hold up writers
+BACKUP_STEP_PAGES: int = 256
+BACKUP_STEP_SLEEP: float = 0.05
+
+# How often a copy may start over before the rest is copied in one step
+MAX_RESTARTS: int = 3
+
+backup_thread: Optional[Thread] = None
+
+
+class TooManyRestarts(Exception):
+    """Raised to stop a stepwise copy that keeps starting over."""
+
+
+class BackupPacer:
+    """Pause between the steps of a backup and count restarts.
+
+    Passed to sqlite3.Connection.backup() as progress callback.
+    """
+
+    def __init__(self):
+        """Create a new BackupPacer."""
+        self.restarts: int = 0
+
+        self._remaining: Optional[int] = None
+
+    def __call__(self, status: int, remaining: int, total: int) -> None:
+        """React to a step of the backup having been copied.
+
+        Args:
+            status (int): The step's SQLite result code
+            remaining (int): How many pages are left to copy
+            total (int): How many pages the database has
+
+        Raises:
+            TooManyRestarts: if the copy started over too often
+        """
+        # A copy that starts over copies the first pages again, so a step
+        # that succeeded without making progress means a restart
+        if (
+            status == sqlite3.SQLITE_OK
+            and self._remaining is not None
+            and remaining >= self._remaining
+        ):
+            self.restarts += 1
+
+            if self.restarts > MAX_RESTARTS:
+                raise TooManyRestarts()
+
+        self._remaining = remaining
+
+        time.sleep(BACKUP_STEP_SLEEP)
+
+
+def get_backups(directory: str = BACKUP_DIRECTORY) -> List[str]:
+    """Get the paths of all verified snapshots.
+
+    Args:
+        directory (str, optional): The backup directory. Defaults to
+            BACKUP_DIRECTORY
+
+    Returns:
+        List[str]: The paths, oldest first
+    """
+    try:
+        file_names: List[str] = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+
+    # The names contain the time, so they sort by age
+    return [
+        os.path.join(directory, file_name)
+        for file_name in sorted(file_names)
+        if file_name.startswith(BACKUP_PREFIX)
+        and file_name.endswith(BACKUP_SUFFIX)
+    ]
+
+
+def is_backup_due(directory: str = BACKUP_DIRECTORY) -> bool:
+    """Return whether the newest snapshot is older than BACKUP_INTERVAL.
+
+    Args:
+        directory (str, optional): The backup directory. Defaults to
+            BACKUP_DIRECTORY
+
+    Returns:
+        bool: Whether a backup should be made
+    """
+    backups: List[str] = get_backups(directory)
+
+    return (
+        not backups
+        or time.time() - os.path.getmtime(backups[-1]) > BACKUP_INTERVAL
+    )
+
+
+def backup(directory: str = BACKUP_DIRECTORY) -> str:
+    """Make a verified snapshot of the database.
+
+    Blocks until the snapshot is made, run it in a worker thread (see
+        start_backup()). The database must have been migrated by the shared
+        connection.
+
+    Args:
+        directory (str, optional): The backup directory. Defaults to
+            BACKUP_DIRECTORY
+
+    Returns:
+        str: The snapshot's path
+
+    Raises:
+        sqlite3.DatabaseError: if the snapshot is corrupt
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    path: str = os.path.join(
+        directory,
+        BACKUP_PREFIX + time.strftime("%Y%m%d-%H%M%S") + BACKUP_SUFFIX,
+    )
+    partial_path: str = path + PARTIAL_SUFFIX
+
+    source: sqlite3.Connection = database_util.connect()
+    target: sqlite3.Connection = sqlite3.connect(partial_path)
+
+    try:
+        try:
+            source.backup(
+                target,
+                pages=BACKUP_STEP_PAGES,
+                progress=BackupPacer(),
+                sleep=BACKUP_STEP_SLEEP,
+            )
+        except TooManyRestarts:
+            source.backup(target)
+
+        # Make the snapshot a single file without a write-ahead log
+        target.execute("PRAGMA journal_mode = DELETE")
+
+        result: str = target.execute("PRAGMA integrity_check").fetchone()[0]
+
+        if result != "ok":
+            raise sqlite3.DatabaseError(f"Backup is corrupt: {result}")
+    except BaseException:
+        target.close()
+        os.remove(partial_path)
+        raise
+    finally:
+        source.close()
+
+    target.close()
+    os.replace(partial_path, path)
+
+    return path
+
+
+def rotate(
+    directory: str = BACKUP_DIRECTORY, count: int = BACKUP_COUNT
+) -> None:
+    """Delete all but the newest snapshots and leftovers of failed backups.
+
+    Must not run while a backup is being made.
+
+    Args:
+        directory (str, optional): The backup directory. Defaults to
+            BACKUP_DIRECTORY
+        count (int, optional): How many snapshots to keep. Defaults to
+            BACKUP_COUNT
+    """
+    backups: List[str] = get_backups(directory)
+
+    for path in backups[: max(len(backups) - count, 0)]:
+        os.remove(path)
+
+    # Left behind if the program stopped during a backup
+    for file_name in os.listdir(directory):
+        if file_name.endswith(PARTIAL_SUFFIX):
+            os.remove(os.path.join(directory, file_name))
+
+
+def run_backup() -> None:
+    """Make a snapshot and rotate the snapshots, report errors."""
+    try:
+        backup()
+        rotate()
+    except (sqlite3.Error, OSError):
+        traceback.print_exc()
+
+
+def start_backup() -> bool:
+    """Make a snapshot in a worker thread.
+
+    Returns:
+        bool: False if a backup is already being made
+    """
+    global backup_thread
+
+    if backup_thread is not None and backup_thread.is_alive():
+        return False
+
+    # A daemon, so a backup doesn't keep the program from closing. The
+    # unfinished snapshot is removed by the next backup.
+    backup_thread = Thread(target=run_backup, name="backup", daemon=True)
+    backup_thread.start()
+
+    return True
+
+
+def on_check_timeout() -> bool:
+    """Start a backup if one is due.
+
+    Returns:
+        bool: True, to be called again by GLib
+    """
+    if is_backup_due():
+        start_backup()
+
+    return True
+
+
+def schedule() -> None:
+    """Check every CHECK_INTERVAL seconds whether a backup is due.
+
+    The first check is after CHECK_INTERVAL seconds, so backups don't slow
+        down starting the program.
+    """
+    GLib.timeout_add_seconds(CHECK_INTERVAL, on_check_timeout)
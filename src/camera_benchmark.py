@@ -0,0 +1,431 @@
+"""Benchmark the capture and draw path of SetupPage.
+
+A synthetic frame source replaces the camera, either a generated moving
+pattern or a video file. For each resolution, a SetupPage is shown in an
+offscreen window for a while and the following is measured:
+    - capture-to-paint latency (frame read -> drawing area painted)
+    - achieved preview FPS (distinct frames painted per second)
+    - allocated bytes per painted frame (in a second pass with tracemalloc,
+      which slows everything down and is therefore measured separately)
+    - CPU use of the whole process
+
+The results are printed as JSON (or written to a file), so that changes to
+the camera code can be compared.
+
+Usage (from the installation's pkgdatadir or with the gresource bundle from
+the build directory):
+    python3 -m liegensteuerung.camera_benchmark \\
+        --resource build/src/liegensteuerung.gresource \\
+        --resolutions 640x480 1280x720 --duration 10 --output bench.json
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+
+import cv2  # type: ignore
+import numpy  # type: ignore
+
+
+DEFAULT_RESOLUTIONS: Tuple[str, ...] = (
+    "320x240",
+    "640x480",
+    "1280x720",
+    "1920x1080",
+)
+
+# The size of the touchscreen the Liegensteuerung runs on
+DEFAULT_WINDOW_SIZE: str = "800x480"
+
+DEFAULT_RESOURCE_PATH: str = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "liegensteuerung.gresource",
+)
+
+# Pre-generated frames of the synthetic pattern, looped
+PATTERN_FRAME_COUNT: int = 30
+
+
+class SyntheticCapture:
+    """A frame source with the cv2.VideoCapture interface.
+
+    Frames are either generated (a moving gradient with a moving bar, so that
+        the scene never counts as static) or read from a video file that is
+        looped. Frames are delivered at a fixed rate, like from a camera.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        fps: float,
+        video_path: Optional[str] = None,
+        static: bool = False,
+    ):
+        """Create a new SyntheticCapture.
+
+        Args:
+            width (int): The frame width in pixels
+            height (int): The frame height in pixels
+            fps (float): The rate at which frames are delivered
+            video_path (str, optional): A video file to read frames from
+                instead of generating them
+            static (bool, optional): Whether to always deliver the same
+                generated frame, i.e. simulate a static scene
+        """
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+        self.frame_index: int = 0
+        self.next_frame_time: float = time.monotonic()
+
+        self.video: Optional[cv2.VideoCapture] = None
+        self.frames: List[numpy.ndarray] = []
+
+        if video_path is not None:
+            self.video = cv2.VideoCapture(video_path)
+        else:
+            self.frames = generate_pattern(
+                width, height, 1 if static else PATTERN_FRAME_COUNT
+            )
+
+    def isOpened(self) -> bool:
+        """Return whether frames can be read.
+
+        Returns:
+            bool: Whether frames can be read
+        """
+        return self.video is None or self.video.isOpened()
+
+    def read(self) -> Tuple[bool, Optional[numpy.ndarray]]:
+        """Wait for the next frame and return it.
+
+        Returns:
+            Tuple[bool, Optional[numpy.ndarray]]: Whether a frame could be
+                read and the BGR frame
+        """
+        delay: float = self.next_frame_time - time.monotonic()
+
+        if delay > 0:
+            time.sleep(delay)
+
+        self.next_frame_time = max(
+            self.next_frame_time + 1 / self.fps, time.monotonic()
+        )
+
+        self.frame_index += 1
+
+        if self.video is None:
+            return True, self.frames[self.frame_index % len(self.frames)]
+
+        return_value, frame = self.video.read()
+
+        if not return_value:
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return_value, frame = self.video.read()
+
+        if return_value and frame.shape[:2] != (self.height, self.width):
+            frame = cv2.resize(frame, (self.width, self.height))
+
+        return return_value, frame
+
+    def release(self) -> None:
+        """Release the video file, if any."""
+        if self.video is not None:
+            self.video.release()
+
+
+def generate_pattern(
+    width: int, height: int, frame_count: int
+) -> List[numpy.ndarray]:
+    """Generate frames of a moving test pattern.
+
+    Args:
+        width (int): The frame width in pixels
+        height (int): The frame height in pixels
+        frame_count (int): How many frames to generate
+
+    Returns:
+        List[numpy.ndarray]: The BGR frames
+    """
+    x: numpy.ndarray = numpy.linspace(0, 255, width, dtype=numpy.uint8)
+    y: numpy.ndarray = numpy.linspace(0, 255, height, dtype=numpy.uint8)
+
+    base: numpy.ndarray = numpy.empty((height, width, 3), dtype=numpy.uint8)
+    base[:, :, 0] = x[numpy.newaxis, :]
+    base[:, :, 1] = y[:, numpy.newaxis]
+    base[:, :, 2] = 128
+
+    bar_width: int = max(width // 16, 1)
+
+    frames: List[numpy.ndarray] = []
+
+    for index in range(frame_count):
+        frame: numpy.ndarray = numpy.roll(
+            base, index * width // max(frame_count, 1), axis=1
+        )
+        bar_x: int = index * (width - bar_width) // max(frame_count - 1, 1)
+        frame[:, bar_x : bar_x + bar_width] = 255
+        frames.append(frame)
+
+    return frames
+
+
+def parse_size(size: str) -> Tuple[int, int]:
+    """Parse a size like "640x480".
+
+    Args:
+        size (str): The size
+
+    Returns:
+        Tuple[int, int]: Width and height
+
+    Raises:
+        argparse.ArgumentTypeError: if the size is invalid
+    """
+    try:
+        width, height = (int(value) for value in size.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{size} is not a valid size")
+
+    return width, height
+
+
+def run_pass(
+    width: int,
+    height: int,
+    arguments: argparse.Namespace,
+    trace_allocations: bool = False,
+) -> Dict[str, Any]:
+    """Show a SetupPage fed by a SyntheticCapture and measure it.
+
+    Args:
+        width (int): The frame width in pixels
+        height (int): The frame height in pixels
+        arguments (argparse.Namespace): The parsed command line arguments
+        trace_allocations (bool, optional): Whether to measure allocations
+            instead of timing
+
+    Returns:
+        Dict[str, Any]: The measured values
+    """
+    from gi.repository import GLib, Gtk  # type: ignore
+
+    from .set_up_page import SetupPage
+
+    page: SetupPage = SetupPage()
+    page.video_capture_factory = lambda: SyntheticCapture(
+        width, height, arguments.fps, arguments.video, arguments.static
+    )
+
+    latencies: List[float] = []
+    allocations: List[int] = []
+    painted_frame_numbers: List[int] = []
+
+    # Read before the page's draw handler, which may race with the capture
+    # thread replacing the frame
+    frame_info: Dict[str, Any] = {}
+
+    def before_draw(widget: Gtk.Widget, cr: Any) -> None:
+        frame_info["time"] = page.frame_time
+        frame_info["number"] = page.frame_number
+
+        if trace_allocations:
+            tracemalloc.reset_peak()
+            frame_info["traced"] = tracemalloc.get_traced_memory()[0]
+
+    def after_draw(widget: Gtk.Widget, cr: Any) -> None:
+        if page.camera_frame is None or frame_info.get("time") is None:
+            return
+
+        if painted_frame_numbers and (
+            painted_frame_numbers[-1] == frame_info["number"]
+        ):
+            return  # Redrawn by Gtk without a new frame
+
+        painted_frame_numbers.append(frame_info["number"])
+        latencies.append(time.monotonic() - frame_info["time"])
+
+        if trace_allocations:
+            allocations.append(
+                tracemalloc.get_traced_memory()[1] - frame_info["traced"]
+            )
+
+    page.camera_drawing_area.connect("draw", before_draw)
+
+    window_width, window_height = parse_size(arguments.window_size)
+    window: Gtk.OffscreenWindow = Gtk.OffscreenWindow()
+    window.set_default_size(window_width, window_height)
+    window.add(page)
+    window.show_all()
+
+    page.camera_drawing_area.connect_after("draw", after_draw)
+
+    main_loop: GLib.MainLoop = GLib.MainLoop()
+
+    # Skip the warm-up, e.g. the first cvtColor calls
+    def start_measuring() -> None:
+        latencies.clear()
+        allocations.clear()
+        painted_frame_numbers.clear()
+
+        measurement["start_time"] = time.monotonic()
+        measurement["start_cpu_time"] = time.process_time()
+
+        GLib.timeout_add(int(arguments.duration * 1000), main_loop.quit)
+
+    measurement: Dict[str, float] = {}
+
+    if trace_allocations:
+        tracemalloc.start()
+
+    page.prepare()
+    GLib.timeout_add(int(arguments.warm_up * 1000), start_measuring)
+    main_loop.run()
+
+    wall_time: float = time.monotonic() - measurement["start_time"]
+    cpu_time: float = time.process_time() - measurement["start_cpu_time"]
+
+    page.unprepare()
+
+    if trace_allocations:
+        tracemalloc.stop()
+
+    # Also stops the page's media recorder thread
+    window.destroy()
+
+    if trace_allocations:
+        return {
+            "allocated_bytes_per_frame_mean": (
+                statistics.mean(allocations) if allocations else None
+            ),
+            "allocated_bytes_per_frame_max": (
+                max(allocations) if allocations else None
+            ),
+        }
+
+    sorted_latencies: List[float] = sorted(latencies)
+
+    return {
+        "frames_painted": len(latencies),
+        "fps": len(latencies) / wall_time,
+        "latency_ms_mean": (
+            statistics.mean(latencies) * 1000 if latencies else None
+        ),
+        "latency_ms_p95": (
+            sorted_latencies[int(len(sorted_latencies) * 0.95)] * 1000
+            if latencies
+            else None
+        ),
+        "latency_ms_max": (
+            sorted_latencies[-1] * 1000 if latencies else None
+        ),
+        "cpu_percent": cpu_time / wall_time * 100,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmark.
+
+    Args:
+        argv (List[str], optional): The command line arguments. Defaults to
+            sys.argv[1:]
+
+    Returns:
+        int: A return code
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--resolutions",
+        nargs="+",
+        default=DEFAULT_RESOLUTIONS,
+        help="Frame sizes to benchmark, e.g. 640x480",
+    )
+    parser.add_argument("--fps", type=float, default=30, help="Source FPS")
+    parser.add_argument(
+        "--duration", type=float, default=10, help="Seconds per measurement"
+    )
+    parser.add_argument(
+        "--warm-up", type=float, default=1, help="Seconds before measuring"
+    )
+    parser.add_argument(
+        "--video", help="Read frames from this video file (looped)"
+    )
+    parser.add_argument(
+        "--static",
+        action="store_true",
+        help="Deliver the same frame over and over (static scene)",
+    )
+    parser.add_argument(
+        "--window-size", default=DEFAULT_WINDOW_SIZE, help="e.g. 800x480"
+    )
+    parser.add_argument(
+        "--no-allocations",
+        action="store_true",
+        help="Skip the (slow) allocation pass",
+    )
+    parser.add_argument(
+        "--resource",
+        default=DEFAULT_RESOURCE_PATH,
+        help="Path of liegensteuerung.gresource",
+    )
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+
+    arguments = parser.parse_args(argv)
+
+    import gi  # type: ignore
+
+    gi.require_version("Gtk", "3.0")
+    gi.require_version("Gdk", "3.0")
+
+    from gi.repository import Gio  # type: ignore
+
+    # The .ui templates are loaded from the resource when SetupPage is
+    # imported, so it has to be registered first
+    Gio.Resource.load(arguments.resource)._register()
+
+    results: Dict[str, Any] = {
+        "source": (
+            arguments.video or ("static" if arguments.static else "pattern")
+        ),
+        "source_fps": arguments.fps,
+        "window_size": arguments.window_size,
+        "duration": arguments.duration,
+        "opencv_version": cv2.__version__,
+        "numpy_version": numpy.__version__,
+        "resolutions": {},
+    }
+
+    for resolution in arguments.resolutions:
+        width, height = parse_size(resolution)
+
+        result: Dict[str, Any] = run_pass(width, height, arguments)
+
+        if not arguments.no_allocations:
+            result.update(
+                run_pass(width, height, arguments, trace_allocations=True)
+            )
+
+        results["resolutions"][f"{width}x{height}"] = result
+
+        print(f"{width}x{height}: {result}", file=sys.stderr)
+
+    if arguments.output is None:
+        json.dump(results, sys.stdout, indent=4)
+        print()
+    else:
+        with open(arguments.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,521 @@
+"""Utility functions that deal with opening and configuring the camera.
+
+Capture settings can be configured in ~/.liegensteuerung/camera.json. Every
+setting that is not configured there is negotiated with the camera: the
+supported modes are probed once and the best one is cached in the same file,
+so that following starts open the camera directly in that mode.
+
+The preview rate is lowered while the scene is static. The thresholds for
+that can be configured in the same file (see MotionSettings).
+
+Example camera.json:
+    {
+        "settings": {"device_index": 0, "fourcc": "MJPG", "fps": 30},
+        "motion": {"threshold": 3.0, "static_fps": 2},
+        "cached_modes": {"0": [1280, 720, 30.0, "MJPG"]}
+    }
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Tuple, Any
+
+import os
+import json
+import time
+
+import cv2  # type: ignore
+import numpy  # type: ignore
+
+
+CONFIG_PATH: str = os.path.expanduser("~/.liegensteuerung/camera.json")
+
+# Bigger frames than this are of no use for the preview, they only cost
+# USB bandwidth and CPU time for decoding and scaling
+MAX_PIXEL_COUNT: int = 1280 * 720
+
+# Frames to read when measuring the frame rate a mode actually delivers
+PROBE_FRAME_COUNT: int = 8
+
+PREFERRED_FOURCC: str = "MJPG"
+
+CANDIDATE_RESOLUTIONS: List[Tuple[int, int]] = [
+    (1280, 720),
+    (1024, 768),
+    (800, 600),
+    (640, 480),
+    (320, 240),
+]
+
+CANDIDATE_FPS: List[int] = [60, 30]
+
+CANDIDATE_FOURCCS: List[str] = [PREFERRED_FOURCC, "YUYV"]
+
+
+class CaptureMode(NamedTuple):
+    """A capture mode of a camera.
+
+    Attributes:
+        width (int): The frame width in pixels
+        height (int): The frame height in pixels
+        fps (float): The frame rate in frames per second
+        fourcc (str): The pixel format as a FOURCC code, e.g. "MJPG"
+    """
+
+    width: int
+    height: int
+    fps: float
+    fourcc: str
+
+
+class CameraSettings(NamedTuple):
+    """The capture settings configured by the user.
+
+    Every setting that is None is negotiated with the camera.
+
+    Attributes:
+        device_index (int): The index of the video device (/dev/video<index>)
+        width (int, optional): The frame width in pixels
+        height (int, optional): The frame height in pixels
+        fps (float, optional): The frame rate in frames per second
+        fourcc (str, optional): The pixel format as a FOURCC code
+        buffer_size (int): How many frames the driver may buffer. 1 keeps
+            the latency as low as possible
+    """
+
+    device_index: int = 0
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    fourcc: Optional[str] = None
+    buffer_size: int = 1
+
+
+class MotionSettings(NamedTuple):
+    """The thresholds that decide when the preview rate is lowered.
+
+    Attributes:
+        threshold (float): The mean absolute difference (in gray levels,
+            0-255) between two frames above which the scene counts as moving
+        static_delay (float): How many seconds the scene has to be static
+            before the preview rate is lowered
+        static_fps (float): The preview rate while the scene is static
+        downsample (int): Only every n-th pixel in each direction is compared
+    """
+
+    threshold: float = 2.5
+    static_delay: float = 2.0
+    static_fps: float = 4.0
+    downsample: int = 8
+
+
+class MotionDetector:
+    """Decide whether a scene is static from a stream of frames.
+
+    The metric is computed on a downsampled single channel of the frames, so
+        it is cheap enough to run on every captured frame.
+
+    Attributes:
+        settings (MotionSettings): The thresholds in use
+        metric (float): The difference between the last two frames
+        static (bool): Whether the scene has been static for at least
+            settings.static_delay seconds
+    """
+
+    settings: MotionSettings
+    metric: float
+    static: bool
+
+    def __init__(self, settings: Optional[MotionSettings] = None):
+        """Create a new MotionDetector.
+
+        Args:
+            settings (MotionSettings, optional): The thresholds to use.
+                Defaults to the settings loaded from CONFIG_PATH
+        """
+        self.settings = (
+            settings if settings is not None else load_motion_settings()
+        )
+        self.metric = 0.0
+        self.static = False
+
+        self._previous_sample: Optional[numpy.ndarray] = None
+        self._last_motion_time: float = time.monotonic()
+
+    def update(self, frame: numpy.ndarray) -> bool:
+        """Feed a new frame to the detector.
+
+        Args:
+            frame (numpy.ndarray): The new frame as returned by
+                cv2.VideoCapture.read()
+
+        Returns:
+            bool: Whether the scene is static
+        """
+        step: int = max(self.settings.downsample, 1)
+
+        # The green channel carries most of the luminance
+        sample: numpy.ndarray = frame[::step, ::step, 1].astype(numpy.int16)
+
+        now: float = time.monotonic()
+
+        if (
+            self._previous_sample is None
+            or self._previous_sample.shape != sample.shape
+        ):
+            self.metric = float("inf")
+        else:
+            self.metric = float(
+                numpy.abs(sample - self._previous_sample).mean()
+            )
+
+        self._previous_sample = sample
+
+        if self.metric > self.settings.threshold:
+            self._last_motion_time = now
+
+        self.static = (
+            now - self._last_motion_time >= self.settings.static_delay
+        )
+
+        return self.static
+
+
+def load_config() -> Dict[str, Any]:
+    """Load the camera config file.
+
+    Returns:
+        Dict[str, Any]: The config or an empty dict if there is none
+    """
+    try:
+        with open(CONFIG_PATH) as config_file:
+            config: Dict[str, Any] = json.load(config_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+    return config if isinstance(config, dict) else {}
+
+
+def save_config(config: Dict[str, Any]) -> None:
+    """Save the camera config file.
+
+    Args:
+        config (Dict[str, Any]): The config to save
+    """
+    os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
+
+    with open(CONFIG_PATH, "w") as config_file:
+        json.dump(config, config_file, indent=4)
+
+
+def load_settings() -> CameraSettings:
+    """Load the capture settings configured by the user.
+
+    Returns:
+        CameraSettings: The configured settings. Unknown keys are ignored.
+    """
+    settings: Dict[str, Any] = load_config().get("settings", {})
+
+    return CameraSettings(
+        **{
+            key: value
+            for key, value in settings.items()
+            if key in CameraSettings._fields
+        }
+    )
+
+
+def load_motion_settings() -> MotionSettings:
+    """Load the motion thresholds configured by the user.
+
+    Returns:
+        MotionSettings: The configured thresholds. Unknown keys are ignored.
+    """
+    settings: Dict[str, Any] = load_config().get("motion", {})
+
+    return MotionSettings(
+        **{
+            key: value
+            for key, value in settings.items()
+            if key in MotionSettings._fields
+        }
+    )
+
+
+def fourcc_to_str(fourcc: float) -> str:
+    """Convert a FOURCC code as returned by cv2.CAP_PROP_FOURCC to a string.
+
+    Args:
+        fourcc (float): The FOURCC code
+
+    Returns:
+        str: The FOURCC code as a four character string, e.g. "MJPG"
+    """
+    code: int = int(fourcc)
+
+    return "".join([chr((code >> 8 * shift) & 0xFF) for shift in range(4)])
+
+
+def get_mode(video_capture: cv2.VideoCapture) -> CaptureMode:
+    """Get the mode a cv2.VideoCapture is currently set to.
+
+    Args:
+        video_capture (cv2.VideoCapture): An opened cv2.VideoCapture
+
+    Returns:
+        CaptureMode: The active mode as reported by the driver
+    """
+    return CaptureMode(
+        int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        float(video_capture.get(cv2.CAP_PROP_FPS)),
+        fourcc_to_str(video_capture.get(cv2.CAP_PROP_FOURCC)),
+    )
+
+
+def set_mode(video_capture: cv2.VideoCapture, mode: CaptureMode) -> None:
+    """Request a mode from a cv2.VideoCapture.
+
+    The FOURCC code has to be set before the resolution, otherwise some V4L2
+        drivers ignore it.
+
+    Args:
+        video_capture (cv2.VideoCapture): An opened cv2.VideoCapture
+        mode (CaptureMode): The mode to request
+    """
+    video_capture.set(
+        cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*mode.fourcc)
+    )
+    video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, mode.width)
+    video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, mode.height)
+    video_capture.set(cv2.CAP_PROP_FPS, mode.fps)
+
+
+def measure_fps(video_capture: cv2.VideoCapture) -> float:
+    """Measure the frame rate a cv2.VideoCapture actually delivers.
+
+    Args:
+        video_capture (cv2.VideoCapture): An opened cv2.VideoCapture
+
+    Returns:
+        float: The measured frame rate or 0 if no frames could be read
+    """
+    # The first frame after a mode change often takes much longer
+    if not video_capture.grab():
+        return 0.0
+
+    start_time: float = time.monotonic()
+
+    for _ in range(PROBE_FRAME_COUNT):
+        if not video_capture.grab():
+            return 0.0
+
+    return PROBE_FRAME_COUNT / max(time.monotonic() - start_time, 1e-6)
+
+
+def mode_score(mode: CaptureMode) -> Tuple[float, int, bool]:
+    """Return a sort key that rates how well a mode is suited for the preview.
+
+    Frame rate is most important, then resolution (up to MAX_PIXEL_COUNT),
+        then whether the mode uses the compressed PREFERRED_FOURCC format.
+
+    Args:
+        mode (CaptureMode): The mode to rate
+
+    Returns:
+        Tuple[float, int, bool]: A key by which modes can be sorted (higher
+            is better)
+    """
+    return (
+        # Round so that measurement jitter doesn't override resolution
+        round(mode.fps / 5) * 5,
+        min(mode.width * mode.height, MAX_PIXEL_COUNT),
+        mode.fourcc == PREFERRED_FOURCC,
+    )
+
+
+def probe_modes(
+    video_capture: cv2.VideoCapture, settings: CameraSettings
+) -> List[CaptureMode]:
+    """Find out which candidate modes a camera supports.
+
+    Candidates are built from the CANDIDATE_* lists, but every value that is
+        configured in settings is used instead of the candidates.
+
+    Args:
+        video_capture (cv2.VideoCapture): An opened cv2.VideoCapture
+        settings (CameraSettings): The configured settings
+
+    Returns:
+        List[CaptureMode]: The supported modes with their measured frame
+            rates, best mode first
+    """
+    resolutions: List[Tuple[int, int]] = (
+        [(settings.width, settings.height)]
+        if settings.width is not None and settings.height is not None
+        else CANDIDATE_RESOLUTIONS
+    )
+    fps_values: List[float] = (
+        [settings.fps] if settings.fps is not None else CANDIDATE_FPS
+    )
+    fourccs: List[str] = (
+        [settings.fourcc] if settings.fourcc is not None else CANDIDATE_FOURCCS
+    )
+
+    supported_modes: Dict[CaptureMode, CaptureMode] = {}
+
+    for fourcc in fourccs:
+        for width, height in resolutions:
+            for fps in fps_values:
+                set_mode(
+                    video_capture, CaptureMode(width, height, fps, fourcc)
+                )
+
+                active_mode: CaptureMode = get_mode(video_capture)
+
+                # The driver silently falls back to the nearest mode it
+                # supports, so only keep modes that were actually applied
+                if (
+                    active_mode.fourcc != fourcc
+                    or (active_mode.width, active_mode.height)
+                    != (width, height)
+                    or active_mode in supported_modes
+                ):
+                    continue
+
+                measured_fps: float = measure_fps(video_capture)
+
+                if measured_fps > 0:
+                    supported_modes[active_mode] = active_mode._replace(
+                        fps=min(measured_fps, active_mode.fps or measured_fps)
+                    )
+
+    return sorted(supported_modes.values(), key=mode_score, reverse=True)
+
+
+def get_cached_mode(device_index: int) -> Optional[CaptureMode]:
+    """Get the cached best mode for a device.
+
+    Args:
+        device_index (int): The index of the video device
+
+    Returns:
+        Optional[CaptureMode]: The cached mode or None if none was cached
+    """
+    cached_mode: Optional[List[Any]] = (
+        load_config().get("cached_modes", {}).get(str(device_index))
+    )
+
+    if cached_mode is None:
+        return None
+
+    try:
+        width, height, fps, fourcc = cached_mode
+        return CaptureMode(int(width), int(height), float(fps), str(fourcc))
+    except (TypeError, ValueError):
+        return None
+
+
+def mode_matches_settings(mode: CaptureMode, settings: CameraSettings) -> bool:
+    """Return whether a mode complies with all configured settings.
+
+    Args:
+        mode (CaptureMode): The mode to check
+        settings (CameraSettings): The configured settings
+
+    Returns:
+        bool: False if any configured setting differs from the mode
+    """
+    return all(
+        getattr(settings, field) in (None, getattr(mode, field))
+        for field in ("width", "height", "fourcc")
+    ) and (settings.fps is None or mode.fps <= settings.fps)
+
+
+def cache_mode(device_index: int, mode: CaptureMode) -> None:
+    """Cache the best mode for a device.
+
+    Args:
+        device_index (int): The index of the video device
+        mode (CaptureMode): The mode to cache
+    """
+    config: Dict[str, Any] = load_config()
+
+    config.setdefault("cached_modes", {})[str(device_index)] = list(mode)
+
+    save_config(config)
+
+
+def clear_cached_mode(device_index: int) -> None:
+    """Forget the cached mode for a device, e.g. after swapping the camera.
+
+    Args:
+        device_index (int): The index of the video device
+    """
+    config: Dict[str, Any] = load_config()
+
+    if config.get("cached_modes", {}).pop(str(device_index), None) is not None:
+        save_config(config)
+
+
+def open_capture(
+    settings: Optional[CameraSettings] = None,
+) -> cv2.VideoCapture:
+    """Open the camera in the best mode it supports.
+
+    If no mode is cached for the device, the supported modes are probed and
+        the best one is cached.
+
+    Args:
+        settings (CameraSettings, optional): The settings to use. Defaults to
+            the settings loaded from CONFIG_PATH
+
+    Returns:
+        cv2.VideoCapture: The opened cv2.VideoCapture. Check isOpened() to
+            find out whether a camera was found.
+    """
+    if settings is None:
+        settings = load_settings()
+
+    video_capture: cv2.VideoCapture = cv2.VideoCapture(settings.device_index)
+
+    if not video_capture.isOpened():
+        return video_capture
+
+    # Without this, read() returns stale frames from the driver's queue
+    video_capture.set(cv2.CAP_PROP_BUFFERSIZE, settings.buffer_size)
+
+    mode: Optional[CaptureMode] = get_cached_mode(settings.device_index)
+
+    if mode is not None and not mode_matches_settings(mode, settings):
+        # The settings were changed since the mode was cached
+        mode = None
+
+    if mode is None:
+        supported_modes: List[CaptureMode] = probe_modes(
+            video_capture, settings
+        )
+
+        if supported_modes:
+            mode = supported_modes[0]
+            cache_mode(settings.device_index, mode)
+
+    if mode is not None:
+        set_mode(video_capture, mode)
+
+        if get_mode(video_capture)[:2] != mode[:2]:
+            # The camera was swapped for one that doesn't support the mode
+            clear_cached_mode(settings.device_index)
+
+    return video_capture
+
+
+if __name__ == "__main__":
+    capture_settings: CameraSettings = load_settings()
+    capture: cv2.VideoCapture = cv2.VideoCapture(capture_settings.device_index)
+
+    if capture.isOpened():
+        for supported_mode in probe_modes(capture, capture_settings):
+            print(supported_mode)
+    else:
+        print("No cam found.")
+
+    capture.release()
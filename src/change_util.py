@@ -0,0 +1,44 @@
+"""Tell pages what changed in the database.
+
+The util modules emit a signal on the ChangeHub `changes` after every change
+they make, so pages can apply that change to their models instead of
+re-querying everything whenever they are shown again.
+
+Signals (the handler's first argument is the hub):
+    patient-added, patient-modified, patient-deleted (patient_util.Patient)
+    program-added, program-modified, program-deleted (program_util.Program)
+    treatment-recorded (patient_util.Patient, int): The patient and the
+        timestamp of the new or changed treatment entry
+    user-added, user-modified, user-deleted (str): The user's username
+    database-error (Exception): A background database job without error
+        callback failed, e.g. a write (see database_util.report_error())
+"""
+
+from gi.repository import GObject  # type: ignore
+
+
+class ChangeHub(GObject.Object):
+    """A GObject that emits a signal for every change to the database."""
+
+    __gtype_name__ = "ChangeHub"
+
+    __gsignals__ = {
+        "patient-added": (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+        "patient-modified": (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+        "patient-deleted": (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+        "program-added": (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+        "program-modified": (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+        "program-deleted": (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+        "treatment-recorded": (
+            GObject.SignalFlags.RUN_FIRST,
+            None,
+            (object, int),
+        ),
+        "user-added": (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+        "user-modified": (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+        "user-deleted": (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+        "database-error": (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+    }
+
+
+changes: ChangeHub = ChangeHub()
@@ -0,0 +1,1064 @@
+"""Utility functions that deal with the sqlite database connection.
+
+All util modules share one connection to DATABASE_PATH. It is opened on first
+use and tuned for many small writes on an SD card: the write-ahead log makes
+commits append to one file instead of writing and fsyncing a rollback journal
+each time, and readers don't block the writer.
+
+The schema is versioned with PRAGMA user_version. When the connection is
+opened, all MIGRATIONS that haven't been applied yet are applied in order,
+each in its own transaction, so existing databases are upgraded in place. To
+change the schema, append a new migration. Never change an existing one.
+
+Frequent small writes (pain entries, treatment updates, autosaves) don't
+have to be done by the main thread: write() hands them to a DatabaseWorker,
+which executes them with its own connection and commits them in groups.
+Pages query with read() on the same worker, so they see those writes right
+away and the main thread never waits for the disk. Failed jobs are reported
+to their error callback or, if they have none, as "database-error" on the
+ChangeHub.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from concurrent.futures import Future
+from threading import Thread
+import os
+import queue
+import time
+
+import sqlite3
+import atexit
+
+from gi.repository import GLib  # type: ignore
+
+try:
+    from .change_util import changes
+except ImportError:
+    from change_util import changes
+
+
+DATABASE_DIRECTORY: str = os.path.expanduser("~/.liegensteuerung")
+DATABASE_NAME: str = "liegensteuerung.db"
+DATABASE_PATH: str = os.path.join(DATABASE_DIRECTORY, DATABASE_NAME)
+
+# Python 3.6 or higher is needed to retain dict order
+PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "WAL",
+    # With WAL, NORMAL only syncs at checkpoints and can't corrupt the
+    # database, the last commits may be lost on power loss though
+    "synchronous": "NORMAL",
+    "mmap_size": 64 * 1024 * 1024,  # bytes
+    "cache_size": -16 * 1024,  # negative: KiB instead of pages
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+# How many prepared statements each connection keeps
+CACHED_STATEMENTS: int = 256
+
+# How long (in seconds) a write may wait for more writes to be committed with
+COMMIT_DELAY: float = 0.2
+
+# The future, callback, error callback and result of a write job that isn't
+# committed yet
+WrittenJob = Tuple[
+    Future,
+    Optional[Callable[[Any], None]],
+    Optional[Callable[[Exception], None]],
+    Any,
+]
+
+connection: Optional[sqlite3.Connection] = None
+worker: Optional["DatabaseWorker"] = None
+
+# What get_foreign_change_count() saw when it was last called
+seen_data_version: Optional[int] = None
+seen_commit_count: int = 0
+foreign_change_count: int = 0
+
+# Used by fold_sql() and fold_text(). Changing it requires rebuilding the
+# table 'patients_search' and its triggers in a new migration
+SEARCH_FOLDING: Dict[str, str] = {
+    "ä": "ae",
+    "ö": "oe",
+    "ü": "ue",
+    "Ä": "Ae",
+    "Ö": "Oe",
+    "Ü": "Ue",
+    "ß": "ss",
+}
+
+# The column names of the table 'programs' before migration 2
+BASELINE_PROGRAM_COLUMNS: Tuple[str, ...] = (
+    "pusher_left_distance_up",
+    "pusher_left_distance_down",
+    "pusher_right_distance_up",
+    "pusher_right_distance_down",
+    "pusher_left_speed_up",
+    "pusher_left_speed_down",
+    "pusher_right_speed_up",
+    "pusher_right_speed_down",
+    "pusher_left_delay_up",
+    "pusher_left_delay_down",
+    "pusher_right_delay_up",
+    "pusher_right_delay_down",
+    "pusher_left_stay_duration_up",
+    "pusher_left_stay_duration_down",
+    "pusher_right_stay_duration_up",
+    "pusher_right_stay_duration_down",
+    "pusher_left_push_count_up",
+    "pusher_left_push_count_down",
+    "pusher_right_push_count_up",
+    "pusher_right_push_count_down",
+    "pusher_left_distance_correction_up",
+    "pusher_left_distance_correction_down",
+    "pusher_right_distance_correction_up",
+    "pusher_right_distance_correction_down",
+    "angle_change_up",
+    "angle_change_down",
+    "push_distance_up",
+    "push_distance_down",
+    "push_count_up",
+    "push_count_down",
+    "pass_count_up",
+    "pass_count_down",
+)
+
+
+def connect(path: str = DATABASE_PATH) -> sqlite3.Connection:
+    """Open a new tuned connection to the database.
+
+    Most code should use the shared connection from get_connection() instead.
+    Connections can only be used in the thread that opened them. They don't
+    migrate the database, so the shared connection must have been opened
+    first.
+
+    Args:
+        path (str, optional): The database file. Defaults to DATABASE_PATH
+
+    Returns:
+        sqlite3.Connection: The new connection
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    new_connection: sqlite3.Connection = sqlite3.connect(
+        path, cached_statements=CACHED_STATEMENTS
+    )
+
+    for pragma, value in PRAGMAS.items():
+        new_connection.execute(f"PRAGMA {pragma} = {value}")
+
+    return new_connection
+
+
+def get_connection() -> sqlite3.Connection:
+    """Get the shared connection and open it if necessary.
+
+    Returns:
+        sqlite3.Connection: The shared connection
+    """
+    global connection
+
+    if connection is None:
+        connection = connect()
+
+        migrate(connection)
+
+    return connection
+
+
+def get_schema_version(migrated_connection: sqlite3.Connection) -> int:
+    """Get the schema version of a database.
+
+    Args:
+        migrated_connection (sqlite3.Connection): A connection to the database
+
+    Returns:
+        int: How many MIGRATIONS have been applied to the database
+    """
+    return migrated_connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(unmigrated_connection: sqlite3.Connection) -> None:
+    """Apply all migrations that haven't been applied to a database yet.
+
+    Foreign keys are not enforced during migrations, because tables that are
+        referenced have to be dropped and recreated.
+
+    Args:
+        unmigrated_connection (sqlite3.Connection): A connection to the
+            database
+
+    Raises:
+        ValueError: if the database is newer than this program
+    """
+    version: int = get_schema_version(unmigrated_connection)
+
+    if version > len(MIGRATIONS):
+        raise ValueError(
+            f"The database has schema version {version}, "
+            f"but this program only knows up to {len(MIGRATIONS)}"
+        )
+
+    if version == len(MIGRATIONS):
+        return
+
+    unmigrated_connection.commit()
+    unmigrated_connection.execute("PRAGMA foreign_keys = OFF")
+
+    try:
+        for new_version in range(version + 1, len(MIGRATIONS) + 1):
+            unmigrated_connection.execute("BEGIN")
+
+            try:
+                MIGRATIONS[new_version - 1](unmigrated_connection)
+
+                violation: Optional[Tuple[Any, ...]] = (
+                    unmigrated_connection.execute(
+                        "PRAGMA foreign_key_check"
+                    ).fetchone()
+                )
+                if violation is not None:
+                    raise ValueError(
+                        f"Migration {new_version} violates a foreign key: "
+                        f"{violation}"
+                    )
+
+                # PRAGMA doesn't support parameters
+                unmigrated_connection.execute(
+                    f"PRAGMA user_version = {int(new_version)}"
+                )
+            except BaseException:
+                unmigrated_connection.rollback()
+                raise
+
+            unmigrated_connection.commit()
+    finally:
+        unmigrated_connection.execute(
+            f"PRAGMA foreign_keys = {PRAGMAS['foreign_keys']}"
+        )
+
+
+def get_column_definitions(
+    migrated_connection: sqlite3.Connection, table: str
+) -> Dict[str, str]:
+    """Get the names and declared types of a table's columns.
+
+    Args:
+        migrated_connection (sqlite3.Connection): A connection to the database
+        table (str): The table's name
+
+    Returns:
+        Dict[str, str]: The declared type of each column, by column name
+    """
+    return {
+        column_info[1]: column_info[2]
+        for column_info in migrated_connection.execute(
+            f"PRAGMA table_info({table})"
+        )
+    }
+
+
+def rebuild_table(
+    migrated_connection: sqlite3.Connection,
+    table: str,
+    column_definitions: Dict[str, str],
+    key_column: Optional[str] = None,
+) -> None:
+    """Recreate a table with new column definitions and copy all rows.
+
+    SQLite can't add keys or constraints to existing tables, this is the
+        documented way around that. Columns that are not in
+        column_definitions keep their declared type.
+
+    Args:
+        migrated_connection (sqlite3.Connection): A connection to the database
+            with an open transaction
+        table (str): The table's name
+        column_definitions (Dict[str, str]): New definitions (type and
+            constraints) by column name
+        key_column (str, optional): A column that becomes unique. Rows that
+            have the same value as a previous row get a new value (only works
+            for INTEGER PRIMARY KEY columns)
+    """
+    old_definitions: Dict[str, str] = get_column_definitions(
+        migrated_connection, table
+    )
+
+    columns: List[str] = list(old_definitions)
+    other_columns: List[str] = [
+        column for column in columns if column != key_column
+    ]
+
+    migrated_connection.execute(
+        f"CREATE TABLE {table}_new ("
+        + ", ".join(
+            [
+                column
+                + " "
+                + column_definitions.get(column, old_definitions[column])
+                for column in columns
+            ]
+        )
+        + ")"
+    )
+
+    if key_column is None:
+        migrated_connection.execute(
+            f"INSERT INTO {table}_new ({', '.join(columns)}) "
+            f"SELECT {', '.join(columns)} FROM {table}"
+        )
+    else:
+        migrated_connection.execute(
+            f"INSERT INTO {table}_new ({', '.join(columns)}) "
+            f"SELECT {', '.join(columns)} FROM {table} "
+            f"WHERE rowid IN "
+            f"(SELECT MIN(rowid) FROM {table} GROUP BY {key_column})"
+        )
+        # Duplicates (only possible through the old MAX(id)+1 race) are kept
+        # with new ids instead of being dropped
+        migrated_connection.execute(
+            f"INSERT INTO {table}_new ({', '.join(other_columns)}) "
+            f"SELECT {', '.join(other_columns)} FROM {table} "
+            f"WHERE rowid NOT IN "
+            f"(SELECT MIN(rowid) FROM {table} GROUP BY {key_column})"
+        )
+
+    migrated_connection.execute(f"DROP TABLE {table}")
+    migrated_connection.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+
+def migration_1_baseline(migrated_connection: sqlite3.Connection) -> None:
+    """Create the tables as they were before migrations were introduced.
+
+    Args:
+        migrated_connection (sqlite3.Connection): A connection to the database
+            with an open transaction
+    """
+    migrated_connection.execute(
+        """CREATE TABLE IF NOT EXISTS users
+             (username TEXT, password_hash TEXT, salt TEXT, access_level INT)"""
+    )
+    migrated_connection.execute(
+        """CREATE TABLE IF NOT EXISTS patients
+             (
+                id UNSIGNED BIG INT, first_name TEXT, last_name TEXT,
+                birthday TEXT, gender TEXT, weight DOUBLE, comment TEXT
+            )
+        """
+    )
+    migrated_connection.execute(
+        """CREATE TABLE IF NOT EXISTS treatment_entries
+            (
+                patient_id UNSIGNED BIG INT,
+                program_id UNSIGNED BIG INT,
+                timestamp UNSIGNED BIG INT,
+                username TEXT,
+                pain_intensity INT,
+                pain_location TEXT,
+                media_path TEXT
+            )
+        """
+    )
+    migrated_connection.execute(
+        "CREATE TABLE IF NOT EXISTS programs (id UNSIGNED BIG INT, "
+        + ", ".join([column + " INT" for column in BASELINE_PROGRAM_COLUMNS])
+        + ")"
+    )
+
+    # Databases created before media files were linked lack this column
+    if "media_path" not in get_column_definitions(
+        migrated_connection, "treatment_entries"
+    ):
+        migrated_connection.execute(
+            "ALTER TABLE treatment_entries ADD COLUMN media_path TEXT"
+        )
+
+
+def migration_2_keys(migrated_connection: sqlite3.Connection) -> None:
+    """Add primary keys, foreign keys and indexes.
+
+    patients.id and programs.id become INTEGER PRIMARY KEYs, so SQLite
+        assigns them. Treatment entries are deleted with their patient and
+        lose their program when it is deleted. Treatment entries of patients
+        that were deleted before are removed.
+
+    Args:
+        migrated_connection (sqlite3.Connection): A connection to the database
+            with an open transaction
+    """
+    rebuild_table(
+        migrated_connection,
+        "patients",
+        {"id": "INTEGER PRIMARY KEY"},
+        key_column="id",
+    )
+    rebuild_table(
+        migrated_connection,
+        "programs",
+        {"id": "INTEGER PRIMARY KEY"},
+        key_column="id",
+    )
+
+    migrated_connection.execute(
+        """
+            DELETE FROM treatment_entries
+            WHERE patient_id NOT IN (SELECT id FROM patients)
+        """
+    )
+    migrated_connection.execute(
+        """
+            UPDATE treatment_entries
+            SET program_id = NULL
+            WHERE program_id NOT IN (SELECT id FROM programs)
+        """
+    )
+    rebuild_table(
+        migrated_connection,
+        "treatment_entries",
+        {
+            "patient_id": (
+                "INTEGER NOT NULL "
+                "REFERENCES patients (id) ON DELETE CASCADE"
+            ),
+            "program_id": (
+                "INTEGER REFERENCES programs (id) ON DELETE SET NULL"
+            ),
+            "timestamp": "INTEGER",
+        },
+    )
+    migrated_connection.execute(
+        """
+            CREATE INDEX treatment_entries_patient_timestamp
+            ON treatment_entries (patient_id, timestamp)
+        """
+    )
+    # Needed so that deleting a program doesn't scan all treatment entries
+    migrated_connection.execute(
+        """
+            CREATE INDEX treatment_entries_program
+            ON treatment_entries (program_id)
+        """
+    )
+
+    # new_user() never allowed duplicates, but nothing enforced it
+    migrated_connection.execute(
+        """
+            DELETE FROM users
+            WHERE rowid NOT IN (SELECT MIN(rowid) FROM users GROUP BY username)
+        """
+    )
+    migrated_connection.execute(
+        "CREATE UNIQUE INDEX users_username ON users (username)"
+    )
+
+
+def migration_3_sort_indexes(migrated_connection: sqlite3.Connection) -> None:
+    """Add an index for every column the patient list can be sorted by.
+
+    The indexes match patient_util.SORT_EXPRESSIONS. The id doesn't need
+        to be included, SQLite appends the rowid to every index entry.
+
+    Args:
+        migrated_connection (sqlite3.Connection): A connection to the database
+            with an open transaction
+    """
+    for name, expression in (
+        ("last_name", "last_name COLLATE NOCASE"),
+        ("first_name", "first_name COLLATE NOCASE"),
+        ("gender", "gender"),
+        ("birthday", "birthday"),
+    ):
+        migrated_connection.execute(
+            f"CREATE INDEX patients_{name} ON patients ({expression})"
+        )
+
+
+def fold_sql(expression: str) -> str:
+    """Wrap an SQL expression so that it is folded like fold_text().
+
+    Args:
+        expression (str): The SQL expression to fold
+
+    Returns:
+        str: The folded SQL expression
+    """
+    for character, replacement in SEARCH_FOLDING.items():
+        expression = f"replace({expression}, '{character}', '{replacement}')"
+
+    return expression
+
+
+def fold_text(text: str) -> str:
+    """Spell out German umlauts and ß, so that Müller also matches Mueller.
+
+    Args:
+        text (str): The text to fold
+
+    Returns:
+        str: The folded text
+    """
+    for character, replacement in SEARCH_FOLDING.items():
+        text = text.replace(character, replacement)
+
+    return text
+
+
+def migration_4_patient_search(
+    migrated_connection: sqlite3.Connection,
+) -> None:
+    """Add the full-text index 'patients_search' and keep it up to date.
+
+    Names are indexed as they are and folded with fold_sql(), the tokenizer
+        removes all other diacritics and ignores case. So Müller matches
+        müller, Muller and Mueller. The prefix indexes make searching for
+        partial words (search as you type) fast.
+
+    Args:
+        migrated_connection (sqlite3.Connection): A connection to the database
+            with an open transaction
+    """
+
+    def names(row: str) -> str:
+        return (
+            f"{row}.first_name || ' ' || {row}.last_name || ' ' || "
+            + fold_sql(f"({row}.first_name || ' ' || {row}.last_name)")
+        )
+
+    migrated_connection.execute(
+        """
+            CREATE VIRTUAL TABLE patients_search USING fts5 (
+                names,
+                id,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '1 2 3'
+            )
+        """
+    )
+    migrated_connection.execute(
+        f"""
+            INSERT INTO patients_search (rowid, names, id)
+            SELECT id, {names("patients")}, id FROM patients
+        """
+    )
+
+    migrated_connection.execute(
+        f"""
+            CREATE TRIGGER patients_search_insert AFTER INSERT ON patients
+            BEGIN
+                INSERT INTO patients_search (rowid, names, id)
+                VALUES (new.id, {names("new")}, new.id);
+            END
+        """
+    )
+    migrated_connection.execute(
+        """
+            CREATE TRIGGER patients_search_delete AFTER DELETE ON patients
+            BEGIN
+                DELETE FROM patients_search WHERE rowid = old.id;
+            END
+        """
+    )
+    migrated_connection.execute(
+        f"""
+            CREATE TRIGGER patients_search_update
+            AFTER UPDATE OF id, first_name, last_name ON patients
+            BEGIN
+                DELETE FROM patients_search WHERE rowid = old.id;
+                INSERT INTO patients_search (rowid, names, id)
+                VALUES (new.id, {names("new")}, new.id);
+            END
+        """
+    )
+
+
+def migration_5_program_fit(migrated_connection: sqlite3.Connection) -> None:
+    """Add the calculated program columns as generated columns and index them.
+
+    The columns are VIRTUAL (computed when read), ALTER TABLE can't add
+        STORED ones. The index stores them, so Program.get_fitting() is a
+        range search on the index. Note that PRAGMA table_info() doesn't list
+        generated columns, so rebuild_table() drops them.
+
+    Args:
+        migrated_connection (sqlite3.Connection): A connection to the database
+            with an open transaction
+    """
+    for column, expression in (
+        (
+            "pusher_left_distance_max",
+            "max(pusher_left_distance_up, pusher_left_distance_down)",
+        ),
+        (
+            "pusher_right_distance_max",
+            "max(pusher_right_distance_up, pusher_right_distance_down)",
+        ),
+        ("push_count_sum", "push_count_up + push_count_down"),
+        ("pass_count_sum", "pass_count_up + pass_count_down"),
+    ):
+        migrated_connection.execute(
+            f"""
+                ALTER TABLE programs ADD COLUMN {column} INT
+                GENERATED ALWAYS AS ({expression}) VIRTUAL
+            """
+        )
+
+    migrated_connection.execute(
+        """
+            CREATE INDEX programs_fit
+            ON programs (pusher_left_distance_max, pusher_right_distance_max)
+        """
+    )
+
+
+# MIGRATIONS[n] migrates from schema version n to n + 1
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    migration_1_baseline,
+    migration_2_keys,
+    migration_3_sort_indexes,
+    migration_4_patient_search,
+    migration_5_program_fit,
+]
+
+
+class DatabaseWorker:
+    """A thread that executes database jobs with its own connection.
+
+    Jobs are executed one after the other in the order they were submitted.
+        Write jobs are not committed one by one: the first write starts a
+        transaction, which is committed COMMIT_DELAY seconds later with all
+        writes submitted in the meantime, so a burst of writes costs one
+        fsync. Every write job runs in its own savepoint, so a failing job
+        doesn't undo the others.
+
+    Results are passed to callbacks in the main thread (with GLib.idle_add())
+        and set on futures. The future of a write job is done once the write
+        is committed. Errors are passed to error callbacks in the main thread
+        the same way, jobs without error callback report them with
+        report_error().
+    """
+
+    def __init__(
+        self, path: str = DATABASE_PATH, commit_delay: float = COMMIT_DELAY
+    ):
+        """Create a new DatabaseWorker and start its thread.
+
+        Args:
+            path (str, optional): The database file. Defaults to
+                DATABASE_PATH
+            commit_delay (float, optional): How long (in seconds) a write may
+                wait to be committed. Defaults to COMMIT_DELAY
+        """
+        self.path = path
+        self.commit_delay = commit_delay
+
+        # How many transactions the worker committed, see
+        # get_foreign_change_count()
+        self.commit_count: int = 0
+
+        self._jobs: "queue.Queue[Optional[Tuple[Any, ...]]]" = queue.Queue()
+
+        self._thread: Thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        function: Callable[[sqlite3.Connection], Any],
+        callback: Optional[Callable[[Any], None]] = None,
+        write: bool = False,
+        error_callback: Optional[Callable[[Exception], None]] = None,
+    ) -> Future:
+        """Submit a job.
+
+        Args:
+            function (Callable[[sqlite3.Connection], Any]): The job. Called in
+                the worker's thread with the worker's connection, must not
+                commit
+            callback (Callable[[Any], None], optional): Called in the main
+                thread with the job's result
+            write (bool, optional): Whether the job writes to the database.
+                Defaults to False
+            error_callback (Callable[[Exception], None], optional): Called in
+                the main thread with the error if the job (or for a write job,
+                its commit) fails. Defaults to report_error()
+
+        Returns:
+            Future: The job's result
+        """
+        future: Future = Future()
+
+        self._jobs.put((function, callback, error_callback, write, future))
+
+        return future
+
+    def write(
+        self,
+        sql: str,
+        parameters: Iterable[Any] = (),
+        callback: Optional[Callable[[int], None]] = None,
+        error_callback: Optional[Callable[[Exception], None]] = None,
+    ) -> Future:
+        """Submit an SQL statement that writes to the database.
+
+        Args:
+            sql (str): The SQL statement
+            parameters (Iterable[Any], optional): The statement's parameters
+            callback (Callable[[int], None], optional): Called in the main
+                thread with the rowid of the last inserted row once the
+                statement is committed
+            error_callback (Callable[[Exception], None], optional): Called in
+                the main thread with the error if the statement or its commit
+                fails. Defaults to report_error()
+
+        Returns:
+            Future: The rowid of the last inserted row
+        """
+        return self.submit(
+            lambda worker_connection: worker_connection.execute(
+                sql, parameters
+            ).lastrowid,
+            callback,
+            write=True,
+            error_callback=error_callback,
+        )
+
+    def sync(self) -> None:
+        """Commit all submitted writes now and wait until they are."""
+        future: Future = Future()
+
+        # A job without a function commits
+        self._jobs.put((None, None, None, False, future))
+
+        future.result()
+
+    def close(self) -> None:
+        """Commit all submitted writes and stop the thread."""
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        """Execute jobs until close() is called."""
+        worker_connection: sqlite3.Connection = connect(self.path)
+
+        # Futures and callbacks of write jobs that aren't committed yet
+        written: List[WrittenJob] = []
+        commit_time: Optional[float] = None
+
+        while True:
+            try:
+                job: Optional[Tuple[Any, ...]] = self._jobs.get(
+                    timeout=(
+                        None
+                        if commit_time is None
+                        else max(0, commit_time - time.monotonic())
+                    )
+                )
+            except queue.Empty:
+                job = (None, None, None, False, None)  # Time to commit
+
+            if job is None:
+                self._commit(worker_connection, written)
+                break
+
+            function, callback, error_callback, write, future = job
+
+            if function is None:
+                self._commit(worker_connection, written)
+                written = []
+                commit_time = None
+
+                if future is not None:
+                    future.set_result(None)
+
+                continue
+
+            if write and not worker_connection.in_transaction:
+                worker_connection.execute("BEGIN")
+
+            # Also if the transaction was begun by a write that failed
+            if write and commit_time is None:
+                commit_time = time.monotonic() + self.commit_delay
+
+            try:
+                if write:
+                    worker_connection.execute("SAVEPOINT job")
+
+                result: Any = function(worker_connection)
+
+                if write:
+                    worker_connection.execute("RELEASE job")
+            except Exception as error:
+                if write:
+                    worker_connection.execute("ROLLBACK TO job")
+                    worker_connection.execute("RELEASE job")
+
+                self._fail(future, error_callback, error)
+                continue
+
+            if write:
+                written.append((future, callback, error_callback, result))
+            else:
+                self._deliver(future, callback, result)
+
+        worker_connection.close()
+
+    def _commit(
+        self,
+        worker_connection: sqlite3.Connection,
+        written: List[WrittenJob],
+    ) -> None:
+        """Commit the open transaction and deliver the written jobs' results.
+
+        A transaction without successful write jobs (all of them failed) is
+            rolled back, so it doesn't keep holding the write lock.
+
+        Args:
+            worker_connection (sqlite3.Connection): The worker's connection
+            written (List[WrittenJob]): The future, callbacks and result of
+                every write job in the transaction
+        """
+        if not written:
+            if worker_connection.in_transaction:
+                worker_connection.rollback()
+
+            return
+
+        try:
+            worker_connection.commit()
+        except sqlite3.Error as error:
+            worker_connection.rollback()
+
+            for future, callback, error_callback, result in written:
+                self._fail(future, error_callback, error)
+        else:
+            self.commit_count += 1
+
+            for future, callback, error_callback, result in written:
+                self._deliver(future, callback, result)
+
+    @staticmethod
+    def _deliver(
+        future: Future, callback: Optional[Callable[[Any], None]], result: Any
+    ) -> None:
+        """Set a job's result and pass it to the callback in the main thread.
+
+        Args:
+            future (Future): The job's future
+            callback (Callable[[Any], None], optional): The job's callback
+            result (Any): The job's result
+        """
+        future.set_result(result)
+
+        if callback is not None:
+            GLib.idle_add(DatabaseWorker._call, callback, result)
+
+    @staticmethod
+    def _fail(
+        future: Future,
+        error_callback: Optional[Callable[[Exception], None]],
+        error: Exception,
+    ) -> None:
+        """Set a job's error and pass it to the error callback.
+
+        Args:
+            future (Future): The job's future
+            error_callback (Callable[[Exception], None], optional): The job's
+                error callback or None for report_error()
+            error (Exception): The error
+        """
+        future.set_exception(error)
+
+        GLib.idle_add(
+            DatabaseWorker._call,
+            report_error if error_callback is None else error_callback,
+            error,
+        )
+
+    @staticmethod
+    def _call(callback: Callable[[Any], None], result: Any) -> bool:
+        """Pass a job's result to its callback.
+
+        Args:
+            callback (Callable[[Any], None]): The job's callback
+            result (Any): The job's result
+
+        Returns:
+            bool: False, to not be called again by GLib
+        """
+        callback(result)
+
+        return False
+
+
+def report_error(error: Exception) -> None:
+    """Report a failed background job that has no error callback.
+
+    Emits "database-error" on the ChangeHub, so the window can tell the user.
+        Must be called in the main thread.
+
+    Args:
+        error (Exception): The job's error
+    """
+    changes.emit("database-error", error)
+
+
+def get_worker() -> DatabaseWorker:
+    """Get the shared DatabaseWorker and start it if necessary.
+
+    Returns:
+        DatabaseWorker: The shared DatabaseWorker
+    """
+    global worker
+
+    if worker is None:
+        # The worker's connection doesn't migrate the database
+        get_connection()
+
+        worker = DatabaseWorker()
+
+    return worker
+
+
+def write(
+    sql: str,
+    parameters: Iterable[Any] = (),
+    callback: Optional[Callable[[int], None]] = None,
+    error_callback: Optional[Callable[[Exception], None]] = None,
+) -> Future:
+    """Write to the database in the background, see DatabaseWorker.write().
+
+    There is no need to commit(), the write is committed by the worker.
+
+    Args:
+        sql (str): The SQL statement
+        parameters (Iterable[Any], optional): The statement's parameters
+        callback (Callable[[int], None], optional): Called in the main thread
+            with the rowid of the last inserted row once the statement is
+            committed
+        error_callback (Callable[[Exception], None], optional): Called in the
+            main thread with the error if the statement or its commit fails.
+            Defaults to report_error()
+
+    Returns:
+        Future: The rowid of the last inserted row
+    """
+    return get_worker().write(sql, parameters, callback, error_callback)
+
+
+def read(
+    function: Callable[[sqlite3.Connection], Any],
+    callback: Callable[[Any], None],
+    error_callback: Optional[Callable[[Exception], None]] = None,
+) -> Future:
+    """Query the database in the background, see DatabaseWorker.submit().
+
+    The query runs after all writes submitted before it and sees them, even
+    if they aren't committed yet.
+
+    Args:
+        function (Callable[[sqlite3.Connection], Any]): The query. Called in
+            the worker's thread with the worker's connection
+        callback (Callable[[Any], None]): Called in the main thread with the
+            query's result
+        error_callback (Callable[[Exception], None], optional): Called in the
+            main thread with the error if the query fails. Defaults to
+            report_error()
+
+    Returns:
+        Future: The query's result
+    """
+    return get_worker().submit(
+        function, callback, error_callback=error_callback
+    )
+
+
+def execute(
+    sql: str,
+    parameters: Iterable[Any] = (),
+    other_connection: Optional[sqlite3.Connection] = None,
+) -> sqlite3.Cursor:
+    """Execute an SQL statement on the shared connection.
+
+    Writes submitted with write() are only seen once the worker committed
+    them (at most COMMIT_DELAY seconds later). Pages should query with read()
+    instead, which also keeps the main thread from waiting for the disk.
+
+    Args:
+        sql (str): The SQL statement
+        parameters (Iterable[Any], optional): The statement's parameters
+        other_connection (sqlite3.Connection, optional): A connection to use
+            instead of the shared one, e.g. in another thread (see connect())
+
+    Returns:
+        sqlite3.Cursor: A cursor with the statement's result
+    """
+    if other_connection is not None:
+        return other_connection.execute(sql, parameters)
+
+    return get_connection().execute(sql, parameters)
+
+
+def get_data_version() -> int:
+    """Get the data version of the shared connection.
+
+    It changes whenever another connection (including the DatabaseWorker's)
+    commits a change to the database.
+
+    Returns:
+        int: The data version
+    """
+    return execute("PRAGMA data_version").fetchone()[0]
+
+
+def get_foreign_change_count() -> int:
+    """Count how often other programs changed the database.
+
+    The data version (see get_data_version()) also changes when the
+    DatabaseWorker commits this program's writes, which update the objects
+    they change themselves. A new data version is only counted if the worker
+    didn't commit since the last call, so a foreign change committed at the
+    same time as the worker's writes is only seen with the next one. Must be
+    called in the main thread.
+
+    Returns:
+        int: The number of foreign changes seen so far. Compare it to a
+            previous result to find out whether cached rows are outdated
+    """
+    global seen_data_version, seen_commit_count, foreign_change_count
+
+    data_version: int = get_data_version()
+    commit_count: int = 0 if worker is None else worker.commit_count
+
+    if (
+        seen_data_version is not None
+        and data_version != seen_data_version
+        and commit_count == seen_commit_count
+    ):
+        foreign_change_count += 1
+
+    seen_data_version = data_version
+    seen_commit_count = commit_count
+
+    return foreign_change_count
+
+
+def commit() -> None:
+    """Commit the shared connection's open transaction."""
+    get_connection().commit()
+
+
+def close() -> None:
+    """Commit background writes and close the shared connection."""
+    global connection, worker
+
+    if worker is not None:
+        worker.close()
+        worker = None
+
+    if connection is not None:
+        connection.close()
+        connection = None
+
+
+atexit.register(close)
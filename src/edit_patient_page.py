@@ -1,6 +1,7 @@
 """A page that prompts the user to view, edit or create a patient."""
 
 from typing import Union, Optional, Callable, List, Tuple
+from functools import partial
 from numbers import Number
 from decimal import Decimal
 
@@ -11,9 +12,12 @@ from gi.repository import GObject, Gdk, Gtk  # type: ignore
 from .page import Page, PageClass
 
 from . import auth_util
+from . import autosave_util
+from . import database_util
 from . import patient_util
 
-from .treatment_util import Treatment
+from .model_util import RecordListModel, bind_records, update_model
+from .treatment_util import Treatment, PAGE_SIZE as TREATMENT_PAGE_SIZE
 from .treatment_row import TreatmentRow, TreatmentHeader
 
 
@@ -105,6 +109,9 @@ class EditPatientPage(Gtk.Box, Page, metaclass=PageClass):
     treatment_list_box: Union[
         Gtk.ListBox, Gtk.Template.Child
     ] = Gtk.Template.Child()
+    treatment_scrolled_window: Union[
+        Gtk.ScrolledWindow, Gtk.Template.Child
+    ] = Gtk.Template.Child()
     header_box: Union[
         Gtk.Box, Gtk.Template.Child
     ] = Gtk.Template.Child()
@@ -119,8 +126,18 @@ class EditPatientPage(Gtk.Box, Page, metaclass=PageClass):
 
     delete_button: Union[Gtk.Button, Gtk.Template.Child] = Gtk.Template.Child()
 
+    save_state_label: Union[
+        Gtk.Label, Gtk.Template.Child
+    ] = Gtk.Template.Child()
+
     editable: bool = False
 
+    all_treatments_loaded: bool = True
+
+    # Counts treatment queries, so results of outdated ones are discarded
+    treatment_request: int = 0
+    treatments_loading: bool = False
+
     def __init__(self, **kwargs):
         """Create a new EditPatientPage.
 
@@ -129,6 +146,14 @@ class EditPatientPage(Gtk.Box, Page, metaclass=PageClass):
         """
         super().__init__(**kwargs)
 
+        self.treatment_model: RecordListModel = RecordListModel(
+            Treatment.get_values
+        )
+
+        self.autosaver = autosave_util.Autosaver(
+            self.save_patient, self.on_save_state_changed
+        )
+
     def prepare(self, patient: Optional[patient_util.Patient] = None) -> None:
         """Prepare the page to be shown."""
         self.patient = patient
@@ -159,12 +184,8 @@ class EditPatientPage(Gtk.Box, Page, metaclass=PageClass):
 
             self.comment_entry.set_text(patient.comment)
 
-            advanced_access: bool = (
-                auth_util.ACCESS_LEVELS[
-                    auth_util.get_access_level(self.get_toplevel().active_user)
-                ]
-                >= 1
-            )
+            session: auth_util.Session = self.get_toplevel().session
+            advanced_access: bool = session.has_access_level("doctor")
 
             self.delete_button.set_visible(advanced_access)
             self.patient_tabs_stack_switcher.set_visible(advanced_access)
@@ -188,6 +209,10 @@ class EditPatientPage(Gtk.Box, Page, metaclass=PageClass):
             self.delete_button.hide()
             self.patient_tabs_stack_switcher.hide()
 
+        self.autosaver.reset(
+            autosave_util.UNCHANGED if patient is None else autosave_util.SAVED
+        )
+
         self.editable = True
 
         self.header_box.pack_start(
@@ -202,9 +227,11 @@ class EditPatientPage(Gtk.Box, Page, metaclass=PageClass):
         self.update_treatments()
 
     def unprepare(self) -> None:
-        """Prepare the page to be hidden."""
+        """Prepare the page to be hidden. Save unsaved changes."""
         self.editable = False
 
+        self.autosaver.flush()
+
     def do_parent_set(self, old_parent: Optional[Gtk.Widget]) -> None:
         """React to the parent being set.
 
@@ -295,17 +322,106 @@ class EditPatientPage(Gtk.Box, Page, metaclass=PageClass):
 
         self.delete_button.connect("clicked", self.on_delete_clicked)
 
+        bind_records(
+            self.treatment_list_box, self.treatment_model, TreatmentRow
+        )
+
+        self.treatment_scrolled_window.connect(
+            "edge-reached", self.on_treatments_edge_reached
+        )
+
     def update_treatments(self) -> None:
-        """Re-query all treatments."""
-        self.treatment_list_box.bind_model(
-            Treatment.iter_to_model(Treatment.get_all()),
-            TreatmentRow,
+        """Re-query the newest treatments of the patient in the background.
+
+        Older treatments are loaded when the list is scrolled to its end.
+        """
+        self.treatment_request += 1
+        self.treatments_loading = True
+
+        if self.patient is None:
+            self.on_treatments_loaded(self.treatment_request, True, [])
+            return
+
+        patient_id: int = self.patient.patient_id
+
+        database_util.read(
+            lambda connection: Treatment.get_for_patient(
+                patient_id, connection=connection
+            ),
+            partial(self.on_treatments_loaded, self.treatment_request, True),
+        )
+
+    def load_older_treatments(self) -> None:
+        """Append the next page of older treatments to the list."""
+        treatment_count: int = self.treatment_model.get_n_items()
+
+        if (
+            self.all_treatments_loaded
+            or self.treatments_loading
+            or not treatment_count
+        ):
+            return
+
+        oldest_treatment: Treatment = self.treatment_model.get_record(
+            treatment_count - 1
         )
+
+        patient_id: int = self.patient.patient_id
+        before: Tuple[int, int] = oldest_treatment.get_page_key()
+
+        self.treatments_loading = True
+
+        database_util.read(
+            lambda connection: Treatment.get_for_patient(
+                patient_id, before, connection=connection
+            ),
+            partial(self.on_treatments_loaded, self.treatment_request, False),
+        )
+
+    def on_treatments_loaded(
+        self, request: int, replace: bool, treatments: List[Treatment]
+    ) -> None:
+        """Show a page of treatments loaded in the background.
+
+        Args:
+            request (int): The treatment_request the page was loaded for. If
+                it is outdated, the page is discarded
+            replace (bool): Whether the page replaces the listed treatments
+                (or is appended to them)
+            treatments (List[Treatment]): The treatments
+        """
+        if request != self.treatment_request:
+            return
+
+        self.treatments_loading = False
+        self.all_treatments_loaded = len(treatments) < TREATMENT_PAGE_SIZE
+
+        if replace:
+            update_model(self.treatment_model, treatments)
+        else:
+            self.treatment_model.splice(
+                self.treatment_model.get_n_items(), 0, treatments
+            )
+
         self.treatment_list_box.show_all()
 
         for row in self.treatment_list_box.get_children():
             row.set_activatable(False)
 
+    def on_treatments_edge_reached(
+        self, scrolled_window: Gtk.ScrolledWindow, position: Gtk.PositionType
+    ) -> None:
+        """React to the treatment list being scrolled to one of its edges.
+
+        Load older treatments if the end of the list was reached.
+
+        Args:
+            scrolled_window (Gtk.ScrolledWindow): The scrolled window
+            position (Gtk.PositionType): The edge that was reached
+        """
+        if position == Gtk.PositionType.BOTTOM:
+            self.load_older_treatments()
+
     def on_num_entry_insert(
         self,
         editable: Gtk.Editable,
@@ -499,57 +615,13 @@ class EditPatientPage(Gtk.Box, Page, metaclass=PageClass):
     def on_values_changed(self, *args) -> None:
         """React to patient data being changed.
 
+        The patient is saved by the autosaver once the user stops typing.
+
         Args:
             *args: Arguments that Gtk passes to the ::connect handler
         """
         if self.editable:
-            if (
-                self.first_name_entry.get_text().strip() != ""
-                and self.last_name_entry.get_text().strip() != ""
-                and self.birth_date_year_entry.get_text() != ""
-                and self.birth_date_month_entry.get_text() != ""
-                and self.birth_date_day_entry.get_text() != ""
-                and self.gender_combobox_text.get_active_id() is not None
-                and self.weight_entry.get_text().replace(",", ".") != ""
-            ):
-                if self.patient is not None:
-                    self.patient.modify(
-                        first_name=self.first_name_entry.get_text().strip(),
-                        last_name=self.last_name_entry.get_text().strip(),
-                        birthday=self.birth_date_year_entry.get_text()
-                        + "-"
-                        + self.birth_date_month_entry.get_text()
-                        + "-"
-                        + self.birth_date_day_entry.get_text(),
-                        gender=self.gender_combobox_text.get_active_id(),
-                        weight=float(
-                            self.weight_entry.get_text().replace(",", ".")
-                        ),
-                        comment=self.comment_entry.get_text().strip(),
-                    )
-
-                else:
-                    self.patient = patient_util.Patient.add(
-                        first_name=self.first_name_entry.get_text().strip(),
-                        last_name=self.last_name_entry.get_text().strip(),
-                        birthday=self.birth_date_year_entry.get_text()
-                        + "-"
-                        + self.birth_date_month_entry.get_text()
-                        + "-"
-                        + self.birth_date_day_entry.get_text(),
-                        gender=self.gender_combobox_text.get_active_id(),
-                        weight=float(
-                            self.weight_entry.get_text().replace(",", ".")
-                        ),
-                        comment=self.comment_entry.get_text().strip(),
-                    )
-
-                    self.title = (
-                        f"{self.first_name_entry.get_text()} "
-                        f"{self.last_name_entry.get_text()}"
-                    )
-
-                    self.get_toplevel().update_title()
+            self.autosaver.mark_dirty()
 
             if (
                 self.first_name_entry.get_text().strip() != ""
@@ -570,6 +642,63 @@ class EditPatientPage(Gtk.Box, Page, metaclass=PageClass):
 
             self.get_toplevel().update_title()
 
+    def save_patient(self) -> bool:
+        """Save the entered patient data, adding the patient if necessary.
+
+        Returns:
+            bool: False if the data is incomplete and wasn't saved
+        """
+        if not (
+            self.first_name_entry.get_text().strip() != ""
+            and self.last_name_entry.get_text().strip() != ""
+            and self.birth_date_year_entry.get_text() != ""
+            and self.birth_date_month_entry.get_text() != ""
+            and self.birth_date_day_entry.get_text() != ""
+            and self.gender_combobox_text.get_active_id() is not None
+            and self.weight_entry.get_text().replace(",", ".") != ""
+        ):
+            return False
+
+        if self.patient is not None:
+            self.patient.modify(
+                first_name=self.first_name_entry.get_text().strip(),
+                last_name=self.last_name_entry.get_text().strip(),
+                birthday=self.birth_date_year_entry.get_text()
+                + "-"
+                + self.birth_date_month_entry.get_text()
+                + "-"
+                + self.birth_date_day_entry.get_text(),
+                gender=self.gender_combobox_text.get_active_id(),
+                weight=float(self.weight_entry.get_text().replace(",", ".")),
+                comment=self.comment_entry.get_text().strip(),
+            )
+
+        else:
+            self.patient = patient_util.Patient.add(
+                first_name=self.first_name_entry.get_text().strip(),
+                last_name=self.last_name_entry.get_text().strip(),
+                birthday=self.birth_date_year_entry.get_text()
+                + "-"
+                + self.birth_date_month_entry.get_text()
+                + "-"
+                + self.birth_date_day_entry.get_text(),
+                gender=self.gender_combobox_text.get_active_id(),
+                weight=float(self.weight_entry.get_text().replace(",", ".")),
+                comment=self.comment_entry.get_text().strip(),
+            )
+
+        return True
+
+    def on_save_state_changed(self, state: str) -> None:
+        """Show the autosaver's state.
+
+        Args:
+            state (str): The new state, see autosave_util
+        """
+        self.save_state_label.set_text(
+            autosave_util.SAVE_STATE_TRANSLATIONS[state]
+        )
+
     def on_delete_clicked(self, button: Gtk.Button) -> None:
         """React to the "Delete" button being clicked.
 
@@ -593,6 +722,9 @@ class EditPatientPage(Gtk.Box, Page, metaclass=PageClass):
         dialog.destroy()
 
         if response == Gtk.ResponseType.YES:
+            # Unsaved changes don't matter anymore
+            self.autosaver.reset()
+
             self.patient.delete()
             self.get_toplevel().go_back()
             while self.get_toplevel().active_patient is self.patient:
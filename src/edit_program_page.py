@@ -177,11 +177,8 @@ class EditProgramPage(Gtk.Box, Page, metaclass=PageClass):
 
         self.update_save_sensitivities()
 
-        is_admin: bool = (
-            self.get_toplevel().active_user is not None
-            and auth_util.get_access_level(self.get_toplevel().active_user)
-            == "admin"
-        )
+        session: Optional[auth_util.Session] = self.get_toplevel().session
+        is_admin: bool = session is not None and session.is_admin
 
         for entry in self.entries:
             entry.set_sensitive(is_admin)
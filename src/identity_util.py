@@ -0,0 +1,133 @@
+"""Share one object per database row between queries and pages.
+
+An IdentityMap maps the ids of rows to the objects that represent them, so
+a row that is queried again (e.g. when returning to a list) is represented
+by the object that already exists instead of a new one, and a modification
+made through one reference is seen through all of them.
+
+Objects are held weakly, only the CACHED_OBJECTS most recently used ones are
+kept alive by the map itself. Changes made by this program update (or
+evict) the objects directly, also when they are committed in the background.
+Changes made by other programs, which this program can't track, are detected
+with database_util.get_foreign_change_count() and clear the map.
+"""
+
+from typing import Any, Callable, Hashable, Optional
+
+from collections import OrderedDict
+import weakref
+
+try:
+    from . import database_util
+except ImportError:
+    import database_util
+
+
+# How many objects an IdentityMap keeps alive by default
+CACHED_OBJECTS: int = 256
+
+
+class IdentityMap:
+    """Map the ids of database rows to the objects that represent them.
+
+    Must only be used in the main thread, it checks the data version of the
+        shared connection (see database_util.get_foreign_change_count()).
+    """
+
+    def __init__(self, size: int = CACHED_OBJECTS):
+        """Create a new, empty IdentityMap.
+
+        Args:
+            size (int, optional): How many recently used objects to keep
+                alive. Defaults to CACHED_OBJECTS
+        """
+        self.size = size
+
+        self._objects: "weakref.WeakValueDictionary[Hashable, Any]" = (
+            weakref.WeakValueDictionary()
+        )
+        self._recent: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+        self._change_count: Optional[int] = None
+
+    def validate(self) -> None:
+        """Clear the map if another program changed the database.
+
+        Call this once before looking up the rows of a query.
+        """
+        change_count: int = database_util.get_foreign_change_count()
+
+        if change_count != self._change_count:
+            self.clear()
+            self._change_count = change_count
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get the object for an id.
+
+        Args:
+            key (Hashable): The id
+
+        Returns:
+            Optional[Any]: The object or None if there is none
+        """
+        found: Optional[Any] = self._objects.get(key)
+
+        if found is not None:
+            self._use(key, found)
+
+        return found
+
+    def get_or_add(self, key: Hashable, create: Callable[[], Any]) -> Any:
+        """Get the object for an id and create it if there is none.
+
+        Args:
+            key (Hashable): The id
+            create (Callable[[], Any]): Creates the object, e.g. from a row
+
+        Returns:
+            Any: The object
+        """
+        found: Optional[Any] = self.get(key)
+
+        if found is None:
+            found = create()
+            self.add(key, found)
+
+        return found
+
+    def add(self, key: Hashable, new_object: Any) -> None:
+        """Make an object the one for an id, e.g. after inserting its row.
+
+        Args:
+            key (Hashable): The id
+            new_object (Any): The object
+        """
+        self._objects[key] = new_object
+        self._use(key, new_object)
+
+    def evict(self, key: Hashable) -> None:
+        """Forget the object for an id, e.g. after deleting its row.
+
+        Args:
+            key (Hashable): The id
+        """
+        self._objects.pop(key, None)
+        self._recent.pop(key, None)
+
+    def clear(self) -> None:
+        """Forget all objects."""
+        self._objects.clear()
+        self._recent.clear()
+
+    def _use(self, key: Hashable, used_object: Any) -> None:
+        """Keep an object alive as the most recently used one.
+
+        Args:
+            key (Hashable): The object's id
+            used_object (Any): The object
+        """
+        self._recent[key] = used_object
+        self._recent.move_to_end(key)
+
+        while len(self._recent) > self.size:
+            self._recent.popitem(last=False)
@@ -3,6 +3,8 @@
 
 from typing import Union, Optional
 
+from functools import partial
+
 from gi.repository import GObject, Gtk  # type: ignore
 
 from .page import Page, PageClass
@@ -48,6 +50,8 @@ class LoginPage(Gtk.Box, Page, metaclass=PageClass):
         self.username_entry.set_text("")
         self.password_entry.set_text("")
 
+        self.log_in_button.set_sensitive(True)
+
         self.username_entry.grab_focus()
 
     def do_parent_set(self, old_parent: Optional[Gtk.Widget]) -> None:
@@ -95,28 +99,46 @@ class LoginPage(Gtk.Box, Page, metaclass=PageClass):
             widget (Gtk.Widget): The focused entry.
             event (Gdk.EventFocus): The focus event.
         """
+        username: str = self.username_entry.get_text()
+        password: str = self.password_entry.get_text()
+
         try:
-            if auth_util.authenticate(
-                self.username_entry.get_text(), self.password_entry.get_text()
-            ):
-                self.get_toplevel().active_user = (
-                    self.username_entry.get_text()
-                )
-                self.get_toplevel().active_user_password = (
-                    self.password_entry.get_text()
-                )
-
-                self.get_toplevel().switch_page("select_patient")
-
-                self.get_toplevel().clear_history()
-
-            else:
-                self.password_entry.get_style_context().add_class("error")
-                self.password_entry.grab_focus_without_selecting()
+            # Hashing the password takes a while, don't block the main loop
+            auth_util.authenticate_async(
+                username,
+                password,
+                partial(self.on_authenticated, username, password),
+            )
         except ValueError as e:
             print(e)
             self.username_entry.get_style_context().add_class("error")
             self.username_entry.grab_focus_without_selecting()
+        else:
+            self.log_in_button.set_sensitive(False)
+
+    def on_authenticated(
+        self, username: str, password: str, is_correct: bool
+    ) -> None:
+        """Log in or show an error once the password has been verified.
+
+        Args:
+            username (str): The username that was entered
+            password (str): The password that was entered
+            is_correct (bool): Whether the password is correct
+        """
+        self.log_in_button.set_sensitive(True)
+
+        if is_correct:
+            self.get_toplevel().active_user = username
+            self.get_toplevel().active_user_password = password
+
+            self.get_toplevel().switch_page("select_patient")
+
+            self.get_toplevel().clear_history()
+
+        else:
+            self.password_entry.get_style_context().add_class("error")
+            self.password_entry.grab_focus_without_selecting()
 
 
 # Make LoginPage accessible via .ui files
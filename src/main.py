@@ -11,6 +11,8 @@ from gi.repository import Gio, Gdk, Gtk
 
 from .window import LiegensteuerungWindow
 
+from . import backup_util
+
 
 class LstrgApplication(Gtk.Application):
     """The Gtk.Application that represents the Liegensteuerung."""
@@ -49,6 +51,9 @@ class LstrgApplication(Gtk.Application):
         win = self.props.active_window
         if not win:
             win = LiegensteuerungWindow(application=self)
+
+            # The window has opened (and migrated) the database
+            backup_util.schedule()
         win.present()
 
 
@@ -0,0 +1,259 @@
+"""Record snapshots and short clips of the camera in a background thread.
+
+Encoding JPEG or video frames takes long enough to stall the UI, so frames
+are handed to a MediaRecorder, which encodes and writes them in its own
+thread. If the thread can't keep up, new frames are dropped instead of
+blocking the caller. Since a snapshot is written later, whoever needs to know
+that it was written passes a callback, which is called in the GLib main loop.
+
+Files are stored in MEDIA_DIRECTORY. Clip recording is configured in the
+"recording" section of ~/.liegensteuerung/camera.json (see
+RecordingSettings).
+"""
+
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+import os
+import queue
+
+from threading import Semaphore, Thread
+
+import cv2  # type: ignore
+import numpy  # type: ignore
+
+from gi.repository import GLib  # type: ignore
+
+from . import camera_util
+
+
+MEDIA_DIRECTORY: str = os.path.expanduser("~/.liegensteuerung/media")
+
+# How many frames may wait for encoding before new frames are dropped
+MAX_PENDING_FRAMES: int = 8
+
+SNAPSHOT_EXTENSION: str = ".jpg"
+CLIP_EXTENSION: str = ".mp4"
+CLIP_FOURCC: str = "mp4v"
+
+
+class RecordingSettings(NamedTuple):
+    """The settings for recordings.
+
+    Attributes:
+        clip_duration (float): How many seconds of video to record after a
+            snapshot. 0 to only record snapshots
+        clip_fps (float): The frame rate of clips
+        jpeg_quality (int): The JPEG quality of snapshots (0-100)
+    """
+
+    clip_duration: float = 0.0
+    clip_fps: float = 15.0
+    jpeg_quality: int = 90
+
+
+def load_settings() -> RecordingSettings:
+    """Load the recording settings configured by the user.
+
+    Returns:
+        RecordingSettings: The configured settings. Unknown keys are ignored.
+    """
+    settings: Dict[str, Any] = camera_util.load_config().get("recording", {})
+
+    return RecordingSettings(
+        **{
+            key: value
+            for key, value in settings.items()
+            if key in RecordingSettings._fields
+        }
+    )
+
+
+def get_media_path(name: str, extension: str) -> str:
+    """Get the path of a media file in MEDIA_DIRECTORY.
+
+    Args:
+        name (str): The file name without extension
+        extension (str): The file extension, e.g. ".jpg"
+
+    Returns:
+        str: The absolute path of the file
+    """
+    return os.path.join(MEDIA_DIRECTORY, name + extension)
+
+
+class MediaRecorder:
+    """Encode and write snapshots and clips in a background thread.
+
+    All frames are expected to be RGB, like SetupPage.camera_frame.
+
+    Attributes:
+        settings (RecordingSettings): The recording settings
+        dropped_frame_count (int): How many frames were dropped because the
+            thread couldn't keep up
+    """
+
+    settings: RecordingSettings
+    dropped_frame_count: int
+
+    def __init__(self, settings: Optional[RecordingSettings] = None):
+        """Create a new MediaRecorder and start its thread.
+
+        Args:
+            settings (RecordingSettings, optional): The settings to use.
+                Defaults to the settings loaded from camera_util.CONFIG_PATH
+        """
+        self.settings = settings if settings is not None else load_settings()
+        self.dropped_frame_count = 0
+
+        # Control jobs are never dropped, so the queue itself is unbounded and
+        # the number of pending frames is limited by the semaphore
+        self._jobs: "queue.Queue[Tuple[Any, ...]]" = queue.Queue()
+        self._free_frame_slots: Semaphore = Semaphore(MAX_PENDING_FRAMES)
+
+        self._video_writer: Optional[cv2.VideoWriter] = None
+
+        self._thread: Thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _put_frame_job(self, *job: Any) -> bool:
+        """Queue a job that carries a frame unless too many frames are pending.
+
+        Args:
+            *job: The job
+
+        Returns:
+            bool: Whether the job was queued (False if it was dropped)
+        """
+        if not self._free_frame_slots.acquire(blocking=False):
+            self.dropped_frame_count += 1
+            return False
+
+        self._jobs.put(job)
+        return True
+
+    def snapshot(
+        self,
+        frame: numpy.ndarray,
+        path: str,
+        on_written: Optional[Callable[[str], bool]] = None,
+    ) -> bool:
+        """Save a frame as an image.
+
+        Args:
+            frame (numpy.ndarray): The RGB frame to save
+            path (str): The path to save the image to
+            on_written (Optional[Callable[[str], bool]], optional): Called
+                with the path in the GLib main loop once the image was
+                written, not at all if writing failed. Like any GLib idle
+                callback, it must return False. Defaults to None
+
+        Returns:
+            bool: Whether the frame was queued (False if it was dropped)
+        """
+        return self._put_frame_job("snapshot", frame, path, on_written)
+
+    def start_clip(self, path: str, width: int, height: int) -> None:
+        """Start recording a clip. Frames are added with add_frame().
+
+        A clip that is still being recorded is finished first.
+
+        Args:
+            path (str): The path to save the clip to
+            width (int): The frame width in pixels
+            height (int): The frame height in pixels
+        """
+        self._jobs.put(("start_clip", path, width, height))
+
+    def add_frame(self, frame: numpy.ndarray) -> bool:
+        """Add a frame to the clip that is being recorded.
+
+        Args:
+            frame (numpy.ndarray): The RGB frame to add
+
+        Returns:
+            bool: Whether the frame was queued (False if it was dropped)
+        """
+        return self._put_frame_job("frame", frame)
+
+    def stop_clip(self) -> None:
+        """Finish the clip that is being recorded."""
+        self._jobs.put(("stop_clip",))
+
+    def close(self) -> None:
+        """Finish all queued jobs and stop the thread."""
+        self._jobs.put(("close",))
+        self._thread.join()
+
+    def _run(self) -> None:
+        """Process queued jobs until close() is called."""
+        while True:
+            job: Tuple[Any, ...] = self._jobs.get()
+
+            try:
+                if job[0] == "snapshot":
+                    self._write_snapshot(job[1], job[2])
+
+                    if job[3] is not None:
+                        GLib.idle_add(job[3], job[2])
+                elif job[0] == "frame":
+                    if self._video_writer is not None:
+                        self._video_writer.write(
+                            cv2.cvtColor(job[1], cv2.COLOR_RGB2BGR)
+                        )
+                elif job[0] == "start_clip":
+                    self._finish_clip()
+                    self._start_clip(job[1], job[2], job[3])
+                elif job[0] == "stop_clip":
+                    self._finish_clip()
+                elif job[0] == "close":
+                    self._finish_clip()
+                    return
+            except (cv2.error, OSError) as error:
+                print(error)
+            finally:
+                if job[0] in ("snapshot", "frame"):
+                    self._free_frame_slots.release()
+
+    def _write_snapshot(self, frame: numpy.ndarray, path: str) -> None:
+        """Encode and write a snapshot.
+
+        Args:
+            frame (numpy.ndarray): The RGB frame to save
+            path (str): The path to save the image to
+
+        Raises:
+            OSError: if the image couldn't be written
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # imwrite() reports most failures (e.g. a full disk) only by
+        # returning False
+        if not cv2.imwrite(
+            path,
+            cv2.cvtColor(frame, cv2.COLOR_RGB2BGR),
+            (cv2.IMWRITE_JPEG_QUALITY, self.settings.jpeg_quality),
+        ):
+            raise OSError(f"Couldn't write snapshot {path}")
+
+    def _start_clip(self, path: str, width: int, height: int) -> None:
+        """Open a cv2.VideoWriter for a new clip.
+
+        Args:
+            path (str): The path to save the clip to
+            width (int): The frame width in pixels
+            height (int): The frame height in pixels
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._video_writer = cv2.VideoWriter(
+            path,
+            cv2.VideoWriter_fourcc(*CLIP_FOURCC),
+            self.settings.clip_fps,
+            (width, height),
+        )
+
+    def _finish_clip(self) -> None:
+        """Release the cv2.VideoWriter of the current clip, if any."""
+        if self._video_writer is not None:
+            self._video_writer.release()
+            self._video_writer = None
@@ -0,0 +1,216 @@
+"""Update list models in place instead of replacing them.
+
+Binding a new model to a Gtk.ListBox destroys every row widget and creates
+new ones. update_model() instead compares the old and new items and only
+removes and inserts the items that changed, so the rows of unchanged items
+(and with them selection and scroll position) are kept.
+
+Items are compared by a key, e.g. the values a row shows. Records can be
+modified in place (see identity_util), so a model keeps the key every record
+had when it was added, i.e. what its row shows.
+
+Query results are plain records (e.g. patient_util.Patient), which are
+much smaller than GObjects. A RecordListModel holds records and only wraps
+one in a RecordWrapper when its row is created, see bind_records().
+"""
+
+from typing import (
+    Any,
+    Callable,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import difflib
+
+from gi.repository import GObject, Gio, Gtk  # type: ignore
+
+
+class RecordWrapper(GObject.Object):
+    """A GObject that carries a record, so that a Gio.ListModel can hold it.
+
+    Attributes:
+        record (Any): The record
+    """
+
+    record: Any
+
+    def __init__(self, record: Any):
+        """Create a new RecordWrapper.
+
+        Args:
+            record (Any): The record
+        """
+        super().__init__()
+
+        self.record = record
+
+
+class RecordListModel(GObject.Object, Gio.ListModel):
+    """A list model of records that are wrapped when they are requested.
+
+    Attributes:
+        records (List[Any]): The records
+        keys (List[Hashable]): The key of every record when it was added
+        get_key (Callable[[Any], Hashable]): Returns the key of a record.
+            Records with the same key are considered equal
+    """
+
+    records: List[Any]
+    keys: List[Hashable]
+
+    def __init__(
+        self,
+        get_key: Callable[[Any], Hashable] = id,
+        records: Iterable[Any] = (),
+    ):
+        """Create a new RecordListModel.
+
+        Args:
+            get_key (Callable[[Any], Hashable], optional): Returns the key of
+                a record, e.g. the values its row shows. Defaults to id()
+            records (Iterable[Any], optional): The initial records
+        """
+        super().__init__()
+
+        self.get_key = get_key
+
+        self.records = list(records)
+        self.keys = [get_key(record) for record in self.records]
+
+    def do_get_item_type(self) -> GObject.GType:
+        """Get the type of the model's items.
+
+        Returns:
+            GObject.GType: The type of RecordWrapper
+        """
+        return RecordWrapper.__gtype__
+
+    def do_get_n_items(self) -> int:
+        """Get the number of records.
+
+        Returns:
+            int: The number of records
+        """
+        return len(self.records)
+
+    def do_get_item(self, position: int) -> Optional[RecordWrapper]:
+        """Wrap the record at a position.
+
+        Args:
+            position (int): The position
+
+        Returns:
+            RecordWrapper, optional: The wrapped record or None if position
+                is out of range
+        """
+        if not 0 <= position < len(self.records):
+            return None
+
+        return RecordWrapper(self.records[position])
+
+    def get_record(self, position: int) -> Any:
+        """Get the record at a position without wrapping it.
+
+        Args:
+            position (int): The position
+
+        Returns:
+            Any: The record
+        """
+        return self.records[position]
+
+    def splice(
+        self, position: int, n_removals: int, additions: Sequence[Any]
+    ) -> None:
+        """Replace records, like Gio.ListStore.splice().
+
+        Args:
+            position (int): Where to remove and add records
+            n_removals (int): How many records to remove
+            additions (Sequence[Any]): The records to add
+        """
+        self.records[position : position + n_removals] = additions
+        self.keys[position : position + n_removals] = [
+            self.get_key(record) for record in additions
+        ]
+
+        self.items_changed(position, n_removals, len(additions))
+
+    def remove_all(self) -> None:
+        """Remove all records."""
+        self.splice(0, len(self.records), [])
+
+
+def bind_records(
+    list_box: Gtk.ListBox,
+    model: RecordListModel,
+    create_row: Callable[[Any], Gtk.Widget],
+) -> None:
+    """Bind a model of wrapped records to a Gtk.ListBox.
+
+    Args:
+        list_box (Gtk.ListBox): The list box
+        model (RecordListModel): The model, or any other model of
+            RecordWrappers
+        create_row (Callable[[Any], Gtk.Widget]): Creates the row for a
+            record
+    """
+    list_box.bind_model(model, lambda wrapper: create_row(wrapper.record))
+
+
+def update_model(model: RecordListModel, new_items: Sequence[Any]) -> None:
+    """Make a model contain new_items, changing as little as possible.
+
+    Items whose key (see RecordListModel.get_key) is in both the model and
+        new_items (in the same order) are kept as they are. A moved item is
+        removed at its old position and inserted at its new one.
+
+    Args:
+        model (RecordListModel): The model to update
+        new_items (Sequence[Any]): The items the model should contain
+    """
+    for old_start, old_end, new_start, new_end in get_changes(
+        model.keys, [model.get_key(item) for item in new_items]
+    ):
+        model.splice(
+            old_start,
+            old_end - old_start,
+            list(new_items[new_start:new_end]),
+        )
+
+
+def get_changes(
+    old_keys: Sequence[Hashable], new_keys: Sequence[Hashable]
+) -> List[Tuple[int, int, int, int]]:
+    """Get the changes that turn one sequence of keys into another.
+
+    The changes are ordered back to front, so that the indexes of the old
+        keys stay valid while they are applied one after the other.
+
+    Args:
+        old_keys (Sequence[Hashable]): The old keys
+        new_keys (Sequence[Hashable]): The new keys
+
+    Returns:
+        List[Tuple[int, int, int, int]]: For every change: old[i1:i2] has to
+            be replaced with new[j1:j2], as (i1, i2, j1, j2)
+    """
+    if list(old_keys) == list(new_keys):
+        return []
+
+    matcher: difflib.SequenceMatcher = difflib.SequenceMatcher(
+        None, old_keys, new_keys, autojunk=False
+    )
+
+    return [
+        (old_start, old_end, new_start, new_end)
+        for tag, old_start, old_end, new_start, new_end in reversed(
+            matcher.get_opcodes()
+        )
+        if tag != "equal"
+    ]
@@ -0,0 +1,293 @@
+"""Utility functions that hash and verify passwords.
+
+Passwords are hashed with scrypt (or PBKDF2 if this Python's OpenSSL lacks
+scrypt). The cost can be configured per device in
+~/.liegensteuerung/auth.json and raised as the hardware allows: hashes made
+with other settings, including the old salted SHA-512 hashes, still verify
+and are rehashed with the current settings when their user logs in (see
+needs_rehash()).
+
+Hashing is slow on purpose, so the GUI hashes in a worker thread (see
+run_async()).
+
+Example auth.json:
+    {
+        "kdf": {"algorithm": "scrypt", "n": 16384, "r": 8, "p": 1}
+    }
+
+Hash formats, stored in the password_hash column:
+    scrypt$<n>$<r>$<p>$<base64 hash>
+    pbkdf2_sha256$<iterations>$<base64 hash>
+    <base64 SHA-512 hash>  (legacy)
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+import os
+import json
+import base64
+import hashlib
+import hmac
+
+from gi.repository import GLib  # type: ignore
+
+
+CONFIG_PATH: str = os.path.expanduser("~/.liegensteuerung/auth.json")
+
+SCRYPT: str = "scrypt"
+PBKDF2: str = "pbkdf2_sha256"
+
+# The algorithm to use if none is configured
+DEFAULT_ALGORITHM: str = SCRYPT if hasattr(hashlib, "scrypt") else PBKDF2
+
+# Hashes are run one after another, there is one user at a time anyway
+executor: Optional[ThreadPoolExecutor] = None
+
+
+class KdfSettings(NamedTuple):
+    """The password hashing settings configured by the user.
+
+    Attributes:
+        algorithm (str): SCRYPT or PBKDF2
+        n (int): The scrypt CPU/memory cost, a power of 2
+        r (int): The scrypt block size
+        p (int): The scrypt parallelization
+        iterations (int): The number of PBKDF2 iterations
+    """
+
+    algorithm: str = DEFAULT_ALGORITHM
+    n: int = 2 ** 14
+    r: int = 8
+    p: int = 1
+    iterations: int = 200000
+
+
+def load_settings() -> KdfSettings:
+    """Load the password hashing settings configured by the user.
+
+    Returns:
+        KdfSettings: The configured settings. Unknown keys are ignored.
+    """
+    try:
+        with open(CONFIG_PATH) as config_file:
+            config: Dict[str, Any] = json.load(config_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        config = {}
+
+    settings: Dict[str, Any] = (
+        config.get("kdf", {}) if isinstance(config, dict) else {}
+    )
+
+    return KdfSettings(
+        **{
+            key: value
+            for key, value in settings.items()
+            if key in KdfSettings._fields
+        }
+    )
+
+
+def encode(digest: bytes) -> str:
+    """Encode a hash digest for the database.
+
+    Args:
+        digest (bytes): The digest
+
+    Returns:
+        str: The digest in base64
+    """
+    return base64.b64encode(digest).decode()
+
+
+def hash_password(
+    password: str, salt: str, settings: Optional[KdfSettings] = None
+) -> str:
+    """Hash a password.
+
+    Args:
+        password (str): The password
+        salt (str): The salt, see auth_util.generate_salt()
+        settings (Optional[KdfSettings], optional): The settings to hash
+            with. Defaults to the configured ones
+
+    Returns:
+        str: The hash in one of the formats above, including the settings
+
+    Raises:
+        ValueError: if the configured algorithm is unknown
+    """
+    if settings is None:
+        settings = load_settings()
+
+    if settings.algorithm == SCRYPT:
+        digest: bytes = hashlib.scrypt(
+            password.encode(),
+            salt=salt.encode(),
+            n=settings.n,
+            r=settings.r,
+            p=settings.p,
+            # scrypt needs 128 * n * r bytes, OpenSSL's default limit is
+            # too low for higher costs
+            maxmem=256 * settings.n * settings.r * settings.p,
+        )
+
+        return (
+            f"{SCRYPT}${settings.n}${settings.r}${settings.p}"
+            f"${encode(digest)}"
+        )
+
+    elif settings.algorithm == PBKDF2:
+        digest = hashlib.pbkdf2_hmac(
+            "sha256", password.encode(), salt.encode(), settings.iterations
+        )
+
+        return f"{PBKDF2}${settings.iterations}${encode(digest)}"
+
+    else:
+        raise ValueError(f"{settings.algorithm} is not a valid algorithm")
+
+
+def hash_legacy(password: str, salt: str) -> str:
+    """Hash a password the way passwords used to be hashed.
+
+    Args:
+        password (str): The password
+        salt (str): The salt
+
+    Returns:
+        str: The salted SHA-512 hash in base64
+    """
+    return encode(hashlib.sha512((password + salt).encode()).digest())
+
+
+def get_settings(password_hash: str) -> Optional[KdfSettings]:
+    """Get the settings a hash was made with.
+
+    Args:
+        password_hash (str): The hash
+
+    Returns:
+        Optional[KdfSettings]: The settings or None for a legacy hash
+
+    Raises:
+        ValueError: if the hash's format is unknown
+    """
+    fields: List[str] = password_hash.split("$")
+
+    if len(fields) == 1:
+        return None
+
+    elif fields[0] == SCRYPT and len(fields) == 5:
+        return KdfSettings(
+            algorithm=SCRYPT,
+            n=int(fields[1]),
+            r=int(fields[2]),
+            p=int(fields[3]),
+        )
+
+    elif fields[0] == PBKDF2 and len(fields) == 3:
+        return KdfSettings(algorithm=PBKDF2, iterations=int(fields[1]))
+
+    else:
+        raise ValueError("Unknown password hash format")
+
+
+def verify(password: str, salt: str, password_hash: str) -> bool:
+    """Verify a password against its hash.
+
+    Args:
+        password (str): The password
+        salt (str): The salt the hash was made with
+        password_hash (str): The hash in one of the formats above
+
+    Returns:
+        bool: True if the password is correct, False otherwise
+    """
+    settings: Optional[KdfSettings] = get_settings(password_hash)
+
+    if settings is None:
+        new_hash: str = hash_legacy(password, salt)
+    else:
+        new_hash = hash_password(password, salt, settings)
+
+    return hmac.compare_digest(new_hash, password_hash)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """Return whether a hash wasn't made with the configured settings.
+
+    Args:
+        password_hash (str): The hash
+
+    Returns:
+        bool: Whether the password should be hashed again
+    """
+    settings: Optional[KdfSettings] = get_settings(password_hash)
+    current: KdfSettings = load_settings()
+
+    if settings is None or settings.algorithm != current.algorithm:
+        return True
+
+    elif settings.algorithm == SCRYPT:
+        return (settings.n, settings.r, settings.p) != (
+            current.n,
+            current.r,
+            current.p,
+        )
+
+    else:
+        return settings.iterations != current.iterations
+
+
+def run_async(
+    function: Callable[..., Any],
+    callback: Callable[[Future], None],
+    *args: Any,
+) -> Future:
+    """Run a (hashing) function in the worker thread.
+
+    Args:
+        function (Callable[..., Any]): The function
+        callback (Callable[[Future], None]): Called in the GLib main loop
+            with the finished Future, get the result with Future.result()
+        *args (Any): Arguments passed on to the function
+
+    Returns:
+        Future: The Future of the function's result
+    """
+    global executor
+
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=1)
+
+    future: Future = executor.submit(function, *args)
+    future.add_done_callback(partial(_deliver, callback))
+
+    return future
+
+
+def _deliver(callback: Callable[[Future], None], future: Future) -> None:
+    """Pass a finished Future to its callback in the main thread.
+
+    Args:
+        callback (Callable[[Future], None]): The callback
+        future (Future): The finished Future
+    """
+    GLib.idle_add(_call, callback, future)
+
+
+def _call(callback: Callable[[Future], None], future: Future) -> bool:
+    """Call a callback with a finished Future in the GLib main loop.
+
+    Args:
+        callback (Callable[[Future], None]): The callback
+        future (Future): The finished Future
+
+    Returns:
+        bool: False, to not be called again by GLib
+    """
+    callback(future)
+
+    return False
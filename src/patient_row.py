@@ -64,7 +64,7 @@ class PatientRow(Gtk.Box):
             if size_groups.get(column, None) is None:
                 size_groups[column] = Gtk.SizeGroup(Gtk.SizeGroupMode.BOTH)
 
-            text = GLib.markup_escape_text(str(patient.__dict__.get(column)))
+            text = GLib.markup_escape_text(str(getattr(patient, column)))
 
             if column in patient_util.DATE_COLUMNS:
                 text = (
@@ -142,9 +142,7 @@ class PatientHeader(Gtk.Box):
             event_box.connect(
                 "button-press-event",
                 self.on_column_header_clicked,
-                patient_util.COLUMNS.index(
-                    column.replace("patient_", "").replace("_translated", "")
-                ),
+                column,
                 col_index,
             )
 
@@ -204,7 +202,7 @@ class PatientHeader(Gtk.Box):
         self,
         event_box: Gtk.EventBox,
         event: Gdk.EventButton,
-        column_index: int,
+        column: str,
         display_column_index: int,
     ) -> None:
         """React to the user clicking on a column header.
@@ -216,12 +214,12 @@ class PatientHeader(Gtk.Box):
             event_box (Gtk.EventBox): The Gtk.EventBox that was clicked
                 (pressed) on
             event (Gdk.EventButton): The event that the button press caused
-            column_index (int): The column index of the column header
+            column (str): The column of the column header
+            display_column_index (int): The column's index in DISPLAY_COLUMNS
         """
         self.page.set_sort(
-            column_index,
-            self.page.sort_column == column_index
-            and not self.page.sort_reverse,
+            column,
+            self.page.sort_column == column and not self.page.sort_reverse,
         )
 
         self.update_sort_icons()
@@ -233,9 +231,7 @@ class PatientHeader(Gtk.Box):
             image.set_from_icon_name("go-down-symbolic", Gtk.IconSize.BUTTON)
 
         display_column_index: int = patient_util.DISPLAY_COLUMNS.index(
-            patient_util.COLUMNS[self.page.sort_column]
-            .replace("id", "patient_id")
-            .replace("gender", "gender_translated")
+            self.page.sort_column
         )
 
         if self.page.sort_reverse:
@@ -2,11 +2,10 @@
 
 Attributes:
     COLUMNS (TYPE): Description
-    connection (TYPE): Description
-    cursor (TYPE): Description
-    DATABASE_NAME (str): Description
     DISPLAY_COLUMNS (tuple): Description
     SORT_ORDERS (set): Description
+    SORT_EXPRESSIONS (dict): How to order by each of DISPLAY_COLUMNS
+    PAGE_SIZE (int): How many patients are loaded at once by default
 """
 
 from typing import (
@@ -21,31 +20,31 @@ from typing import (
     Callable,
 )
 
-import os
-
-from threading import Thread
+from collections import OrderedDict
+from threading import Lock, Thread
 import time
+import queue
+import re
+import string
 
 import sqlite3
-import atexit
 
 from gi.repository import GObject, GLib, Gio  # type: ignore
 
 try:
+    from . import database_util
     from . import program_util
+    from .change_util import changes
+    from .identity_util import IdentityMap
+    from .model_util import RecordListModel, RecordWrapper, get_changes
 except ImportError:
+    import database_util
     import program_util
+    from change_util import changes
+    from identity_util import IdentityMap
+    from model_util import RecordListModel, RecordWrapper, get_changes
 
 
-try:
-    os.mkdir(os.path.expanduser("~/.liegensteuerung"))
-except FileExistsError:
-    pass
-finally:
-    os.chdir(os.path.expanduser("~/.liegensteuerung"))
-
-DATABASE_NAME: str = "liegensteuerung.db"
-
 GENDERS: Dict[str, str] = {
     "male": "Männlich",
     "female": "Weiblich",
@@ -79,63 +78,89 @@ TREATMENT_COLUMNS: List[str] = [
     "timestamp",
     "pain_intensity",
     "pain_location",
+    "media_path",
 ]
 
 SORT_ORDERS = {"ASC", "DESC"}
 
+# Names are compared case-insensitively. Every expression has an index (see
+# database_util.migration_3_sort_indexes), so a page is read from the index
+# instead of sorting the whole table
+SORT_EXPRESSIONS: Dict[str, str] = {
+    "patient_id": "id",
+    "last_name": "last_name COLLATE NOCASE",
+    "first_name": "first_name COLLATE NOCASE",
+    "gender_translated": "gender",
+    "birthday": "birthday",
+}
 
-connection = sqlite3.connect(DATABASE_NAME)
-
-cursor = connection.cursor()
+# The attribute of Patient that holds the value of each sort column
+SORT_ATTRIBUTES: Dict[str, str] = {
+    "patient_id": "patient_id",
+    "last_name": "last_name",
+    "first_name": "first_name",
+    "gender_translated": "gender",
+    "birthday": "birthday",
+}
 
-# Create tables
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS patients
-         (
-            id UNSIGNED BIG INT, first_name TEXT, last_name TEXT,
-            birthday TEXT, gender TEXT, weight DOUBLE, comment TEXT
-        )
-    """
-)
-cursor.execute(
-    """CREATE TABLE IF NOT EXISTS treatment_entries
-        (
-            patient_id UNSIGNED BIG INT,
-            program_id UNSIGNED BIG INT,
-            timestamp UNSIGNED BIG INT,
-            username TEXT,
-            pain_intensity INT,
-            pain_location TEXT
-        )
-    """
+# SQLite's NOCASE collation only folds ASCII letters, see
+# PatientListModel.get_order_key()
+NOCASE_FOLDING: Dict[int, int] = str.maketrans(
+    string.ascii_uppercase, string.ascii_lowercase
 )
 
-connection.commit()
+PAGE_SIZE: int = 50
+MAX_PAGE_SIZE: int = 500
 
-atexit.register(connection.close)
+# How many pages a PatientListModel keeps in memory
+CACHED_PAGES: int = 8
 
+# How many ms PatientSearcher waits for more typing before searching. Comes
+# on top of the 150 ms that Gtk.SearchEntry waits before "search-changed"
+SEARCH_DELAY: int = 100
 
-class Patient(GObject.Object):
+# The Patient object of every patient id, see from_rows()
+patient_map: IdentityMap = IdentityMap()
+
+
+class Patient:
     """A Patient represents a database entry for a single patient.
 
+    Patients are plain records, see model_util.RecordListModel.
+
     Attributes:
         birthday (str): The patient's date of birth
         comment (str): A comment
         first_name (str): The patient's first name
         gender (str): The patient's gender
+        gender_translated (str): The patient's gender, in German
         last_name (str): The patient's last name
         patient_id (int): An assigned ID
+        search_rank (float, optional): How well the patient matched a search
+            (lower is better) or None if the patient isn't from a search
         weight (float): The patient's weight in kilograms
     """
 
+    __slots__ = (
+        "patient_id",
+        "first_name",
+        "last_name",
+        "birthday",
+        "gender",
+        "weight",
+        "comment",
+        "search_rank",
+        "__weakref__",  # Needed by patient_map
+    )
+
     patient_id: int
     first_name: str
     last_name: str
     birthday: str
     gender: str
-    gender_translated: str
     weight: float
     comment: str
+    search_rank: Optional[float]
 
     def __init__(
         self,
@@ -162,16 +187,39 @@ class Patient(GObject.Object):
             weight (float): The patient's weight in kilograms
             comment (str): A comment
         """
-        super().__init__()
-
         self.patient_id = patient_id
         self.first_name = first_name
         self.last_name = last_name
         self.birthday = birthday
         self.gender = gender
-        self.gender_translated = GENDERS[gender]
         self.weight = weight
         self.comment = comment
+        self.search_rank = None
+
+    @property
+    def gender_translated(self) -> str:
+        """Translate the patient's gender when it is displayed.
+
+        Returns:
+            str: The patient's gender, in German
+        """
+        return GENDERS[self.gender]
+
+    def get_values(self) -> Tuple[Any, ...]:
+        """Get the patient's values, e.g. to compare patients.
+
+        Returns:
+            Tuple[Any, ...]: The values of all COLUMNS
+        """
+        return (
+            self.patient_id,
+            self.first_name,
+            self.last_name,
+            self.birthday,
+            self.gender,
+            self.weight,
+            self.comment,
+        )
 
     @staticmethod
     def add(
@@ -192,12 +240,20 @@ class Patient(GObject.Object):
             weight (float): The patient's weight in kilograms
             comment (str): A comment
         """
+        # patients.id is an INTEGER PRIMARY KEY, so SQLite assigns it
+        cursor: sqlite3.Cursor = database_util.execute(
+            """
+                INSERT INTO patients
+                    (first_name, last_name, birthday, gender, weight, comment)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (first_name, last_name, birthday, gender, weight, comment),
+        )
+
+        database_util.commit()
+
         patient = Patient(
-            patient_id=int(
-                cursor.execute("SELECT MAX(id) FROM patients").fetchone()[0]
-                or 0
-            )
-            + 1,
+            patient_id=cursor.lastrowid,
             first_name=first_name,
             last_name=last_name,
             birthday=birthday,
@@ -206,20 +262,9 @@ class Patient(GObject.Object):
             comment=comment,
         )
 
-        cursor.execute(
-            "INSERT INTO patients VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (
-                patient.patient_id,
-                patient.first_name,
-                patient.last_name,
-                patient.birthday,
-                patient.gender,
-                patient.weight,
-                patient.comment,
-            ),
-        )
+        patient_map.add(patient.patient_id, patient)
 
-        connection.commit()
+        changes.emit("patient-added", patient)
 
         return patient
 
@@ -234,6 +279,8 @@ class Patient(GObject.Object):
     ):
         """Modify the patient and save to the database.
 
+        The change is committed in the background, see database_util.write().
+
         Args:
             first_name (str, optional): The patient's first name or
                 None (default) to not change
@@ -260,7 +307,7 @@ class Patient(GObject.Object):
         if comment is not None:
             self.comment = comment
 
-        cursor.execute(
+        database_util.write(
             """
                 UPDATE patients
                 SET first_name = ?,
@@ -282,11 +329,18 @@ class Patient(GObject.Object):
             ),
         )
 
-        connection.commit()
+        # Queries return this object from now on, even if another one was
+        # loaded before
+        patient_map.add(self.patient_id, self)
+
+        changes.emit("patient-modified", self)
 
     def delete(self):
-        """Delete the patient from the database."""
-        cursor.execute(
+        """Delete the patient and their treatment entries from the database.
+
+        The treatment entries are deleted by the foreign key constraint.
+        """
+        database_util.write(
             """
                 DELETE FROM patients
                 WHERE id=?
@@ -294,144 +348,352 @@ class Patient(GObject.Object):
             (self.patient_id,),
         )
 
-        connection.commit()
+        patient_map.evict(self.patient_id)
+
+        changes.emit("patient-deleted", self)
+
+    def get_sort_key(self, sort_column: Optional[str]) -> Tuple[Any, int]:
+        """Get the key by which the patient is ordered in a sort column.
+
+        Args:
+            sort_column (str, optional): One of DISPLAY_COLUMNS or None for
+                the search rank (only set on patients from a search)
+
+        Returns:
+            Tuple[Any, int]: The key. Can be passed as after to get_page()
+        """
+        if sort_column is None:
+            return (self.search_rank, self.patient_id)
+
+        return (
+            getattr(self, SORT_ATTRIBUTES[sort_column]),
+            self.patient_id,
+        )
 
     @staticmethod
-    def sort(
-        patient_rows: Iterable[Tuple[Any, ...]],
-        sort_key_func: Optional[Callable] = None,
-        reverse: Optional[bool] = False,
-    ) -> List[Tuple[Any, ...]]:
-        """Sort an iterable of patient rows.
+    def get_match_expression(query: str) -> Optional[str]:
+        """Convert a search query to an FTS5 match expression.
 
-        If sort_key_func is None, order is retained (if reverse is True,
-            return patient_rows[::-1]).
+        Every word of the query has to match the beginning of a word of the
+            patient's id, first name or last name. Umlauts are folded like
+            the index (see database_util.fold_text()).
 
         Args:
-            patient_rows (Iterable[Tuple[Any, ...]]): Rows to sort
-            sort_key_func (Optional[Callable]): A callable that
-                returns a value by which to sort the rows
-            reverse (Optional[bool]): Whether to reverse the sorted
-                iterable
+            query (str): The search query
 
         Returns:
-            Iterable[Tuple[Any, ...]]: The sorted iterable
+            Optional[str]: The match expression or None if query has no words
         """
-        sorted_patient_rows: List[Tuple[Any, ...]]
+        words: List[str] = [
+            word
+            for word in re.split(r"\W+", database_util.fold_text(query))
+            if word
+        ]
 
-        if sort_key_func is None:
-            sorted_patient_rows = list(patient_rows)
-        else:
-            sorted_patient_rows = sorted(patient_rows, key=sort_key_func)
+        if not words:
+            return None
 
-        if reverse:
-            return sorted_patient_rows[::-1]
-        return sorted_patient_rows
+        # Quoted, so that words like AND or NOT aren't operators
+        return " ".join([f'"{word}"*' for word in words])
 
     @staticmethod
-    def get_all(
-        sort_key_func: Optional[Callable] = None, reverse: bool = False
-    ) -> Generator["Patient", None, None]:
-        """Yield all patients in the database.
+    def get_page(
+        sort_column: Optional[str] = "last_name",
+        reverse: bool = False,
+        after: Optional[Tuple[Any, int]] = None,
+        limit: int = PAGE_SIZE,
+        query: Optional[str] = None,
+        connection: Optional[sqlite3.Connection] = None,
+    ) -> List["Patient"]:
+        """Get one page of patients, sorted by the database.
+
+        Pages are addressed by the sort key of their predecessor (keyset
+            pagination), so getting a page takes the same time no matter how
+            far into the list it is. Ties are broken by the patient's id.
 
         Args:
-            sort_key_func (Optional[Callable]): A callable that
-                returns a value by which to sort the rows
-            reverse (Optional[bool]): Whether to reverse the sorted
-                iterable
+            sort_column (str, optional): One of DISPLAY_COLUMNS or None to
+                sort by relevance (only with a query). Defaults to
+                "last_name"
+            reverse (bool, optional): Whether to sort in descending order.
+                Defaults to False
+            after (Tuple[Any, int], optional): The sort key (see
+                get_sort_key()) of the last patient of the previous page or
+                None (default) for the first page
+            limit (int, optional): The maximum number of patients to get.
+                Defaults to PAGE_SIZE, may not exceed MAX_PAGE_SIZE
+            query (str, optional): Only get patients whose id, first name or
+                last name start with every word in query (see
+                get_match_expression()). Defaults to None
+            connection (sqlite3.Connection, optional): The connection to use
+                instead of the shared one (see database_util.execute())
+
+        Returns:
+            List[Patient]: The patients on the page
+
+        Raises:
+            ValueError: if sort_column or limit is invalid
         """
-        for patient_row in Patient.sort(
-            cursor.execute(
-                "SELECT " + ", ".join(COLUMNS) + " FROM patients"
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            raise ValueError(
+                f"limit must be between 1 and {MAX_PAGE_SIZE} (inclusive)"
+            )
+
+        match_expression: Optional[str] = (
+            None if query is None else Patient.get_match_expression(query)
+        )
+
+        if sort_column is None:
+            if match_expression is not None:
+                return Patient.get_ranked_page(
+                    match_expression, reverse, after, limit, connection
+                )
+
+            sort_column = "last_name"
+
+        if sort_column not in SORT_EXPRESSIONS:
+            raise ValueError(f"{sort_column} is not a valid sort column")
+
+        sort_expression: str = SORT_EXPRESSIONS[sort_column]
+        sort_order: str = "DESC" if reverse else "ASC"
+
+        join: str = ""
+        conditions: List[str] = []
+        parameters: List[Any] = []
+
+        if match_expression is not None:
+            # Faster than "id IN (...)". The subquery hides the columns of
+            # patients_search, which would make "id" ambiguous
+            join = """
+                JOIN (
+                    SELECT rowid AS match_id FROM patients_search
+                    WHERE patients_search MATCH ?
+                ) ON id = match_id
+            """
+            parameters.append(match_expression)
+
+        if after is not None:
+            comparison: str = "<" if reverse else ">"
+
+            # The row value comparison uses the collation of sort_expression.
+            # SQLite doesn't use the index for it if a collation is given, so
+            # the first (redundant) comparison is needed for an index search
+            conditions.append(
+                f"{sort_expression} {comparison}= ? "
+                f"AND ({sort_expression}, id) {comparison} (?, ?)"
+            )
+            parameters.extend((after[0], *after))
+
+        return Patient.from_rows(
+            database_util.execute(
+                f"""
+                    SELECT {", ".join(COLUMNS)}
+                    FROM patients {join}
+                    {"WHERE " + " AND ".join(conditions) if conditions else ""}
+                    ORDER BY {sort_expression} {sort_order}, id {sort_order}
+                    LIMIT ?
+                """,
+                (*parameters, limit),
+                connection,
             ).fetchall(),
-            sort_key_func,
-            reverse,
-        ):
-            yield Patient(*patient_row)
+            connection,
+        )
 
     @staticmethod
-    def get_for_query(
-        query: str,
-        sort_key_func: Optional[Callable] = None,
-        reverse: bool = False,
-    ) -> Generator["Patient", None, None]:
-        """Yield all patients in the database.
+    def from_rows(
+        patient_rows: Iterable[Tuple[Any, ...]],
+        connection: Optional[sqlite3.Connection] = None,
+    ) -> List["Patient"]:
+        """Get the patients that rows (with the values of COLUMNS) represent.
+
+        Patients from the shared connection are taken from patient_map, so
+            every patient is represented by one object. Rows from other
+            connections, i.e. other threads, always get new objects.
 
         Args:
-            query (str): A query to match
-            sort_key_func (Optional[Callable]): A callable that
-                returns a value by which to sort the rows
-            reverse (Optional[bool]): Whether to reverse the sorted
-                iterable
+            patient_rows (Iterable[Tuple[Any, ...]]): The rows
+            connection (sqlite3.Connection, optional): The connection the rows
+                were read with or None (default) for the shared one
+
+        Returns:
+            List[Patient]: The patients
         """
-        patient_rows: Set[Tuple[Any, ...]] = set()
+        if connection is not None:
+            return [Patient(*patient_row) for patient_row in patient_rows]
 
-        for word in query.split(" "):
-            for patient_row in Patient.get_for_query_word(word):
-                patient_rows.add(patient_row)
+        patient_map.validate()
 
-        for patient_row in Patient.sort(patient_rows, sort_key_func, reverse):
-            yield Patient(*patient_row)
+        return [
+            patient_map.get_or_add(
+                patient_row[0], lambda: Patient(*patient_row)
+            )
+            for patient_row in patient_rows
+        ]
 
     @staticmethod
-    def get_for_query_word(
-        query_word: str,
-        sort_key_func: Optional[Callable] = None,
-        reverse: bool = False,
-    ) -> Generator[Tuple[Any, ...], None, None]:
-        """Yield all patients in the database.
+    def count(
+        query: Optional[str] = None,
+        connection: Optional[sqlite3.Connection] = None,
+    ) -> int:
+        """Count the patients, optionally only those matching a query.
 
         Args:
-            query_word (str): The word to match
-            sort_key_func (Optional[Callable]): A callable that
-                returns a value by which to sort the rows
-            reverse (Optional[bool]): Whether to reverse the sorted
-                iterable
+            query (str, optional): Only count patients matching query, see
+                get_page(). Defaults to None
+            connection (sqlite3.Connection, optional): The connection to use
+                instead of the shared one (see database_util.execute())
+
+        Returns:
+            int: The number of patients
         """
-        for patient_row in Patient.sort(
-            cursor.execute(
-                f"""
-                SELECT {", ".join(COLUMNS)}
-                FROM patients
-                WHERE last_name LIKE ("%" || ? || "%")
-                OR first_name LIKE ("%" || ? || "%")
-                OR id LIKE ("%" || ? || "%")
+        match_expression: Optional[str] = (
+            None if query is None else Patient.get_match_expression(query)
+        )
+
+        if match_expression is None:
+            return database_util.execute(
+                "SELECT COUNT(*) FROM patients", (), connection
+            ).fetchone()[0]
+
+        return database_util.execute(
+            """
+                SELECT COUNT(*) FROM patients_search
+                WHERE patients_search MATCH ?
             """,
-                (query_word.lower(), query_word.lower(), query_word.lower()),
-            ).fetchall(),
-            sort_key_func,
-            reverse,
-        ):
-            yield tuple(patient_row)
+            (match_expression,),
+            connection,
+        ).fetchone()[0]
 
     @staticmethod
-    def iter_to_model(patient_iter: Iterable["Patient"]) -> Gio.ListStore:
-        """Convert an iterable of Patient objects into a Gio.ListStore.
+    def get_ranked_page(
+        match_expression: str,
+        reverse: bool = False,
+        after: Optional[Tuple[Any, int]] = None,
+        limit: int = PAGE_SIZE,
+        connection: Optional[sqlite3.Connection] = None,
+    ) -> List["Patient"]:
+        """Get one page of patients matching a search, best matches first.
+
+        Use get_page() with sort_column=None instead of calling this directly.
 
         Args:
-            patient_iter (Iterable[Patient]): An iterable of patients to
-                convert
+            match_expression (str): An FTS5 match expression
+            reverse (bool, optional): Whether to return the worst matches
+                first. Defaults to False
+            after (Tuple[Any, int], optional): The sort key (see
+                get_sort_key()) of the last patient of the previous page or
+                None (default) for the first page
+            limit (int, optional): The maximum number of patients to get.
+                Defaults to PAGE_SIZE
+            connection (sqlite3.Connection, optional): The connection to use
+                instead of the shared one (see database_util.execute())
 
         Returns:
-            Gio.ListStore: The converted model
+            List[Patient]: The patients on the page. Their search_rank is set.
         """
-        model: Gio.ListStore = Gio.ListStore()
+        sort_order: str = "DESC" if reverse else "ASC"
+
+        after_condition: str = ""
+        parameters: List[Any] = [match_expression]
+
+        if after is not None:
+            after_condition = (
+                f"AND (patients_search.rank, patients.id) "
+                f"{'<' if reverse else '>'} (?, ?)"
+            )
+            parameters.extend(after)
+
+        patient_rows: List[Tuple[Any, ...]] = database_util.execute(
+            f"""
+                SELECT
+                    {", ".join(["patients." + column for column in COLUMNS])},
+                    patients_search.rank
+                FROM patients_search
+                JOIN patients ON patients.id = patients_search.rowid
+                WHERE patients_search MATCH ? {after_condition}
+                ORDER BY patients_search.rank {sort_order},
+                    patients.id {sort_order}
+                LIMIT ?
+            """,
+            (*parameters, limit),
+            connection,
+        ).fetchall()
+
+        patients: List[Patient] = Patient.from_rows(
+            [patient_row[:-1] for patient_row in patient_rows], connection
+        )
 
-        patient_list: List[Patient] = list(patient_iter)
+        for patient, patient_row in zip(patients, patient_rows):
+            patient.search_rank = patient_row[-1]
 
-        def add_patients(patient_list: List[Patient]):
-            if len(patient_list):
-                for patient in patient_list[:10]:
-                    model.append(patient)
-                GLib.timeout_add(20, add_patients, patient_list[10:])
+        return patients
 
-        for patient in patient_list[:20]:
-            model.append(patient)
+    @staticmethod
+    def get_all(
+        sort_column: Optional[str] = "last_name",
+        reverse: bool = False,
+        query: Optional[str] = None,
+    ) -> Generator["Patient", None, None]:
+        """Yield all patients in the database, page by page.
 
-        # left out for perfomance reasons
-        # add_patients(patient_list[20:])
+        Args:
+            sort_column (str, optional): One of DISPLAY_COLUMNS or None to
+                sort by relevance (only with a query). Defaults to
+                "last_name"
+            reverse (bool, optional): Whether to sort in descending order.
+                Defaults to False
+            query (str, optional): Only yield patients matching query, see
+                get_page(). Defaults to None
+        """
+        if sort_column is None and (
+            query is None or Patient.get_match_expression(query) is None
+        ):
+            sort_column = "last_name"  # Like get_page()
 
-        return model
+        after: Optional[Tuple[Any, int]] = None
+
+        while True:
+            patients: List[Patient] = Patient.get_page(
+                sort_column, reverse, after, MAX_PAGE_SIZE, query
+            )
+
+            yield from patients
+
+            if len(patients) < MAX_PAGE_SIZE:
+                return
+
+            after = patients[-1].get_sort_key(sort_column)
+
+    @staticmethod
+    def get_for_query(
+        query: str,
+        sort_column: Optional[str] = None,
+        reverse: bool = False,
+    ) -> Generator["Patient", None, None]:
+        """Yield all patients in the database that match a query.
+
+        Args:
+            query (str): A query to match, see get_page()
+            sort_column (str, optional): One of DISPLAY_COLUMNS or None
+                (default) to sort by relevance
+            reverse (bool, optional): Whether to sort in descending order.
+                Defaults to False
+        """
+        yield from Patient.get_all(sort_column, reverse, query)
+
+    @staticmethod
+    def iter_to_model(patient_iter: Iterable["Patient"]) -> RecordListModel:
+        """Convert an iterable of Patient objects into a RecordListModel.
+
+        Args:
+            patient_iter (Iterable[Patient]): An iterable of patients to
+                convert
+
+        Returns:
+            RecordListModel: The converted model
+        """
+        # Callers pass pages (see get_page()), so all patients can be added
+        return RecordListModel(Patient.get_values, patient_iter)
 
     def add_pain_entry(
         self, username: str, pain_intensity: int, pain_location: str,
@@ -462,7 +724,7 @@ class Patient(GObject.Object):
 
         timestamp: int = int(time.time())
 
-        cursor.execute(
+        database_util.write(
             """
                 INSERT INTO treatment_entries
                     (
@@ -483,7 +745,8 @@ class Patient(GObject.Object):
                 pain_location,
             ),
         )
-        connection.commit()
+
+        changes.emit("treatment-recorded", self, timestamp)
 
         return timestamp
 
@@ -506,7 +769,7 @@ class Patient(GObject.Object):
         """
         new_timestamp: int = int(time.time())
 
-        cursor.execute(
+        database_util.write(
             """
             UPDATE treatment_entries
             SET program_id = ?, timestamp = ?
@@ -514,7 +777,8 @@ class Patient(GObject.Object):
             """,
             (program.id, new_timestamp, self.patient_id, timestamp, username),
         )
-        connection.commit()
+
+        changes.emit("treatment-recorded", self, new_timestamp)
 
         return new_timestamp
 
@@ -552,7 +816,7 @@ class Patient(GObject.Object):
 
         new_timestamp: int = int(time.time())
 
-        cursor.execute(
+        database_util.write(
             """
                 UPDATE treatment_entries
                 SET pain_intensity = ?, pain_location = ?, timestamp = ?
@@ -566,10 +830,694 @@ class Patient(GObject.Object):
                 timestamp,
             ),
         )
-        connection.commit()
+
+        changes.emit("treatment-recorded", self, new_timestamp)
 
         return new_timestamp
 
+    def set_treatment_media(self, timestamp: int, media_path: str) -> None:
+        """Link a media file (snapshot or clip) to a treatment entry.
+
+        If the entry doesn't exist, do nothing.
+
+        Args:
+            timestamp (int): The UNIX timestamp of the treatment entry
+            media_path (str): The path of the media file
+        """
+        database_util.write(
+            """
+                UPDATE treatment_entries
+                SET media_path = ?
+                WHERE patient_id=? AND timestamp=?
+            """,
+            (media_path, self.patient_id, timestamp),
+        )
+
+        changes.emit("treatment-recorded", self, timestamp)
+
+
+class PatientListModel(GObject.Object, Gio.ListModel):
+    """A list model that loads patients from the database when needed.
+
+    Pages of patients are loaded with keyset pagination (see
+        Patient.get_page()) and the last CACHED_PAGES used pages are kept.
+
+    Gtk.ListBox creates a row for every item of its model, so the model
+        doesn't expose all patients at once. It starts with the first page and
+        expose_more() appends the next one, e.g. when the list is scrolled to
+        its end. Exposed patients are kept as long as they are exposed, so
+        apply_change() can move their rows without re-querying.
+
+    Attributes:
+        query (str, optional): Only patients matching query are listed
+        sort_column (str, optional): See Patient.get_page()
+        reverse (bool): See Patient.get_page()
+        total_count (int): How many patients match query
+    """
+
+    query: Optional[str]
+    sort_column: Optional[str]
+    reverse: bool
+    total_count: int
+
+    def __init__(
+        self, page_size: int = PAGE_SIZE, cached_pages: int = CACHED_PAGES
+    ):
+        """Create a new, empty PatientListModel. Fill it with set_query().
+
+        Args:
+            page_size (int, optional): How many patients to load at once.
+                Defaults to PAGE_SIZE
+            cached_pages (int, optional): How many pages to keep in memory.
+                Defaults to CACHED_PAGES
+        """
+        super().__init__()
+
+        self.page_size = page_size
+        self.cached_pages = cached_pages
+
+        self.query = None
+        self.sort_column = "last_name"
+        self.reverse = False
+        self.total_count = 0
+
+        self._exposed_count: int = 0
+        self._exposed_patients: List[Patient] = []
+        # The values of the exposed patients when they were exposed. Patients
+        # are modified in place, so their values may not be what rows show
+        self._exposed_values: List[Tuple[Any, ...]] = []
+
+        self._pages: "OrderedDict[int, List[Patient]]" = OrderedDict()
+        # The sort key of the last patient before each page, see get_page()
+        self._page_start_keys: Dict[int, Optional[Tuple[Any, int]]] = {
+            0: None
+        }
+
+        # While set_query() changes the items, they are served from here
+        self._transition_items: Optional[List[Patient]] = None
+
+        # Counts set_query() calls, so pages loaded for an older query are
+        # discarded, see load_more()
+        self._query_generation: int = 0
+
+    def do_get_item_type(self) -> GObject.GType:
+        """Get the type of the model's items.
+
+        Returns:
+            GObject.GType: The GType of model_util.RecordWrapper
+        """
+        return RecordWrapper.__gtype__
+
+    def do_get_n_items(self) -> int:
+        """Get the number of exposed items.
+
+        Returns:
+            int: The number of exposed items
+        """
+        if self._transition_items is not None:
+            return len(self._transition_items)
+
+        return self._exposed_count
+
+    def do_get_item(self, position: int) -> Optional[RecordWrapper]:
+        """Get an item, i.e. a wrapped patient.
+
+        Args:
+            position (int): The item's position
+
+        Returns:
+            Optional[RecordWrapper]: The wrapped patient or None if position
+                is too large
+        """
+        patient: Optional[Patient] = self.get_patient(position)
+
+        if patient is None:
+            return None
+
+        return RecordWrapper(patient)
+
+    def get_patient(self, position: int) -> Optional[Patient]:
+        """Get a patient, loading their page if necessary.
+
+        Args:
+            position (int): The patient's position
+
+        Returns:
+            Optional[Patient]: The patient or None if position is too large
+        """
+        if self._transition_items is not None:
+            if position < len(self._transition_items):
+                return self._transition_items[position]
+            return None
+
+        if not 0 <= position < self._exposed_count:
+            return None
+
+        return self._exposed_patients[position]
+
+    def get_page(self, page_number: int) -> List[Patient]:
+        """Get a page of patients from the cache or the database.
+
+        Args:
+            page_number (int): The number of the page, starting at 0
+
+        Returns:
+            List[Patient]: The patients on the page, empty if there are fewer
+                pages
+        """
+        if page_number in self._pages:
+            self._pages.move_to_end(page_number)
+            return self._pages[page_number]
+
+        # Only pages after a known page can be loaded
+        while page_number not in self._page_start_keys:
+            previous_page_number: int = max(
+                number
+                for number in self._page_start_keys
+                if number < page_number
+            )
+            if len(self.get_page(previous_page_number)) < self.page_size:
+                return []
+
+        patients: List[Patient] = Patient.get_page(
+            self.sort_column,
+            self.reverse,
+            self._page_start_keys[page_number],
+            self.page_size,
+            self.query,
+        )
+
+        self.add_page(page_number, patients)
+
+        return patients
+
+    def add_page(self, page_number: int, patients: List[Patient]) -> None:
+        """Add a loaded page to the cache and evict the oldest if necessary.
+
+        Args:
+            page_number (int): The number of the page
+            patients (List[Patient]): The patients on the page
+        """
+        if len(patients) == self.page_size:
+            last_patient: Patient = patients[-1]
+            self._page_start_keys[page_number + 1] = last_patient.get_sort_key(
+                self.sort_column
+            )
+
+        self._pages[page_number] = patients
+
+        while len(self._pages) > self.cached_pages:
+            self._pages.popitem(last=False)
+
+    def set_query(
+        self,
+        query: Optional[str],
+        sort_column: Optional[str] = "last_name",
+        reverse: bool = False,
+        first_page: Optional[List[Patient]] = None,
+        total_count: Optional[int] = None,
+    ) -> None:
+        """List the patients matching a query, starting with the first page.
+
+        Rows of patients that are exposed before and after are kept, only the
+            changes are signalled (see model_util.get_changes()).
+
+        Args:
+            query (str, optional): Only list patients matching query, see
+                Patient.get_page()
+            sort_column (str, optional): See Patient.get_page(). Defaults to
+                "last_name"
+            reverse (bool, optional): See Patient.get_page(). Defaults to
+                False
+            first_page (List[Patient], optional): The first page, if it was
+                already loaded, e.g. by a PatientSearcher
+            total_count (int, optional): The number of matching patients, if
+                it is already known
+        """
+        old_items: List[Patient] = [
+            self.get_patient(position)
+            for position in range(self.do_get_n_items())
+        ]
+
+        self.query = query
+        self.sort_column = sort_column
+        self.reverse = reverse
+
+        self._query_generation += 1
+        self._pages.clear()
+        self._page_start_keys = {0: None}
+
+        if first_page is None:
+            first_page = Patient.get_page(
+                sort_column, reverse, limit=self.page_size, query=query
+            )
+        if total_count is None:
+            total_count = Patient.count(query)
+
+        self.add_page(0, first_page)
+        self.total_count = total_count
+
+        self._transition_items = old_items
+
+        new_values: List[Tuple[Any, ...]] = [
+            patient.get_values() for patient in first_page
+        ]
+
+        for old_start, old_end, new_start, new_end in get_changes(
+            self._exposed_values, new_values
+        ):
+            self._transition_items[old_start:old_end] = first_page[
+                new_start:new_end
+            ]
+            self.items_changed(
+                old_start, old_end - old_start, new_end - new_start
+            )
+
+        self._transition_items = None
+        self._exposed_count = len(first_page)
+        self._exposed_patients = list(first_page)
+        self._exposed_values = new_values
+
+    def refresh(self) -> None:
+        """Reload the first page of the current query."""
+        self.set_query(self.query, self.sort_column, self.reverse)
+
+    def expose_more(self) -> bool:
+        """Expose the next page of patients.
+
+        Returns:
+            bool: Whether there were more patients to expose
+        """
+        if self._exposed_count >= self.total_count:
+            return False
+
+        position: int = self._exposed_count
+
+        page: List[Patient] = self.get_page(position // self.page_size)
+        added_count: int = len(page) - position % self.page_size
+
+        if added_count <= 0:
+            # Patients were deleted since total_count was counted
+            self.total_count = position
+            return False
+
+        self._exposed_count += added_count
+        self._exposed_patients.extend(page[-added_count:])
+        self._exposed_values.extend(
+            [patient.get_values() for patient in page[-added_count:]]
+        )
+        self.items_changed(position, 0, added_count)
+
+        return True
+
+    def load_more(self, callback: Callable[[bool], None]) -> None:
+        """Load the next page of patients in the background and expose it.
+
+        If the page is cached (or can't be loaded by itself), it is exposed
+            right away.
+
+        Args:
+            callback (Callable[[bool], None]): Called in the main thread with
+                whether there were more patients to expose (see
+                expose_more()). False if the query changed in the meantime
+                or the page couldn't be loaded
+        """
+        page_number: int = self._exposed_count // self.page_size
+
+        if (
+            self._exposed_count >= self.total_count
+            or page_number in self._pages
+            or page_number not in self._page_start_keys
+        ):
+            callback(self.expose_more())
+            return
+
+        generation: int = self._query_generation
+        sort_column: Optional[str] = self.sort_column
+        reverse: bool = self.reverse
+        after: Optional[Tuple[Any, int]] = self._page_start_keys[page_number]
+        limit: int = self.page_size
+        query: Optional[str] = self.query
+
+        def on_loaded(patients: List[Patient]) -> None:
+            if generation != self._query_generation:
+                callback(False)
+                return
+
+            self.add_page(page_number, patients)
+            callback(self.expose_more())
+
+        def on_failed(error: Exception) -> None:
+            callback(False)
+            database_util.report_error(error)
+
+        database_util.read(
+            lambda connection: Patient.get_page(
+                sort_column, reverse, after, limit, query, connection
+            ),
+            on_loaded,
+            on_failed,
+        )
+
+    def apply_added(self, patient: Patient) -> bool:
+        """Insert the row of an added patient if it belongs among the rows.
+
+        Args:
+            patient (Patient): The added patient
+
+        Returns:
+            bool: Whether the change was applied, see place()
+        """
+        return self.place(patient, added=True)
+
+    def apply_modified(self, patient: Patient) -> bool:
+        """Move and update the row of a modified patient.
+
+        Args:
+            patient (Patient): The modified patient
+
+        Returns:
+            bool: Whether the change was applied, see place()
+        """
+        return self.place(patient, added=False)
+
+    def apply_deleted(self, patient: Patient) -> None:
+        """Remove the row of a deleted patient if it is exposed.
+
+        Args:
+            patient (Patient): The deleted patient
+        """
+        position: Optional[int] = self.find_exposed(patient.patient_id)
+
+        if position is not None:
+            self.remove_exposed(position)
+
+        # With a query, an unexposed patient may not have matched anyway
+        if position is not None or self.query is None:
+            self.total_count -= 1
+
+        self.reset_pages()
+
+    def place(self, patient: Patient, added: bool) -> bool:
+        """Put the row of an added or modified patient where it belongs.
+
+        Where a patient belongs is only known without a query (matching is
+            done by the database). If the patient belongs after the exposed
+            patients, it is exposed later by expose_more().
+
+        Args:
+            patient (Patient): The patient
+            added (bool): Whether the patient is new (or was listed before)
+
+        Returns:
+            bool: Whether the change was applied. If not, nothing was changed
+                and the patients have to be re-queried, e.g. with refresh()
+        """
+        if self.query is not None or self._transition_items is not None:
+            return False
+
+        new_key: Optional[Tuple[Any, int]] = self.get_order_key(patient)
+        other_keys: List[Optional[Tuple[Any, int]]] = [
+            self.get_order_key(exposed_patient)
+            for exposed_patient in self._exposed_patients
+            if exposed_patient.patient_id != patient.patient_id
+        ]
+
+        # None can't be compared, SQLite sorts it first
+        if new_key is None or None in other_keys:
+            return False
+
+        # Before the first exposed patient that comes after the patient
+        new_position: int = next(
+            (
+                position
+                for position, key in enumerate(other_keys)
+                if (key < new_key if self.reverse else key > new_key)
+            ),
+            len(other_keys),
+        )
+
+        all_exposed: bool = self._exposed_count >= self.total_count
+        old_position: Optional[int] = self.find_exposed(patient.patient_id)
+
+        if old_position is not None:
+            self.remove_exposed(old_position)
+        if added:
+            self.total_count += 1
+
+        if new_position < len(other_keys) or all_exposed:
+            self._exposed_count += 1
+            self._exposed_patients.insert(new_position, patient)
+            self._exposed_values.insert(new_position, patient.get_values())
+            self.items_changed(new_position, 0, 1)
+
+        self.reset_pages()
+
+        return True
+
+    def get_order_key(self, patient: Patient) -> Optional[Tuple[Any, int]]:
+        """Get the key by which the database orders a patient in this list.
+
+        Args:
+            patient (Patient): The patient
+
+        Returns:
+            Optional[Tuple[Any, int]]: The key or None if the sort value is
+                None (or there is no sort column)
+        """
+        if self.sort_column is None:
+            return None
+
+        value, patient_id = patient.get_sort_key(self.sort_column)
+
+        if value is None:
+            return None
+
+        if SORT_EXPRESSIONS[self.sort_column].endswith(" COLLATE NOCASE"):
+            value = value.translate(NOCASE_FOLDING)
+
+        return (value, patient_id)
+
+    def find_exposed(self, patient_id: int) -> Optional[int]:
+        """Find the position of an exposed patient.
+
+        Args:
+            patient_id (int): The patient's id
+
+        Returns:
+            Optional[int]: The position or None if the patient isn't exposed
+        """
+        for position, values in enumerate(self._exposed_values):
+            if values[0] == patient_id:
+                return position
+
+        return None
+
+    def remove_exposed(self, position: int) -> None:
+        """Remove an exposed patient's row.
+
+        Args:
+            position (int): The patient's position
+        """
+        self._exposed_count -= 1
+        del self._exposed_patients[position]
+        del self._exposed_values[position]
+        self.items_changed(position, 1, 0)
+
+    def reset_pages(self) -> None:
+        """Forget the loaded pages after the exposed patients changed.
+
+        The page after the exposed patients starts after the last exposed
+            patient of the previous page, see get_page().
+        """
+        self._pages.clear()
+        self._page_start_keys = {0: None}
+
+        for page_number in range(
+            1, self._exposed_count // self.page_size + 1
+        ):
+            last_patient: Patient = self._exposed_patients[
+                page_number * self.page_size - 1
+            ]
+            self._page_start_keys[page_number] = last_patient.get_sort_key(
+                self.sort_column
+            )
+
+
+class PatientSearcher:
+    """Search patients in a background thread while the user types.
+
+    Searches are debounced: search() only starts a search after no other
+        search was requested for SEARCH_DELAY ms. Every search() supersedes
+        all previous ones. A superseded search that is already running is
+        interrupted and results of superseded searches are discarded, so the
+        callback only ever receives the results of the latest search.
+
+    The thread has its own database connection, the shared connection must
+        only be used in the main thread.
+    """
+
+    generation: int
+
+    def __init__(
+        self,
+        callback: Callable[[List[Patient], int], None],
+        delay: int = SEARCH_DELAY,
+    ):
+        """Create a new PatientSearcher and start its thread.
+
+        Args:
+            callback (Callable[[List[Patient], int], None]): Called in the
+                main thread with the first page of patients found by the
+                latest search and the number of all patients found
+            delay (int, optional): How many ms to wait for another search
+                request before searching. Defaults to SEARCH_DELAY
+        """
+        self.callback = callback
+        self.delay = delay
+
+        self.generation = 0
+
+        self._timeout_id: Optional[int] = None
+        self._pending_request: Optional[Tuple[Any, ...]] = None
+
+        self._requests: "queue.Queue[Optional[Tuple[Any, ...]]]" = (
+            queue.Queue()
+        )
+        self._connection: Optional[sqlite3.Connection] = None
+        self._running_generation: Optional[int] = None
+        self._lock: Lock = Lock()
+
+        # The worker's connection doesn't migrate the database
+        database_util.get_connection()
+
+        self._thread: Thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def search(
+        self,
+        query: Optional[str],
+        sort_column: Optional[str] = "last_name",
+        reverse: bool = False,
+    ) -> None:
+        """Request a search for the first page of patients matching a query.
+
+        Must be called in the main thread.
+
+        Args:
+            query (str, optional): The query, see Patient.get_page()
+            sort_column (str, optional): See Patient.get_page(). Defaults to
+                "last_name"
+            reverse (bool, optional): See Patient.get_page(). Defaults to
+                False
+        """
+        self.cancel()
+
+        self._pending_request = (
+            self.generation,
+            query,
+            sort_column,
+            reverse,
+        )
+        self._timeout_id = GLib.timeout_add(self.delay, self._submit)
+
+    def cancel(self) -> None:
+        """Discard all requested searches.
+
+        Must be called in the main thread.
+        """
+        self.generation += 1
+
+        if self._timeout_id is not None:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = None
+
+        self._pending_request = None
+
+        with self._lock:
+            if (
+                self._connection is not None
+                and self._running_generation is not None
+            ):
+                self._connection.interrupt()
+
+    def close(self) -> None:
+        """Discard all requested searches and stop the thread."""
+        self.cancel()
+
+        self._requests.put(None)
+        self._thread.join()
+
+    def _submit(self) -> bool:
+        """Hand the pending request to the thread once the delay is over.
+
+        Returns:
+            bool: False, to not be called again by GLib
+        """
+        self._timeout_id = None
+
+        if self._pending_request is not None:
+            self._requests.put(self._pending_request)
+            self._pending_request = None
+
+        return False
+
+    def _run(self) -> None:
+        """Run requested searches until close() is called."""
+        self._connection = database_util.connect()
+
+        while True:
+            request: Optional[Tuple[Any, ...]] = self._requests.get()
+
+            if request is None:
+                break
+
+            generation, query, sort_column, reverse = request
+
+            with self._lock:
+                if generation != self.generation:
+                    continue  # Superseded while waiting in the queue
+
+                self._running_generation = generation
+
+            try:
+                patients: List[Patient] = Patient.get_page(
+                    sort_column,
+                    reverse,
+                    query=query,
+                    connection=self._connection,
+                )
+                count: int = Patient.count(query, self._connection)
+            except sqlite3.OperationalError:
+                continue  # Interrupted by cancel()
+            finally:
+                with self._lock:
+                    self._running_generation = None
+
+            GLib.idle_add(self._deliver, generation, patients, count)
+
+        with self._lock:
+            self._connection.close()
+            self._connection = None
+
+    def _deliver(
+        self, generation: int, patients: List[Patient], count: int
+    ) -> bool:
+        """Pass the results of a search to the callback if still current.
+
+        Args:
+            generation (int): The generation of the search
+            patients (List[Patient]): The first page of patients found
+            count (int): The number of all patients found
+
+        Returns:
+            bool: False, to not be called again by GLib
+        """
+        if generation == self.generation:
+            self.callback(patients, count)
+
+        return False
+
 
 if __name__ == "__main__":
     import names  # type: ignore
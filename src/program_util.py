@@ -1,27 +1,35 @@
 """Utility functions that deal with the sqlite database 'programs'."""
 
-from typing import Generator, Iterable, List, Dict, Any, Tuple
-
-import os
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
+from operator import itemgetter
 import sqlite3
-import atexit
-
-from gi.repository import GObject, Gio  # type: ignore
-
 
 try:
-    os.mkdir(os.path.expanduser("~/.liegensteuerung"))
-except FileExistsError:
-    pass
-finally:
-    os.chdir(os.path.expanduser("~/.liegensteuerung"))
+    from . import database_util
+    from .change_util import changes
+    from .identity_util import IdentityMap
+    from .model_util import RecordListModel
+except ImportError:
+    import database_util
+    from change_util import changes
+    from identity_util import IdentityMap
+    from model_util import RecordListModel
 
-DATABASE_NAME: str = "liegensteuerung.db"
 
 # Python 3.6 or higher is needed to retain dict order
 PROGRAM_COLUMNS: Dict[str, Tuple[type, str]] = {
-    "id": (int, "UNSIGNED BIG INT"),
+    "id": (int, "INTEGER PRIMARY KEY"),
     "pusher_left_distance_up": (int, "INT"),  # mm
     "pusher_left_distance_down": (int, "INT"),
     "pusher_right_distance_up": (int, "INT"),
@@ -101,79 +109,124 @@ DISPLAY_COLUMNS: Tuple[str, ...] = (
 )
 
 
-connection = sqlite3.connect(DATABASE_NAME)
+# The offset of each column in a program row, i.e. in Program.row
+COLUMN_OFFSETS: Dict[str, int] = {
+    column: offset for offset, column in enumerate(PROGRAM_COLUMNS)
+}
 
-cursor = connection.cursor()
 
-# Create tables
-cursor.execute(
-    "CREATE TABLE IF NOT EXISTS programs ("
-    + ", ".join(
-        [
-            column + " " + datatype[1]
-            for column, datatype in PROGRAM_COLUMNS.items()
-        ]
+def get_max(*columns: str) -> Callable[[Tuple[Any, ...]], Any]:
+    """Get a function that calculates the maximum of columns of a row.
+
+    Args:
+        *columns (str): The columns
+
+    Returns:
+        Callable[[Tuple[Any, ...]], Any]: The function
+    """
+    getter: Callable[[Tuple[Any, ...]], Tuple[Any, ...]] = itemgetter(
+        *[COLUMN_OFFSETS[column] for column in columns]
     )
-    + ")"
-)
 
-connection.commit()
+    return lambda row: max(getter(row))
 
-atexit.register(connection.close)
 
+def get_sum(*columns: str) -> Callable[[Tuple[Any, ...]], Any]:
+    """Get a function that calculates the sum of columns of a row.
+
+    Args:
+        *columns (str): The columns
+
+    Returns:
+        Callable[[Tuple[Any, ...]], Any]: The function
+    """
+    getter: Callable[[Tuple[Any, ...]], Tuple[Any, ...]] = itemgetter(
+        *[COLUMN_OFFSETS[column] for column in columns]
+    )
 
-class Program(GObject.Object):
-    """A Program represents a database entry for a treatment program."""
+    return lambda row: sum(getter(row))
 
-    __dict: Dict[str, Any]
 
-    def __init__(self, program_dict: Dict[str, Any], **kwargs):
+# How each of CALC_PROGRAM_COLUMNS is calculated from a program row
+CALCULATIONS: Dict[str, Callable[[Tuple[Any, ...]], Any]] = {
+    "pusher_left_distance_max": get_max(
+        "pusher_left_distance_up", "pusher_left_distance_down"
+    ),
+    "pusher_right_distance_max": get_max(
+        "pusher_right_distance_up", "pusher_right_distance_down"
+    ),
+    "push_count_sum": get_sum("push_count_up", "push_count_down"),
+    "pass_count_sum": get_sum("pass_count_up", "pass_count_down"),
+}
+
+
+# The Program object of every program id, see from_rows()
+program_map: IdentityMap = IdentityMap()
+
+
+class Program:
+    """A Program represents a database entry for a treatment program.
+
+    The program's values are kept in one tuple, in the order of
+        PROGRAM_COLUMNS. Columns are looked up by their offset, the
+        CALC_PROGRAM_COLUMNS are calculated when they are accessed. Programs
+        are plain records, see model_util.RecordListModel.
+
+    Attributes:
+        row (Tuple[Any, ...]): The values of all PROGRAM_COLUMNS
+    """
+
+    __slots__ = ("row", "__weakref__")  # __weakref__ is needed by program_map
+
+    row: Tuple[Any, ...]
+
+    def __init__(self, row: Sequence[Any]):
         """Create a new Program.
 
         This should never be manually done. To add a program to the database,
             use Program.add(). To get programs from the database, use
             Program.get_all().
 
+        Args:
+            row (Sequence[Any]): The values of all PROGRAM_COLUMNS, e.g. a
+                row of the table 'programs'
+        """
+        self.row = tuple(row)
+
+    def get_values(self) -> Tuple[Any, ...]:
+        """Get the program's values, e.g. to compare programs.
+
+        Returns:
+            Tuple[Any, ...]: The values of all PROGRAM_COLUMNS
+        """
+        return self.row
+
+    @staticmethod
+    def check_values(program_dict: Dict[str, Any]) -> None:
+        """Check that a dict has valid values for all PROGRAM_COLUMNS.
+
         Args:
             program_dict (Dict[str, Any]): A dict representing the program.
                 Keys and their corresponding expected types as in
                 PROGRAM_COLUMNS
-            **kwargs: Keyword arguments are added to program_dict
-        """
-        super().__init__()
-
-        self.__dict = dict()
 
+        Raises:
+            TypeError: If a value has the wrong type
+            ValueError: If a value is missing
+        """
         for key in PROGRAM_COLUMNS:
-            if key in program_dict:
-                if isinstance(program_dict[key], PROGRAM_COLUMNS[key][0]):
-                    self.__dict[key] = program_dict[key]
-                else:
-                    raise TypeError(
-                        f"The given program_dict has the key {key} "
-                        + f"with type {type(key).__name__} "
-                        + f"(should be: {PROGRAM_COLUMNS[key][0].__name__})"
-                    )
-            else:
+            if key not in program_dict:
                 raise ValueError(
                     f"The given program_dict is missing the key {key} "
                     + f"(type: {PROGRAM_COLUMNS[key][0].__name__})"
                 )
 
-        self.__dict["pusher_left_distance_max"] = max(
-            self.__dict["pusher_left_distance_up"],
-            self.__dict["pusher_left_distance_down"],
-        )
-        self.__dict["pusher_right_distance_max"] = max(
-            self.__dict["pusher_right_distance_up"],
-            self.__dict["pusher_right_distance_down"],
-        )
-        self.__dict["push_count_sum"] = (
-            self.__dict["push_count_up"] + self.__dict["push_count_down"]
-        )
-        self.__dict["pass_count_sum"] = (
-            self.__dict["pass_count_up"] + self.__dict["pass_count_down"]
-        )
+            if not isinstance(program_dict[key], PROGRAM_COLUMNS[key][0]):
+                raise TypeError(
+                    f"The given program_dict has the key {key} "
+                    + f"with type {type(program_dict[key]).__name__} "
+                    + f"(should be: {PROGRAM_COLUMNS[key][0].__name__})"
+                )
 
     @staticmethod
     def add(program_dict: Dict[str, Any], **kwargs) -> "Program":
@@ -182,34 +235,44 @@ class Program(GObject.Object):
         Args:
             program_dict (Dict[str, Any]): A dict representing the program.
                 Keys and their corresponding expected types as in
-                PROGRAM_COLUMNS
+                PROGRAM_COLUMNS, except for "id"
             **kwargs: Keyword arguments are added to program_dict
+
+        Raises:
+            TypeError: If a value has the wrong type
+            ValueError: If a value is missing
         """
         program_dict = program_dict.copy()
+        program_dict.update(kwargs)
 
-        program_dict["id"] = (
-            int(
-                cursor.execute("SELECT MAX(id) FROM programs").fetchone()[0]
-                or 0
-            )
-            + 1
+        value_columns: List[str] = [
+            column for column in PROGRAM_COLUMNS if column != "id"
+        ]
+
+        Program.check_values({"id": 0, **program_dict})
+
+        # programs.id is an INTEGER PRIMARY KEY, so SQLite assigns it
+        cursor: sqlite3.Cursor = database_util.execute(
+            f"INSERT INTO programs ({', '.join(value_columns)}) "
+            f"VALUES ({', '.join(['?' for _ in value_columns])})",
+            [program_dict[column] for column in value_columns],
         )
 
-        program: Program = Program(program_dict)
+        database_util.commit()
 
-        cursor.execute(
-            f"INSERT INTO programs VALUES ({', '.join(['?' for _ in PROGRAM_COLUMNS])})",
-            [program[key] for key in PROGRAM_COLUMNS],
+        program_dict["id"] = cursor.lastrowid
+
+        program: Program = Program(
+            [program_dict[column] for column in PROGRAM_COLUMNS]
         )
 
-        connection.commit()
+        program_map.add(program.id, program)
+
+        changes.emit("program-added", program)
 
         return program
 
-    def modify(
-        self,
-        **kwargs
-    ):
+    def modify(self, **kwargs):
         """Modify the program and save to the database.
 
         Python 3.6 or higher is needed to retain dict order.
@@ -221,13 +284,7 @@ class Program(GObject.Object):
             if attribute not in PROGRAM_COLUMNS:
                 raise ValueError(f"{attribute} is not a valid attribute")
 
-        print(f"""
-                UPDATE programs
-                SET {', '.join([attribute + ' = ?' for attribute in kwargs])}
-                WHERE id=?
-            """)
-
-        cursor.execute(
+        database_util.execute(
             f"""
                 UPDATE programs
                 SET {', '.join([attribute + ' = ?' for attribute in kwargs])}
@@ -239,26 +296,24 @@ class Program(GObject.Object):
             ),
         )
 
-        connection.commit()
+        database_util.commit()
 
-        self.__dict["pusher_left_distance_max"] = max(
-            self.__dict["pusher_left_distance_up"],
-            self.__dict["pusher_left_distance_down"],
-        )
-        self.__dict["pusher_right_distance_max"] = max(
-            self.__dict["pusher_right_distance_up"],
-            self.__dict["pusher_right_distance_down"],
-        )
-        self.__dict["push_count_sum"] = (
-            self.__dict["push_count_up"] + self.__dict["push_count_down"]
-        )
-        self.__dict["pass_count_sum"] = (
-            self.__dict["pass_count_up"] + self.__dict["pass_count_down"]
+        self.row = tuple(
+            [
+                kwargs.get(column, value)
+                for column, value in zip(PROGRAM_COLUMNS, self.row)
+            ]
         )
 
+        # Queries return this object from now on, even if another one was
+        # loaded before
+        program_map.add(self.id, self)
+
+        changes.emit("program-modified", self)
+
     def delete(self):
         """Delete the program from the database."""
-        cursor.execute(
+        database_util.execute(
             """
                 DELETE FROM programs
                 WHERE id=?
@@ -266,65 +321,143 @@ class Program(GObject.Object):
             (self.id,),
         )
 
-        connection.commit()
+        database_util.commit()
+
+        program_map.evict(self.id)
+
+        changes.emit("program-deleted", self)
+
+    @staticmethod
+    def from_rows(program_rows: Iterable[Sequence[Any]]) -> List["Program"]:
+        """Get the programs that rows of the table 'programs' represent.
+
+        The programs are taken from program_map, so every program is
+            represented by one object.
+
+        Args:
+            program_rows (Iterable[Sequence[Any]]): The rows, with the values
+                of all PROGRAM_COLUMNS
+
+        Returns:
+            List[Program]: The programs
+        """
+        program_map.validate()
+
+        id_offset: int = COLUMN_OFFSETS["id"]
+
+        return [
+            program_map.get_or_add(
+                program_row[id_offset], lambda: Program(program_row)
+            )
+            for program_row in program_rows
+        ]
 
     @staticmethod
     def get_all() -> Generator["Program", None, None]:
         """Yield all programs in the database."""
-        for program_row in cursor.execute(
-            "SELECT " + ", ".join(PROGRAM_COLUMNS) + " FROM programs"
-        ).fetchall():
-            program_dict = {}
-            for index, value in enumerate(program_row):
-                program_dict[list(PROGRAM_COLUMNS.keys())[index]] = value
-
-            yield Program(program_dict)
+        yield from Program.from_rows(
+            database_util.execute(
+                "SELECT " + ", ".join(PROGRAM_COLUMNS) + " FROM programs"
+            ).fetchall()
+        )
 
     @staticmethod
     def get_fitting(
-        max_left_distance: int, max_right_distance: int
+        max_left_distance: int,
+        max_right_distance: int,
+        limit: Optional[int] = None,
     ) -> Generator["Program", None, None]:
-        """Yield all programs in the database."""
-        for program_row in cursor.execute(
-            "SELECT " + ", ".join(PROGRAM_COLUMNS) + " FROM programs"
-        ).fetchall():
-            program_dict = {}
-            for index, value in enumerate(program_row):
-                program_dict[list(PROGRAM_COLUMNS.keys())[index]] = value
+        """Yield the programs that fit a patient's maximum pusher distances.
+
+        See get_fitting_rows().
+
+        Args:
+            max_left_distance (int): The maximum pusher_left_distance_max
+            max_right_distance (int): The maximum pusher_right_distance_max
+            limit (int, optional): The maximum number of programs to yield.
+                Defaults to None (all)
+        """
+        yield from Program.from_rows(
+            Program.get_fitting_rows(
+                max_left_distance, max_right_distance, limit
+            )
+        )
 
-            program: Program = Program(program_dict)
+    @staticmethod
+    def get_fitting_rows(
+        max_left_distance: int,
+        max_right_distance: int,
+        limit: Optional[int] = None,
+        connection: Optional[sqlite3.Connection] = None,
+    ) -> List[Tuple[Any, ...]]:
+        """Get the rows of the programs that fit maximum pusher distances.
+
+        The rows are in id order, as the programs always were. They are
+            found with the index on the generated columns
+            pusher_left_distance_max and pusher_right_distance_max and then
+            sorted, so only fitting programs are read. Pass the rows to
+            from_rows() in the main thread.
 
-            if (
-                program.pusher_left_distance_max <= max_left_distance
-                and program.pusher_right_distance_max <= max_right_distance
-            ):
-                yield program
+        Args:
+            max_left_distance (int): The maximum pusher_left_distance_max
+            max_right_distance (int): The maximum pusher_right_distance_max
+            limit (int, optional): The maximum number of rows to get.
+                Defaults to None (all)
+            connection (sqlite3.Connection, optional): The connection to use
+                instead of the shared one (see database_util.execute())
+
+        Returns:
+            List[Tuple[Any, ...]]: The rows, with the values of all
+                PROGRAM_COLUMNS
+        """
+        # Without the + in ORDER BY, SQLite prefers reading all programs in
+        # id order to sorting the fitting ones
+        return database_util.execute(
+            f"""
+                SELECT {", ".join(PROGRAM_COLUMNS)}
+                FROM programs
+                WHERE pusher_left_distance_max <= ?
+                    AND pusher_right_distance_max <= ?
+                ORDER BY +id
+                LIMIT ?
+            """,
+            (
+                max_left_distance,
+                max_right_distance,
+                -1 if limit is None else limit,  # Negative: no limit
+            ),
+            connection,
+        ).fetchall()
 
     @staticmethod
-    def iter_to_model(program_iter: Iterable["Program"]) -> Gio.ListStore:
-        """Convert an iterable of Program objects into a Gio.ListStore.
+    def iter_to_model(program_iter: Iterable["Program"]) -> RecordListModel:
+        """Convert an iterable of Program objects into a RecordListModel.
 
         Args:
-            program_iter (Iterable[Program]): An iterable of programs to convert
+            program_iter (Iterable[Program]): An iterable of programs to
+                convert
 
         Returns:
-            Gio.ListStore: The converted model"""
-        model: Gio.ListStore = Gio.ListStore()
+            RecordListModel: The converted model
+        """
+        return RecordListModel(Program.get_values, program_iter)
 
-        program_list: List[Program] = list(program_iter)
+    def __getitem__(self, key: str) -> Any:
+        """Get a column of the program. Syntax: Program["<column>"] ."""
+        if key in COLUMN_OFFSETS:
+            return self.row[COLUMN_OFFSETS[key]]
 
-        for program in program_list:
-            model.append(program)
+        return CALCULATIONS[key](self.row)
 
-        return model
+    def __getattr__(self, name: str) -> Any:
+        """Get a column of the program. Syntax: Program.<column> ."""
+        if name in COLUMN_OFFSETS:
+            return self.row[COLUMN_OFFSETS[name]]
 
-    def __getitem__(self, key):
-        """Get a key from the patient. Syntax: Patient["<key>""] ."""
-        return self.__dict.__getitem__(key)
+        if name in CALCULATIONS:
+            return CALCULATIONS[name](self.row)
 
-    def __getattr__(self, name):
-        """Get a key from the patient. Syntax: Patient.<key> ."""
-        return self.__dict.__getitem__(name)
+        raise AttributeError(name)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 """A page that prompts the user to register."""
 
 from typing import Union, Optional, Iterable, Any, Dict
+from functools import partial
 
 from gi.repository import GObject, Gtk  # type: ignore
 
@@ -231,41 +232,52 @@ class RegisterPage(Gtk.Box, Page, metaclass=PageClass):
             self.password_confirm_entry.get_style_context().add_class("error")
             return
 
+        username: str = self.username_entry.get_text()
+        password: str = self.password_entry.get_text()
+
         try:
+            # Hashing the passwords takes a while, don't block the main loop
             auth_util.new_user(
-                self.username_entry.get_text(),
-                self.password_entry.get_text(),
+                username,
+                password,
                 self.access_level_combobox.get_active_id(),
+                partial(self.on_registered, username, password),
                 self.get_toplevel().active_user,
                 self.get_toplevel().active_user_password,
             )
+        except ValueError as v_err:
+            self.get_toplevel().show_error(" ".join(v_err.args))
+        else:
+            self.register_button.set_sensitive(False)
 
-            clear_history: bool = False
+    def on_registered(
+        self, username: str, password: str, error: Optional[ValueError]
+    ) -> None:
+        """Continue or show an error once the new user is stored.
 
-            if self.get_toplevel().active_user is None:
-                self.get_toplevel().active_user = (
-                    self.username_entry.get_text()
-                )
-                self.get_toplevel().active_user_password = (
-                    self.password_entry.get_text()
-                )
+        Args:
+            username (str): The new user's username
+            password (str): The new user's password
+            error (ValueError, optional): Why the user wasn't added or None
+        """
+        self.register_button.set_sensitive(True)
 
-                clear_history = True
+        if error is not None:
+            self.get_toplevel().show_error(" ".join(error.args))
+            return
 
-            if self.next_page is None:
-                self.get_toplevel().go_back()
-            else:
-                self.get_toplevel().switch_page(
-                    self.next_page,
-                    *self.next_page_args,
-                    **self.next_page_kwargs
-                )
+        clear_history: bool = False
 
-            if clear_history:
-                self.get_toplevel().clear_history()
+        if self.get_toplevel().active_user is None:
+            self.get_toplevel().active_user = username
+            self.get_toplevel().active_user_password = password
 
-        except ValueError as v_err:
-            self.get_toplevel().show_error(" ".join(v_err.args))
+            clear_history = True
+
+        self.go_to_next_page()
+
+        if clear_history:
+            self.get_toplevel().clear_history()
 
     def on_accept_clicked(self, button: Gtk.Button) -> None:
         """React to the accept button being clicked.
@@ -294,58 +306,77 @@ class RegisterPage(Gtk.Box, Page, metaclass=PageClass):
                 return
 
             if (
-                self.username is not None
-                and self.get_toplevel().active_user is not None
+                self.username is None
+                or self.get_toplevel().active_user is None
             ):
-                if self.get_toplevel().active_user == self.username:
-                    auth_util.modify_password(
-                        self.username,
-                        self.get_toplevel().active_user_password,
-                        self.password_entry.get_text(),
-                    )
-                    self.get_toplevel().active_user_password = (
-                        self.password_entry.get_text()
-                    )
-                elif auth_util.get_access_level(
-                    self.get_toplevel().active_user
-                ) == "admin" or (
-                    auth_util.get_access_level(self.username) == "helper"
-                    and auth_util.get_access_level(
-                        self.get_toplevel().active_user
-                    )
-                    == "doctor"
-                ):
-                    auth_util.modify_password_from_admin(
-                        self.username,
-                        self.password_entry.get_text(),
-                        self.get_toplevel().active_user,
-                        self.get_toplevel().active_user_password,
-                    )
-                else:
-                    auth_util.modify_password(
-                        self.get_toplevel().active_user,
-                        self.get_toplevel().active_user_password,
-                        self.password_entry.get_text(),
-                    )
-                    self.get_toplevel().active_user_password = (
-                        self.password_entry.get_text()
-                    )
-            else:
                 raise ValueError(
                     "A user must be logged in to change a password"
                 )
 
-            if self.next_page is None:
-                self.get_toplevel().go_back()
+            new_password: str = self.password_entry.get_text()
+
+            # Hashing the passwords takes a while, don't block the main loop
+            if self.get_toplevel().active_user == self.username:
+                auth_util.modify_password(
+                    self.username,
+                    self.get_toplevel().active_user_password,
+                    new_password,
+                    partial(self.on_password_changed, new_password),
+                )
+            elif self.get_toplevel().session.is_admin or (
+                auth_util.get_access_level(self.username) == "helper"
+                and self.get_toplevel().session.is_doctor
+            ):
+                auth_util.modify_password_from_admin(
+                    self.username,
+                    new_password,
+                    self.get_toplevel().active_user,
+                    self.get_toplevel().active_user_password,
+                    partial(self.on_password_changed, None),
+                )
             else:
-                self.get_toplevel().switch_page(
-                    self.next_page,
-                    *self.next_page_args,
-                    **self.next_page_kwargs
+                auth_util.modify_password(
+                    self.get_toplevel().active_user,
+                    self.get_toplevel().active_user_password,
+                    new_password,
+                    partial(self.on_password_changed, new_password),
                 )
 
         except ValueError as v_err:
             self.get_toplevel().show_error(" ".join(v_err.args))
+        else:
+            self.accept_button.set_sensitive(False)
+
+    def on_password_changed(
+        self, active_user_password: Optional[str], error: Optional[ValueError]
+    ) -> None:
+        """Continue or show an error once the new password is stored.
+
+        Args:
+            active_user_password (str, optional): The logged in user's new
+                password or None if another user's password was changed
+            error (ValueError, optional): Why the password wasn't changed or
+                None
+        """
+        self.accept_button.set_sensitive(True)
+
+        if error is not None:
+            self.get_toplevel().show_error(" ".join(error.args))
+            return
+
+        if active_user_password is not None:
+            self.get_toplevel().active_user_password = active_user_password
+
+        self.go_to_next_page()
+
+    def go_to_next_page(self) -> None:
+        """Switch to next_page or go back if there is none."""
+        if self.next_page is None:
+            self.get_toplevel().go_back()
+        else:
+            self.get_toplevel().switch_page(
+                self.next_page, *self.next_page_args, **self.next_page_kwargs
+            )
 
 
 # Make RegisterPage accessible via .ui files
@@ -1,13 +1,18 @@
 """A page that prompts the user to select a patient."""
 
-from typing import Union, Optional, Any, Tuple
+from typing import Callable, Union, Optional, List, Tuple
+from functools import partial
+import sqlite3
 
 from gi.repository import GObject, Gtk  # type: ignore
 
 from .page import Page, PageClass
 
-from .patient_util import Patient
-from .patient_util import COLUMNS as PATIENT_COLUMNS
+from . import database_util
+
+from .change_util import ChangeHub, changes
+from .model_util import bind_records
+from .patient_util import Patient, PatientListModel, PatientSearcher
 from .patient_row import PatientRow, PatientHeader
 
 
@@ -41,9 +46,29 @@ class SelectPatientPage(Gtk.Box, Page, metaclass=PageClass):
         Gtk.SearchEntry, Gtk.Template.Child
     ] = Gtk.Template.Child()
 
-    sort_column: int = PATIENT_COLUMNS.index("last_name")
+    patient_scrolled_window: Union[
+        Gtk.ScrolledWindow, Gtk.Template.Child
+    ] = Gtk.Template.Child()
+
+    sort_column: str = "last_name"
     sort_reverse: bool = False
 
+    patient_model: PatientListModel
+
+    query: Optional[str] = None
+    search_pending: bool = False
+    patients_loading: bool = False
+
+    # Counts re-queries and searches, so results of outdated re-queries are
+    # discarded
+    patients_request: int = 0
+
+    # Whether patients were changed since they were queried
+    patients_changed: bool = False
+    # The foreign change count when the patients were queried, see
+    # database_util.get_foreign_change_count()
+    queried_change_count: Optional[int] = None
+
     def __init__(self, **kwargs):
         """Create a new SelectPatientPage.
 
@@ -52,17 +77,28 @@ class SelectPatientPage(Gtk.Box, Page, metaclass=PageClass):
         """
         super().__init__(**kwargs)
 
+        self.patient_model = PatientListModel()
+
+        self.patient_searcher = PatientSearcher(self.on_search_results)
+
+    def do_destroy(self) -> None:
+        """When the page is destroyed, stop the search thread."""
+        self.patient_searcher.close()
+
     def prepare(self) -> None:
         """Prepare the page to be shown."""
         self.get_toplevel().active_patient = None
 
-        self.sort_column = PATIENT_COLUMNS.index("last_name")
+        self.sort_column = "last_name"
         self.sort_reverse = False
 
         self.header_box.get_children()[1].update_sort_icons()
 
         self.patient_search_entry.set_text("")
-        self.update_patients()
+
+        # The unfiltered list is still up to date when it is shown again
+        if not self.is_up_to_date():
+            self.update_patients()
 
         self.patient_search_entry.grab_focus()
 
@@ -70,8 +106,30 @@ class SelectPatientPage(Gtk.Box, Page, metaclass=PageClass):
         """Prepare the page to be shown when returning from another page."""
         self.get_toplevel().active_patient = None
 
-        # Inefficient to re-load all patients, but everything else is more work
-        self.update_patients()
+        # Only changed patients get new rows
+        if self.patients_changed:
+            self.update_patients()
+
+    def is_up_to_date(self) -> bool:
+        """Check whether all patients are listed, unchanged since queried.
+
+        Returns:
+            bool: Whether the patients don't have to be re-queried
+        """
+        return (
+            not self.search_pending
+            and not self.patients_changed
+            and self.patient_model.query is None
+            and self.patient_model.sort_column == self.sort_column
+            and self.patient_model.reverse == self.sort_reverse
+            and self.queried_change_count
+            == database_util.get_foreign_change_count()
+        )
+
+    def unprepare(self) -> None:
+        """Prepare the page to be hidden."""
+        self.patient_searcher.cancel()
+        self.search_pending = False
 
     def do_parent_set(self, old_parent: Optional[Gtk.Widget]) -> None:
         """React to the parent being set.
@@ -90,6 +148,7 @@ class SelectPatientPage(Gtk.Box, Page, metaclass=PageClass):
         )
         self.header_box.show_all()
 
+        bind_records(self.patient_list_box, self.patient_model, PatientRow)
         self.patient_list_box.connect("row-selected", self.on_patient_selected)
 
         self.add_button.connect("clicked", self.on_add_clicked)
@@ -104,6 +163,65 @@ class SelectPatientPage(Gtk.Box, Page, metaclass=PageClass):
             "focus-out-event", self.on_unfocus_entry
         )
 
+        self.patient_scrolled_window.connect(
+            "edge-reached", self.on_edge_reached
+        )
+
+        changes.connect("patient-added", self.on_patient_added)
+        changes.connect("patient-modified", self.on_patient_modified)
+        changes.connect("patient-deleted", self.on_patient_deleted)
+
+    def on_patient_added(self, hub: ChangeHub, patient: Patient) -> None:
+        """Insert the row of an added patient.
+
+        Args:
+            hub (ChangeHub): The hub that emitted the change
+            patient (Patient): The added patient
+        """
+        self.apply_change(self.patient_model.apply_added, patient)
+
+    def on_patient_modified(self, hub: ChangeHub, patient: Patient) -> None:
+        """Move and update the row of a modified patient.
+
+        Args:
+            hub (ChangeHub): The hub that emitted the change
+            patient (Patient): The modified patient
+        """
+        self.apply_change(self.patient_model.apply_modified, patient)
+
+    def on_patient_deleted(self, hub: ChangeHub, patient: Patient) -> None:
+        """Remove the row of a deleted patient.
+
+        Args:
+            hub (ChangeHub): The hub that emitted the change
+            patient (Patient): The deleted patient
+        """
+        self.patient_model.apply_deleted(patient)
+
+        if self.search_pending:
+            self.patients_changed = True
+
+    def apply_change(
+        self, apply: Callable[[Patient], bool], patient: Patient
+    ) -> None:
+        """Apply a change to the listed patients or remember to re-query.
+
+        Where an added or modified patient belongs depends on the query, so
+        with a query (or while patients are queried) the patients are
+        re-queried when the list is shown again.
+
+        Args:
+            apply (Callable[[Patient], bool]): The PatientListModel method
+                that applies the change
+            patient (Patient): The added or modified patient
+        """
+        # A running query may not see the change
+        if self.search_pending or not apply(patient):
+            self.patients_changed = True
+            return
+
+        self.patient_list_box.show_all()
+
     def on_patient_selected(self, list_box: Gtk.ListBox, row: Gtk.ListBoxRow):
         """React to the user selecting a patient.
 
@@ -128,29 +246,98 @@ class SelectPatientPage(Gtk.Box, Page, metaclass=PageClass):
         self.get_toplevel().switch_page("edit_patient")
 
     def update_patients(self) -> None:
-        """Re-query and re-sort all patients."""
-        if self.patient_search_entry.get_text() == "":
-            self.patient_list_box.bind_model(
-                Patient.iter_to_model(
-                    Patient.get_all(
-                        sort_key_func=self.sort_key, reverse=self.sort_reverse
-                    )
-                ),
-                PatientRow,
-            )
-        else:
-            self.patient_list_box.bind_model(
-                Patient.iter_to_model(
-                    Patient.get_for_query(
-                        self.patient_search_entry.get_text(),
-                        sort_key_func=self.sort_key,
-                        reverse=self.sort_reverse,
-                    )
+        """Re-query the first page of patients in the background.
+
+        More pages are exposed when the user scrolls to the end of the list.
+        """
+        # A running search would overwrite the result
+        self.patient_searcher.cancel()
+        self.search_pending = True
+
+        self.patients_changed = False
+        self.patients_request += 1
+        self.queried_change_count = database_util.get_foreign_change_count()
+
+        self.query = self.patient_search_entry.get_text() or None
+
+        query: Optional[str] = self.query
+        sort_column: str = self.sort_column
+        reverse: bool = self.sort_reverse
+
+        def load(
+            connection: sqlite3.Connection,
+        ) -> Tuple[List[Patient], int]:
+            return (
+                Patient.get_page(
+                    sort_column, reverse, query=query, connection=connection
                 ),
-                PatientRow,
+                Patient.count(query, connection),
             )
 
-        self.patient_list_box.show_all()
+        database_util.read(
+            load,
+            partial(self.on_patients_loaded, self.patients_request),
+            partial(self.on_patients_failed, self.patients_request),
+        )
+
+    def on_patients_loaded(
+        self, request: int, result: Tuple[List[Patient], int]
+    ) -> None:
+        """Show the re-queried patients if no newer request was made.
+
+        Args:
+            request (int): The patients_request the patients were queried for
+            result (Tuple[List[Patient], int]): The first page of patients
+                and the number of all patients
+        """
+        if request == self.patients_request:
+            self.on_search_results(*result)
+
+    def on_patients_failed(self, request: int, error: Exception) -> None:
+        """Report a failed re-query and stop waiting for it.
+
+        Args:
+            request (int): The patients_request the patients were queried for
+            error (Exception): The error
+        """
+        if request == self.patients_request:
+            self.search_pending = False
+
+        database_util.report_error(error)
+
+    def load_next_patients(self) -> None:
+        """Show the next page of patients."""
+        # The model still holds the previous search's patients
+        if self.search_pending or self.patients_loading:
+            return
+
+        self.patients_loading = True
+        self.patient_model.load_more(self.on_next_patients_loaded)
+
+    def on_next_patients_loaded(self, exposed: bool) -> None:
+        """Show the rows of the patients exposed by load_next_patients().
+
+        Args:
+            exposed (bool): Whether more patients were exposed
+        """
+        self.patients_loading = False
+
+        if exposed:
+            self.patient_list_box.show_all()
+
+    def on_edge_reached(
+        self, scrolled_window: Gtk.ScrolledWindow, position: Gtk.PositionType
+    ) -> None:
+        """React to the patient list being scrolled to one of its edges.
+
+        Load the next page of patients if the end of the list was reached.
+
+        Args:
+            scrolled_window (Gtk.ScrolledWindow): The scrolled window
+            position (Gtk.PositionType): The edge that was reached
+        """
+        if position == Gtk.PositionType.BOTTOM:
+            self.load_next_patients()
 
     def on_search_changed(self, search_entry: Gtk.SearchEntry) -> None:
         """React to the search query being changed by the user.
@@ -159,28 +346,43 @@ class SelectPatientPage(Gtk.Box, Page, metaclass=PageClass):
             search_entry (Gtk.SearchEntry): The search entry that the user
                 entered the query into
         """
-        self.update_patients()
+        self.query = search_entry.get_text() or None
+        self.search_pending = True
+        self.patients_request += 1
+        self.queried_change_count = database_util.get_foreign_change_count()
+
+        # Searching in the main thread would stall typing
+        self.patient_searcher.search(
+            self.query, self.sort_column, self.sort_reverse
+        )
 
-    def sort_key(self, patient_row: Tuple[Any, ...]) -> Any:
-        """Return a sort key for a patient row.
+    def on_search_results(self, patients: List[Patient], count: int) -> None:
+        """Show the results of the latest search.
 
-        Args:
-            patient_row (Tuple[Any, ...]): The patient row
+        Only the rows of patients that weren't shown before are created.
 
-        Returns:
-            Any: An object by which patient_row can be sorted
+        Args:
+            patients (List[Patient]): The first page of patients found
+            count (int): The number of all patients found
         """
-        return patient_row[self.sort_column]
+        self.search_pending = False
+
+        self.patient_model.set_query(
+            self.query, self.sort_column, self.sort_reverse, patients, count
+        )
+
+        self.patient_list_box.show_all()
 
-    def set_sort(self, column_index: int, reverse: bool) -> None:
+    def set_sort(self, column: str, reverse: bool) -> None:
         """Set the sort parameters and sort the patients if necessary.
 
         Args:
-            column_index (int): The index of the column by which to sort
+            column (str): The column by which to sort, one of
+                patient_util.DISPLAY_COLUMNS
             reverse (bool): Whether to reverse the sorted rows
         """
-        if reverse != self.sort_reverse or column_index != self.sort_column:
-            self.sort_column = column_index
+        if reverse != self.sort_reverse or column != self.sort_column:
+            self.sort_column = column
             self.sort_reverse = reverse
             self.update_patients()
 
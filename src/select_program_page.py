@@ -1,13 +1,19 @@
 """A page that prompts the user to select a program."""
 
-from typing import Union, Optional
+from typing import Any, List, Union, Optional, Tuple
+
+from functools import partial
+import bisect
 
 from gi.repository import GObject, Gtk  # type: ignore
 
 from .page import Page, PageClass
 
 from . import auth_util
+from . import database_util
 
+from .change_util import ChangeHub, changes
+from .model_util import RecordListModel, bind_records, update_model
 from .program_util import Program
 from .program_row import ProgramRow, ProgramHeader
 
@@ -46,6 +52,15 @@ class SelectProgramPage(Gtk.Box, Page, metaclass=PageClass):
         Gtk.Label, Gtk.Template.Child
     ] = Gtk.Template.Child()
 
+    max_left: Optional[int] = None
+    max_right: Optional[int] = None
+
+    # Counts program queries, so results of outdated ones are discarded
+    programs_request: int = 0
+    # The foreign change count when the programs were queried, see
+    # database_util.get_foreign_change_count()
+    queried_change_count: Optional[int] = None
+
     def __init__(self, **kwargs):
         """Create a new SelectProgramPage.
 
@@ -54,6 +69,10 @@ class SelectProgramPage(Gtk.Box, Page, metaclass=PageClass):
         """
         super().__init__(**kwargs)
 
+        self.program_model: RecordListModel = RecordListModel(
+            Program.get_values
+        )
+
     def prepare(self, max_left: int, max_right: int) -> None:
         """Prepare the page to be shown.
 
@@ -64,33 +83,58 @@ class SelectProgramPage(Gtk.Box, Page, metaclass=PageClass):
         self.end_pos_left_label.set_text(f"{max_left} mm")
         self.end_pos_right_label.set_text(f"{max_right} mm")
 
-        self.max_left, self.max_right = max_left, max_right
-
-        self.update_programs()
+        # The same programs fit, unless another program changed them (own
+        # changes are applied by on_program_changed())
+        if (
+            (max_left, max_right) != (self.max_left, self.max_right)
+            or self.queried_change_count
+            != database_util.get_foreign_change_count()
+        ):
+            self.max_left, self.max_right = max_left, max_right
+            self.update_programs()
 
-        is_admin: bool = (
-            self.get_toplevel().active_user is not None
-            and auth_util.get_access_level(self.get_toplevel().active_user)
-            == "admin"
-        )
+        session: Optional[auth_util.Session] = self.get_toplevel().session
+        is_admin: bool = session is not None and session.is_admin
 
         self.add_button.set_visible(is_admin)
 
     def prepare_return(self) -> None:
-        """Prepare the page to be shown when returning from another page."""
-        self.get_toplevel().active_program = None
+        """Prepare the page to be shown when returning from another page.
 
-        # Inefficient to re-load all programs, but everything else is more work
-        self.update_programs()
+        Programs that were changed in the meantime are already updated, see
+        on_program_changed().
+        """
+        self.get_toplevel().active_program = None
 
     def update_programs(self) -> None:
-        """Re-query all programs."""
-        self.program_list_box.bind_model(
-            Program.iter_to_model(
-                Program.get_fitting(self.max_left, self.max_right)
+        """Re-query all fitting programs in the background."""
+        self.programs_request += 1
+        self.queried_change_count = database_util.get_foreign_change_count()
+
+        max_left: int = self.max_left
+        max_right: int = self.max_right
+
+        database_util.read(
+            lambda connection: Program.get_fitting_rows(
+                max_left, max_right, connection=connection
             ),
-            ProgramRow,
+            partial(self.on_programs_loaded, self.programs_request),
         )
+
+    def on_programs_loaded(
+        self, request: int, program_rows: List[Tuple[Any, ...]]
+    ) -> None:
+        """Update the changed rows once the programs are re-queried.
+
+        Args:
+            request (int): The programs_request the programs were queried
+                for. If it is outdated, the programs are discarded
+            program_rows (List[Tuple[Any, ...]]): The rows of the programs
+        """
+        if request != self.programs_request:
+            return
+
+        update_model(self.program_model, Program.from_rows(program_rows))
         self.program_list_box.show_all()
 
     def do_parent_set(self, old_parent: Optional[Gtk.Widget]) -> None:
@@ -110,10 +154,61 @@ class SelectProgramPage(Gtk.Box, Page, metaclass=PageClass):
         )
         self.header_box.show_all()
 
+        bind_records(self.program_list_box, self.program_model, ProgramRow)
         self.program_list_box.connect("row-selected", self.on_program_selected)
 
         self.add_button.connect("clicked", self.on_add_clicked)
 
+        changes.connect("program-added", self.on_program_changed)
+        changes.connect("program-modified", self.on_program_changed)
+        changes.connect("program-deleted", self.on_program_deleted)
+
+    def on_program_changed(self, hub: ChangeHub, program: Program) -> None:
+        """Move an added or modified program to its place in the list.
+
+        Args:
+            hub (ChangeHub): The hub that emitted the change
+            program (Program): The added or modified program
+        """
+        self.remove_program(program)
+
+        if (
+            self.max_left is not None
+            and self.max_right is not None
+            and program.pusher_left_distance_max <= self.max_left
+            and program.pusher_right_distance_max <= self.max_right
+        ):
+            # Program.get_fitting() lists the programs in id order
+            ids: List[int] = [
+                listed_program.id
+                for listed_program in self.program_model.records
+            ]
+
+            self.program_model.splice(
+                bisect.bisect(ids, program.id), 0, [program]
+            )
+            self.program_list_box.show_all()
+
+    def on_program_deleted(self, hub: ChangeHub, program: Program) -> None:
+        """Remove a deleted program from the list.
+
+        Args:
+            hub (ChangeHub): The hub that emitted the change
+            program (Program): The deleted program
+        """
+        self.remove_program(program)
+
+    def remove_program(self, program: Program) -> None:
+        """Remove a program from the list if it is listed.
+
+        Args:
+            program (Program): The program
+        """
+        for position, listed_program in enumerate(self.program_model.records):
+            if listed_program.id == program.id:
+                self.program_model.splice(position, 1, [])
+                return
+
     def on_program_selected(self, list_box: Gtk.ListBox, row: Gtk.ListBoxRow):
         """React to the user selecting a program.
 
@@ -1,6 +1,6 @@
 """A page that offers the user to manually set up the motors."""
 
-from typing import Optional, Union
+from typing import Any, Callable, Optional, Union
 
 from gi.repository import GObject  # type: ignore
 from gi.repository import GLib  # type: ignore
@@ -14,9 +14,24 @@ import cv2  # type: ignore
 import numpy  # type: ignore
 
 from threading import Thread  # type: ignore
+from functools import partial
+
+import time
 
 from .page import Page, PageClass
 
+from . import camera_util
+from . import media_util
+from . import patient_util
+from . import vision_util
+
+
+PREVIEW_FPS: float = 60
+
+# How many reads in a row may fail before the camera is considered gone
+# (e.g. unplugged)
+MAX_FAILED_READS: int = 30
+
 
 @Gtk.Template(resource_path="/de/linusmathieu/Liegensteuerung/set_up_page.ui")
 class SetupPage(Gtk.Box, Page, metaclass=PageClass):
@@ -29,7 +44,25 @@ class SetupPage(Gtk.Box, Page, metaclass=PageClass):
         camera_drawing_area (Gtk.DrawingArea or Gtk.Template.Child): The
             Gtk.DrawingArea to display the camera output in.
         camera_frame (numpy.ndarray): The current frame as an numpy.ndarray
+        frame_number (int): How many frames have been stored in camera_frame.
+            Used to only redraw when there is a new frame
+        frame_time (float): The time.monotonic() at which camera_frame was
+            read from the camera
+        video_capture_factory (Callable[[], Any]): Opens the frame source.
+            Anything with the cv2.VideoCapture interface works, e.g. for
+            benchmarks (see camera_benchmark)
+        preview_fps (float): The rate at which the preview is updated. Lowered
+            while the scene is static
         running (bool): Whether a camera output should be shown
+        pusher_positions (numpy.ndarray, optional): The left and right pusher
+            positions in mm as estimated by the vision stage or None if the
+            vision stage is disabled or hasn't found the markers
+        media_recorder (media_util.MediaRecorder): Records snapshots and clips
+            of the setup position in the background
+        clip_end_time (float, optional): The time.monotonic() at which the
+            clip that is being recorded ends or None if no clip is recorded
+        mismatch_reported (bool): Whether an error about the camera and the
+            PLC disagreeing on the pusher positions is shown
     """
 
     __gtype_name__ = "SetupPage"
@@ -48,12 +81,25 @@ class SetupPage(Gtk.Box, Page, metaclass=PageClass):
     save_position_button: Union[Gtk.Template.Child, Gtk.Button] = Gtk.Template.Child()
 
     camera_frame: numpy.ndarray = None
+    frame_number: int = 0
+    frame_time: float = 0.0
+    preview_fps: float = PREVIEW_FPS
     running: bool = True
     cam_available: bool = True
 
+    pusher_positions: Optional[numpy.ndarray] = None
+
+    clip_end_time: Optional[float] = None
+
+    mismatch_reported: bool = False
+
     end_value_left: int = 0
     end_value_right: int = 0
 
+    video_capture_factory: Callable[[], Any] = staticmethod(
+        camera_util.open_capture
+    )
+
     def __init__(self, **kwargs):
         """Create a new SetupPage.
 
@@ -62,6 +108,8 @@ class SetupPage(Gtk.Box, Page, metaclass=PageClass):
         """
         super().__init__(**kwargs)
 
+        self.media_recorder = media_util.MediaRecorder()
+
     def prepare(self) -> None:
         """Prepare the page to be shown."""
         self.running = True
@@ -86,16 +134,85 @@ class SetupPage(Gtk.Box, Page, metaclass=PageClass):
         """Prepare the page to be hidden."""
         self.running = False
 
+        if self.clip_end_time is not None:
+            self.clip_end_time = None
+            self.media_recorder.stop_clip()
+
     def read_camera_input_loop(self) -> None:
         """Try to store an image from the webcam in camera_frame.
 
         This only happens if running is True and a webcam could be found.
+        The webcam is opened in the best mode it supports (see camera_util).
+        While the scene is static, frames are only read at a lower rate.
+        If MAX_FAILED_READS reads in a row fail, the camera is considered
+        gone and cam_available is set to False.
         """
-        video_capture = cv2.VideoCapture(0)
+        video_capture = self.video_capture_factory()
+
+        motion_detector = camera_util.MotionDetector()
+
+        pusher_tracker: Optional[vision_util.PusherTracker] = None
+        vision_settings = vision_util.load_settings()
+
+        # The result of the last cross-check with the PLC
+        positions_matched: bool = True
+
+        if vision_settings.enabled:
+            try:
+                pusher_tracker = vision_util.PusherTracker(vision_settings)
+            except ValueError as v_err:
+                print(v_err)
+
+        next_clip_frame_time: float = 0.0
+        failed_reads: int = 0
 
         if video_capture.isOpened():  # try to get the first frame
+            self.cam_available = True
+
             while self.running:
                 return_value, new_camera_frame = video_capture.read()
+                frame_time: float = time.monotonic()
+
+                if not return_value:
+                    failed_reads += 1
+
+                    if failed_reads >= MAX_FAILED_READS:
+                        print("Cam stopped returning frames.")
+                        self.on_camera_lost()
+                        break
+
+                    # A camera that stopped returning frames usually fails
+                    # right away, don't spin while waiting for it
+                    time.sleep(1 / motion_detector.settings.static_fps)
+                    continue
+
+                failed_reads = 0
+
+                if motion_detector.update(new_camera_frame):
+                    self.preview_fps = motion_detector.settings.static_fps
+                else:
+                    self.preview_fps = PREVIEW_FPS
+
+                if pusher_tracker is not None:
+                    self.pusher_positions = pusher_tracker.update(
+                        new_camera_frame
+                    )
+
+                    # Only changes are reported, not every check
+                    if pusher_tracker.is_check_due():
+                        positions_match: bool = (
+                            pusher_tracker.check_against_plc()
+                        )
+
+                        if positions_match and not positions_matched:
+                            GLib.idle_add(self.on_position_match)
+                        elif not positions_match and positions_matched:
+                            GLib.idle_add(
+                                self.on_position_mismatch,
+                                pusher_tracker.deviations,
+                            )
+
+                        positions_matched = positions_match
 
                 try:
                     # Some operations like color correction
@@ -104,14 +221,75 @@ class SetupPage(Gtk.Box, Page, metaclass=PageClass):
                     )
 
                     self.camera_frame = new_camera_frame
+                    self.frame_time = frame_time
+                    self.frame_number += 1
                 except cv2.error:
                     pass
+                else:
+                    next_clip_frame_time = self.record_clip_frame(
+                        new_camera_frame, next_clip_frame_time
+                    )
+
+                if motion_detector.static:
+                    # Reading the next frame right away would decode frames
+                    # that aren't shown. Motion is still detected after at
+                    # most one static frame interval.
+                    time.sleep(1 / motion_detector.settings.static_fps)
         else:
             print("No cam found.")
-            self.cam_available = False
+            self.on_camera_lost()
 
         video_capture.release()
 
+    def on_camera_lost(self) -> None:
+        """Show that no camera is available.
+
+        Can be called from the reading thread.
+        """
+        self.cam_available = False
+        self.camera_frame = None
+
+        GLib.idle_add(self.camera_drawing_area.queue_draw)
+
+    def record_clip_frame(
+        self, camera_frame: numpy.ndarray, next_clip_frame_time: float
+    ) -> float:
+        """Add a frame to the clip that is being recorded, if it is due.
+
+        Frames are added at the clip frame rate and the clip is finished when
+            clip_end_time has passed.
+
+        Args:
+            camera_frame (numpy.ndarray): The RGB frame
+            next_clip_frame_time (float): The time.monotonic() at which the
+                next frame is due
+
+        Returns:
+            float: The time.monotonic() at which the frame after this one is
+                due
+        """
+        clip_end_time: Optional[float] = self.clip_end_time
+
+        if clip_end_time is None:
+            return next_clip_frame_time
+
+        now: float = time.monotonic()
+
+        if now >= clip_end_time:
+            self.clip_end_time = None
+            self.media_recorder.stop_clip()
+
+        elif now >= next_clip_frame_time:
+            self.media_recorder.add_frame(camera_frame)
+
+            return max(
+                next_clip_frame_time
+                + 1 / self.media_recorder.settings.clip_fps,
+                now,
+            )
+
+        return next_clip_frame_time
+
     def do_parent_set(self, old_parent: Optional[Gtk.Widget]) -> None:
         """React to the parent being set.
 
@@ -134,18 +312,37 @@ class SetupPage(Gtk.Box, Page, metaclass=PageClass):
 
         self.save_position_button.connect("clicked", self.on_save_pos_clicked)
 
-    def display_camera_input_loop(self) -> None:
-        """Read from camera_frame to display the most recent webcam image."""
-        if self.camera_frame is not None:
+    def display_camera_input_loop(
+        self, drawn_frame_number: Optional[int] = None
+    ) -> None:
+        """Read from camera_frame to display the most recent webcam image.
+
+        Args:
+            drawn_frame_number (int, optional): The frame_number of the frame
+                that was drawn last. The drawing area is only redrawn if there
+                is a newer frame
+        """
+        frame_number: int = self.frame_number
+
+        if (
+            self.camera_frame is not None
+            and frame_number != drawn_frame_number
+        ):
             self.camera_drawing_area.queue_draw()
 
         if self.running:
-            GLib.timeout_add(1000 / 60, self.display_camera_input_loop)
+            GLib.timeout_add(
+                int(1000 / self.preview_fps),
+                self.display_camera_input_loop,
+                frame_number,
+            )
 
     def do_destroy(self) -> None:
         """When the window is destroyed, stop all threads and quit."""
         self.running = False
 
+        self.media_recorder.close()
+
     def on_draw_camera_drawing_area(
         self, widget: Gtk.Widget, cr: cairo.Context
     ) -> None:
@@ -191,7 +388,13 @@ class SetupPage(Gtk.Box, Page, metaclass=PageClass):
         Args:
             button (Gtk.Button): The button that was clicked
         """
-        self.get_toplevel().switch_page("select_program", 90, 90)  # TODO: Use actual values
+        if self.end_value_left and self.end_value_right:
+            self.get_toplevel().switch_page(
+                "select_program", self.end_value_left, self.end_value_right
+            )
+        else:
+            # TODO: Use actual values
+            self.get_toplevel().switch_page("select_program", 90, 90)
 
     def on_save_pos_clicked(self, button: Gtk.Button) -> None:
         """React to the "Save position" button being clicked.
@@ -199,8 +402,102 @@ class SetupPage(Gtk.Box, Page, metaclass=PageClass):
         Args:
             button (Gtk.Button): The button that was clicked
         """
+        pusher_positions: Optional[numpy.ndarray] = self.pusher_positions
+
+        if pusher_positions is not None:
+            self.end_value_left, self.end_value_right = (
+                int(round(position)) for position in pusher_positions
+            )
+
+        self.record_setup_position()
+
         self.ok_button.set_sensitive(True)
 
+    def record_setup_position(self) -> None:
+        """Record the setup position and link it to the treatment entry.
+
+        A snapshot is always taken, a clip only if a clip duration is
+            configured. Both files have the same name (except the
+            extension), only the snapshot is linked to the treatment entry,
+            once it has been written.
+        """
+        window: Gtk.Window = self.get_toplevel()
+        camera_frame: Optional[numpy.ndarray] = self.camera_frame
+
+        if (
+            camera_frame is None
+            or window.active_patient is None
+            or window.treatment_timestamp is None
+        ):
+            return
+
+        name: str = (
+            f"{window.active_patient.patient_id}_{window.treatment_timestamp}"
+        )
+
+        snapshot_path: str = media_util.get_media_path(
+            name, media_util.SNAPSHOT_EXTENSION
+        )
+
+        self.media_recorder.snapshot(
+            camera_frame,
+            snapshot_path,
+            partial(
+                self.on_snapshot_written,
+                window.active_patient,
+                window.treatment_timestamp,
+            ),
+        )
+
+        if self.media_recorder.settings.clip_duration > 0:
+            self.media_recorder.start_clip(
+                media_util.get_media_path(name, media_util.CLIP_EXTENSION),
+                len(camera_frame[0]),
+                len(camera_frame),
+            )
+            self.clip_end_time = (
+                time.monotonic() + self.media_recorder.settings.clip_duration
+            )
+
+    def on_snapshot_written(
+        self, patient: patient_util.Patient, timestamp: int, path: str
+    ) -> bool:
+        """Link a written snapshot to its treatment entry.
+
+        Args:
+            patient (patient_util.Patient): The treated patient
+            timestamp (int): The UNIX timestamp of the treatment entry
+            path (str): The path of the snapshot
+
+        Returns:
+            bool: False, to not be called again by GLib
+        """
+        patient.set_treatment_media(timestamp, path)
+
+        return False
+
+    def on_position_mismatch(self, deviations: numpy.ndarray) -> None:
+        """React to the camera disagreeing with the PLC's pusher positions.
+
+        Args:
+            deviations (numpy.ndarray): How many mm the left and right pusher
+                positions differ
+        """
+        if self.running:
+            self.get_toplevel().show_error(
+                "Die Pusherpositionen der Kamera weichen von der Steuerung ab "
+                f"(L: {deviations[0]:.0f} mm, R: {deviations[1]:.0f} mm)"
+            )
+            self.mismatch_reported = True
+
+    def on_position_match(self) -> None:
+        """React to the camera agreeing with the PLC's pusher positions again.
+
+        Hides the error shown by on_position_mismatch().
+        """
+        if self.mismatch_reported:
+            self.get_toplevel().error_bar.set_revealed(False)
+            self.mismatch_reported = False
 
 
 GObject.type_ensure(SetupPage)
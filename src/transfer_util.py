@@ -0,0 +1,643 @@
+"""Import and export patients, programs and treatments in bulk.
+
+Rows are streamed as CSV or JSON Lines (one JSON object per line), with one
+file per table and the table's columns as fields. Exports read the database
+row by row, so they need constant memory however big the tables are.
+
+Imports insert chunks of CHUNK_SIZE rows with executemany(), each chunk in
+one transaction, so a failed import keeps the chunks before the failing
+one. Imported patients and programs get new ids, references to them in
+imported treatments are changed to the new ids. Treatments must therefore
+be imported together with their patients: treatments of patients that are
+not imported are skipped, programs that are not imported are removed from
+their treatments (like when a program is deleted).
+
+Rows that are already in the database are not imported again, references
+to them are changed to the existing row. Rows are the same if they have the
+same DUPLICATE_COLUMNS.
+
+Users are not transferred, their password hashes don't belong in exports.
+
+Usage (from the installation's pkgdatadir):
+    python3 -m liegensteuerung.transfer_util export \\
+        --patients patients.csv --treatments treatments.jsonl
+    python3 -m liegensteuerung.transfer_util import \\
+        --programs programs.csv --patients patients.csv \\
+        --treatments treatments.jsonl
+"""
+
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    TextIO,
+    Tuple,
+)
+
+import sys
+import csv
+import json
+import argparse
+import itertools
+
+import sqlite3
+
+from . import database_util
+
+
+# The tables that can be transferred, by the name used for them here
+TABLES: Dict[str, str] = {
+    "programs": "programs",
+    "patients": "patients",
+    "treatments": "treatment_entries",
+}
+
+# Referenced tables first, so imported references can be changed to new ids
+IMPORT_ORDER: Tuple[str, ...] = ("programs", "patients", "treatments")
+
+# The id column of tables whose rows get new ids when they are imported
+KEY_COLUMNS: Dict[str, str] = {"programs": "id", "patients": "id"}
+
+# The columns that identify a row, None for all columns except the id
+DUPLICATE_COLUMNS: Dict[str, Optional[Tuple[str, ...]]] = {
+    "programs": None,
+    "patients": ("first_name", "last_name", "birthday"),
+    "treatments": ("patient_id", "timestamp"),
+}
+
+# How many rows are inserted in one transaction
+CHUNK_SIZE: int = 5000
+
+FORMATS: Tuple[str, ...] = ("csv", "jsonl")
+
+
+class Reference(NamedTuple):
+    """A column that holds the id of a row in another table.
+
+    Attributes:
+        table (str): The other table, one of TABLES
+        required (bool): Whether rows whose reference is missing or can't be
+            resolved are skipped (or the reference is removed)
+    """
+
+    table: str
+    required: bool
+
+
+REFERENCES: Dict[str, Dict[str, Reference]] = {
+    "treatments": {
+        "patient_id": Reference("patients", required=True),
+        "program_id": Reference("programs", required=False),
+    },
+}
+
+
+class ImportResult(NamedTuple):
+    """How many rows of a file were imported.
+
+    Attributes:
+        imported (int): Rows that were inserted
+        duplicates (int): Rows that were already in the database
+        skipped (int): Rows that reference rows that weren't imported or
+            lack a required reference
+    """
+
+    imported: int = 0
+    duplicates: int = 0
+    skipped: int = 0
+
+
+def get_columns(connection: sqlite3.Connection, name: str) -> List[str]:
+    """Get the columns of a table that are transferred.
+
+    Generated columns are left out, SQLite computes them.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the database
+        name (str): The table's name, one of TABLES
+
+    Returns:
+        List[str]: The column names
+    """
+    return list(database_util.get_column_definitions(connection, TABLES[name]))
+
+
+def convert(value: Any, declared_type: str, file_format: str) -> Any:
+    """Convert a value that was read from a file to a column's type.
+
+    Values from CSV files are all strings and CSV can't tell NULL from an
+        empty string, so empty strings mean NULL for columns that don't hold
+        text. Text stays as it is, the program saves empty text rather than
+        NULL anyway. In JSON Lines files, only null means NULL.
+
+    Args:
+        value (Any): The value
+        declared_type (str): The column's declared type
+        file_format (str): The format of the file, one of FORMATS
+
+    Returns:
+        Any: The value as stored by SQLite
+
+    Raises:
+        ValueError: if the value can't be converted
+    """
+    if value is None:
+        return None
+
+    declared_type = declared_type.upper()
+
+    if "INT" in declared_type:
+        return (
+            None if file_format == "csv" and value == "" else int(value)
+        )
+
+    elif any(name in declared_type for name in ("REAL", "FLOA", "DOUB")):
+        return (
+            None if file_format == "csv" and value == "" else float(value)
+        )
+
+    else:
+        return str(value)
+
+
+def export_rows(
+    connection: sqlite3.Connection, name: str
+) -> Iterator[Dict[str, Any]]:
+    """Yield all rows of a table.
+
+    The rows are read as they are yielded, in one consistent snapshot.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the database
+        name (str): The table's name, one of TABLES
+
+    Yields:
+        Dict[str, Any]: The values of a row by column name
+    """
+    columns: List[str] = get_columns(connection, name)
+
+    for row in connection.execute(
+        f"SELECT {', '.join(columns)} FROM {TABLES[name]} ORDER BY rowid"
+    ):
+        yield dict(zip(columns, row))
+
+
+def write_rows(
+    rows: Iterable[Dict[str, Any]],
+    columns: List[str],
+    output_file: TextIO,
+    file_format: str,
+) -> int:
+    """Write rows to a file.
+
+    Args:
+        rows (Iterable[Dict[str, Any]]): The rows, e.g. from export_rows()
+        columns (List[str]): The columns to write, in order
+        output_file (TextIO): The file
+        file_format (str): One of FORMATS
+
+    Returns:
+        int: How many rows were written
+    """
+    count: int = 0
+
+    if file_format == "csv":
+        writer = csv.DictWriter(output_file, columns)
+        writer.writeheader()
+
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+
+    else:
+        for row in rows:
+            output_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+
+    return count
+
+
+def read_rows(
+    input_file: TextIO, file_format: str
+) -> Iterator[Dict[str, Any]]:
+    """Read rows from a file.
+
+    Args:
+        input_file (TextIO): The file
+        file_format (str): One of FORMATS
+
+    Yields:
+        Dict[str, Any]: The values of a row by column name
+
+    Raises:
+        ValueError: if a JSON line isn't an object
+    """
+    if file_format == "csv":
+        yield from csv.DictReader(input_file)
+
+    else:
+        for line in input_file:
+            if not line.strip():
+                continue
+
+            row: Any = json.loads(line)
+
+            if not isinstance(row, dict):
+                raise ValueError(f"Expected a JSON object, got {line!r}")
+
+            yield row
+
+
+class Importer:
+    """Import rows into the database and change references to new ids.
+
+    Import the files of one transfer with one Importer, in IMPORT_ORDER.
+
+    Attributes:
+        connection (sqlite3.Connection): The connection to import with
+        chunk_size (int): How many rows are inserted in one transaction
+        progress (Callable[[str, int], None], optional): Called with the
+            table's name and the number of rows read after every chunk
+        id_maps (Dict[str, Dict[int, int]]): The ids of imported rows in the
+            database by their id in the file, for each table
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        chunk_size: int = CHUNK_SIZE,
+        progress: Optional[Callable[[str, int], None]] = None,
+    ):
+        """Create a new Importer.
+
+        Args:
+            connection (sqlite3.Connection): The connection to import with.
+                It must not be in a transaction
+            chunk_size (int, optional): How many rows are inserted in one
+                transaction. Defaults to CHUNK_SIZE
+            progress (Callable[[str, int], None], optional): Called with the
+                table's name and the number of rows read after every chunk.
+                Defaults to None
+        """
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.progress = progress
+
+        self.id_maps: Dict[str, Dict[int, int]] = {}
+
+    def get_existing(
+        self, name: str, duplicate_columns: Tuple[str, ...]
+    ) -> Dict[Tuple[Any, ...], Optional[int]]:
+        """Get the rows that are already in the database.
+
+        Args:
+            name (str): The table's name, one of TABLES
+            duplicate_columns (Tuple[str, ...]): The columns that identify a
+                row
+
+        Returns:
+            Dict[Tuple[Any, ...], Optional[int]]: The ids of the rows (or
+                None if the table has no ids) by their duplicate columns
+        """
+        key_column: Optional[str] = KEY_COLUMNS.get(name)
+
+        return {
+            tuple(row[1:]): row[0]
+            for row in self.connection.execute(
+                f"SELECT {key_column or 'NULL'}, "
+                f"{', '.join(duplicate_columns)} FROM {TABLES[name]}"
+            )
+        }
+
+    def import_rows(
+        self,
+        name: str,
+        rows: Iterable[Dict[str, Any]],
+        file_format: str = "jsonl",
+    ) -> ImportResult:
+        """Import rows into a table.
+
+        Args:
+            name (str): The table's name, one of TABLES
+            rows (Iterable[Dict[str, Any]]): The rows, e.g. from read_rows().
+                Missing columns are NULL, unknown ones are ignored
+            file_format (str, optional): The format the rows were read from,
+                one of FORMATS (see convert()). Defaults to "jsonl"
+
+        Returns:
+            ImportResult: How many rows were imported
+
+        Raises:
+            ValueError: if a value can't be converted to its column's type.
+                The chunk with that row is not imported
+            sqlite3.Error: if a row can't be inserted, e.g. because it
+                violates a constraint. The chunk with that row is not
+                imported
+        """
+        table: str = TABLES[name]
+        column_types: Dict[str, str] = database_util.get_column_definitions(
+            self.connection, table
+        )
+        columns: List[str] = list(column_types)
+
+        key_column: Optional[str] = KEY_COLUMNS.get(name)
+        references: Dict[str, Reference] = REFERENCES.get(name, {})
+
+        duplicate_columns: Tuple[str, ...] = DUPLICATE_COLUMNS[name] or tuple(
+            column for column in columns if column != key_column
+        )
+        existing: Dict[
+            Tuple[Any, ...], Optional[int]
+        ] = self.get_existing(name, duplicate_columns)
+
+        id_map: Dict[int, int] = self.id_maps.setdefault(name, {})
+
+        insert_sql: str = (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(['?'] * len(columns))})"
+        )
+
+        imported: int = 0
+        duplicates: int = 0
+        skipped: int = 0
+        read: int = 0
+
+        row_iter: Iterator[Dict[str, Any]] = iter(rows)
+
+        while True:
+            chunk: List[Dict[str, Any]] = list(
+                itertools.islice(row_iter, self.chunk_size)
+            )
+
+            if not chunk:
+                break
+
+            # Locks out other writers, so the ids below stay free
+            self.connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                next_id: int = 0
+
+                if key_column is not None:
+                    next_id = (
+                        self.connection.execute(
+                            f"SELECT COALESCE(MAX({key_column}), 0) + 1 "
+                            f"FROM {table}"
+                        ).fetchone()[0]
+                    )
+
+                new_rows: List[Dict[str, Any]] = []
+
+                for row in chunk:
+                    values: Dict[str, Any] = {
+                        column: convert(
+                            row.get(column), column_types[column], file_format
+                        )
+                        for column in columns
+                    }
+
+                    if not self.resolve_references(values, references):
+                        skipped += 1
+                        continue
+
+                    identity: Tuple[Any, ...] = tuple(
+                        values[column] for column in duplicate_columns
+                    )
+                    old_id: Optional[int] = (
+                        None if key_column is None else values[key_column]
+                    )
+
+                    if identity in existing:
+                        existing_id: Optional[int] = existing[identity]
+
+                        if old_id is not None and existing_id is not None:
+                            id_map[old_id] = existing_id
+
+                        duplicates += 1
+                        continue
+
+                    if key_column is not None:
+                        if old_id is not None:
+                            id_map[old_id] = next_id
+
+                        values[key_column] = next_id
+                        next_id += 1
+
+                    existing[identity] = (
+                        None if key_column is None else values[key_column]
+                    )
+                    new_rows.append(values)
+
+                self.connection.executemany(
+                    insert_sql,
+                    [
+                        [values[column] for column in columns]
+                        for values in new_rows
+                    ],
+                )
+            except BaseException:
+                self.connection.rollback()
+                raise
+
+            self.connection.commit()
+
+            imported += len(new_rows)
+            read += len(chunk)
+
+            if self.progress is not None:
+                self.progress(name, read)
+
+        return ImportResult(imported, duplicates, skipped)
+
+    def resolve_references(
+        self, values: Dict[str, Any], references: Dict[str, Reference]
+    ) -> bool:
+        """Change the references of a row to the ids of the imported rows.
+
+        Args:
+            values (Dict[str, Any]): The row's values, changed in place
+            references (Dict[str, Reference]): The row's references by column
+
+        Returns:
+            bool: False if the row should be skipped because a required
+                reference is missing or can't be resolved
+        """
+        for column, reference in references.items():
+            if values[column] is None:
+                # A required reference is NOT NULL, inserting the row would
+                # fail the whole chunk
+                if reference.required:
+                    return False
+
+                continue
+
+            new_id: Optional[int] = self.id_maps.get(reference.table, {}).get(
+                values[column]
+            )
+
+            if new_id is None and reference.required:
+                return False
+
+            values[column] = new_id
+
+        return True
+
+
+def get_format(path: str, default: str) -> str:
+    """Get the format of a file from its extension.
+
+    Args:
+        path (str): The file's path or "-" for stdin/stdout
+        default (str): The format if the extension is unknown
+
+    Returns:
+        str: One of FORMATS
+    """
+    if path.endswith(".csv"):
+        return "csv"
+    elif path.endswith(".jsonl") or path.endswith(".json"):
+        return "jsonl"
+    else:
+        return default
+
+
+def open_file(path: str, mode: str) -> TextIO:
+    """Open a file for the transfer.
+
+    Args:
+        path (str): The file's path or "-" for stdin/stdout
+        mode (str): "r" or "w"
+
+    Returns:
+        TextIO: The opened file, close it with close_file()
+    """
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+
+    # newline="" lets the csv module handle line endings in quoted values
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def close_file(transfer_file: TextIO) -> None:
+    """Close a file opened with open_file(), unless it is stdin/stdout.
+
+    Args:
+        transfer_file (TextIO): The file
+    """
+    if transfer_file is sys.stdout:
+        transfer_file.flush()
+    elif transfer_file is not sys.stdin:
+        transfer_file.close()
+
+
+def print_progress(name: str, count: int) -> None:
+    """Show how many rows have been read.
+
+    Args:
+        name (str): The table's name
+        count (int): How many of its rows have been read
+    """
+    print(f"\r{name}: {count}", end="", file=sys.stderr, flush=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the import or export.
+
+    Args:
+        argv (List[str], optional): The command line arguments. Defaults to
+            sys.argv[1:]
+
+    Returns:
+        int: A return code
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("direction", choices=("import", "export"))
+
+    for name in IMPORT_ORDER:
+        parser.add_argument(
+            f"--{name}",
+            metavar="FILE",
+            help=f"The file with the {name}, - for stdin/stdout",
+        )
+
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="jsonl",
+        help="The format of files without .csv or .jsonl extension",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="How many rows to import in one transaction",
+    )
+
+    arguments = parser.parse_args(argv)
+
+    paths: Dict[str, str] = {
+        name: getattr(arguments, name)
+        for name in IMPORT_ORDER
+        if getattr(arguments, name) is not None
+    }
+
+    if not paths:
+        parser.error("no files given")
+
+    connection: sqlite3.Connection = database_util.get_connection()
+
+    importer: Importer = Importer(
+        connection, arguments.chunk_size, print_progress
+    )
+
+    try:
+        for name, path in paths.items():
+            file_format: str = get_format(path, arguments.format)
+            transfer_file: TextIO = open_file(
+                path, "w" if arguments.direction == "export" else "r"
+            )
+
+            try:
+                if arguments.direction == "export":
+                    count: int = write_rows(
+                        export_rows(connection, name),
+                        get_columns(connection, name),
+                        transfer_file,
+                        file_format,
+                    )
+
+                    print(f"{name}: {count} exported", file=sys.stderr)
+
+                else:
+                    result: ImportResult = importer.import_rows(
+                        name,
+                        read_rows(transfer_file, file_format),
+                        file_format,
+                    )
+
+                    print(
+                        f"\r{name}: {result.imported} imported, "
+                        f"{result.duplicates} duplicates, "
+                        f"{result.skipped} skipped",
+                        file=sys.stderr,
+                    )
+            finally:
+                close_file(transfer_file)
+
+    except (ValueError, sqlite3.Error) as e:
+        print(f"\n{name}: {e}", file=sys.stderr)
+        return 1
+
+    finally:
+        database_util.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
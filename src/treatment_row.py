@@ -73,8 +73,8 @@ class TreatmentRow(Gtk.Box):
             if size_groups.get(column, None) is None:
                 size_groups[column] = Gtk.SizeGroup(Gtk.SizeGroupMode.BOTH)
 
-            if treatment.__dict__.get(column) is not None:
-                text = GLib.markup_escape_text(str(treatment.__dict__.get(column)))
+            if getattr(treatment, column) is not None:
+                text = GLib.markup_escape_text(str(getattr(treatment, column)))
             else:
                 text = "-"
 
@@ -4,28 +4,18 @@ Utility functions that deal with the sqlite database 'users'.
 Focused on displaying users. More low-level user utility in auth_util.py
 """
 
-from typing import Generator, Iterable, List, Union, Tuple
-
-import os
+from typing import Any, Generator, Iterable, List, Optional, Tuple
 
 from datetime import datetime
-
 import sqlite3
-import atexit
 
-from gi.repository import GObject, Gio  # type: ignore
+from . import database_util
 
-from . import auth_util
+from .model_util import RecordListModel
 
 
-try:
-    os.mkdir(os.path.expanduser("~/.liegensteuerung"))
-except FileExistsError:
-    pass
-finally:
-    os.chdir(os.path.expanduser("~/.liegensteuerung"))
-
-DATABASE_NAME = "liegensteuerung.db"
+# How many treatments are loaded at once by default
+PAGE_SIZE: int = 50
 
 DISPLAY_COLUMNS: Tuple[str, ...] = (
     "date",
@@ -35,16 +25,24 @@ DISPLAY_COLUMNS: Tuple[str, ...] = (
     "username",
 )
 
-connection = sqlite3.connect(DATABASE_NAME)
-cursor = connection.cursor()
-atexit.register(connection.close)
 
+class Treatment:
+    """A Treatment represents a database entry for a treatment.
+
+    Treatments are plain records, see model_util.RecordListModel.
+    """
 
-class Treatment(GObject.Object):
-    """A Treatment represents a database entry for a treatment."""
+    __slots__ = (
+        "entry_id",
+        "timestamp",
+        "program_id",
+        "pain_intensity",
+        "pain_location",
+        "username",
+    )
 
+    entry_id: int
     timestamp: int
-    date: str
     program_id: int
     pain_intensity: int
     pain_location: str
@@ -52,6 +50,7 @@ class Treatment(GObject.Object):
 
     def __init__(
         self,
+        entry_id: int,
         timestamp: int,
         program_id: int,
         pain_intensity: int,
@@ -62,28 +61,55 @@ class Treatment(GObject.Object):
 
         This should never be manually done. To add a user to the database,
             use Patient.add_treatent_entry(). To get treatments from the
-            database, use Treatment.get_all().
+            database, use Treatment.get_for_patient().
 
         Args:
-            username (str): The user's username
-            access_level (str): The user's access level.
-                One of ('admin', 'doctor', 'helper')
+            entry_id (int): The rowid of the treatment entry
+            timestamp (int): The UNIX timestamp of the treatment
+            program_id (int): The id of the program used for the treatment
+            pain_intensity (int): The patient's pain intensity
+            pain_location (str): The location of the patient's pain
+            username (str): The username of the user who recorded it
         """
-        super().__init__()
-
+        self.entry_id = entry_id
         self.timestamp = timestamp
-        self.date = datetime.fromtimestamp(timestamp).strftime("%d.%m.%Y")
         self.program_id = program_id
         self.pain_intensity = pain_intensity
         self.pain_location = pain_location
         self.username = username
 
+    @property
+    def date(self) -> str:
+        """Format the treatment's date when it is displayed.
+
+        Returns:
+            str: The date, e.g. "31.12.2020"
+        """
+        return datetime.fromtimestamp(self.timestamp).strftime("%d.%m.%Y")
+
+    def get_values(self) -> Tuple[Any, ...]:
+        """Get the treatment's values, e.g. to compare treatments.
+
+        Returns:
+            Tuple[Any, ...]: The entry id, timestamp, program id, pain
+                intensity, pain location and username
+        """
+        return (
+            self.entry_id,
+            self.timestamp,
+            self.program_id,
+            self.pain_intensity,
+            self.pain_location,
+            self.username,
+        )
+
     @staticmethod
     def get_all() -> Generator["Treatment", None, None]:
         """Yield all users in the database."""
-        for treatment_row in cursor.execute(
+        for treatment_row in database_util.execute(
             """
                 SELECT
+                    rowid,
                     timestamp,
                     program_id,
                     pain_intensity,
@@ -92,34 +118,85 @@ class Treatment(GObject.Object):
                 FROM treatment_entries
             """
         ).fetchall():
-            (
-                timestamp,
-                program_id,
-                pain_intensity,
-                pain_location,
-                username,
-            ) = treatment_row
-
-            yield Treatment(
-                timestamp, program_id, pain_intensity, pain_location, username
-            )
+            yield Treatment(*treatment_row)
+
+    def get_page_key(self) -> Tuple[int, int]:
+        """Get the key by which the treatment is ordered in a page.
+
+        Returns:
+            Tuple[int, int]: The timestamp and the entry id. Can be passed as
+                before to get_for_patient()
+        """
+        return (self.timestamp, self.entry_id)
 
     @staticmethod
-    def iter_to_model(treatment_iter: Iterable["Treatment"]) -> Gio.ListStore:
-        """Convert an iterable of Treatment objects into a Gio.ListStore.
+    def get_for_patient(
+        patient_id: int,
+        before: Optional[Tuple[int, int]] = None,
+        limit: int = PAGE_SIZE,
+        connection: Optional[sqlite3.Connection] = None,
+    ) -> List["Treatment"]:
+        """Get a page of a patient's treatments, newest first.
+
+        The index on treatment_entries (patient_id, timestamp) is read
+            backwards, so a page takes the same time no matter how many
+            treatments there are.
 
         Args:
-            treatment_iter (Iterable[Treatment]): An iterable of treatments to
-                convert
+            patient_id (int): The patient's id
+            before (Tuple[int, int], optional): Only get treatments before
+                this key (see get_page_key()), e.g. the oldest one of the
+                previous page. Defaults to None (start with the newest)
+            limit (int, optional): The maximum number of treatments to get.
+                Defaults to PAGE_SIZE
+            connection (sqlite3.Connection, optional): The connection to use
+                instead of the shared one (see database_util.execute())
 
         Returns:
-            Gio.ListStore: The converted model
+            List[Treatment]: The treatments
         """
-        model: Gio.ListStore = Gio.ListStore()
+        return [
+            Treatment(*treatment_row)
+            for treatment_row in database_util.execute(
+                # Treatments with the same timestamp are ordered by rowid, so
+                # none of them are skipped at the end of a page. The first
+                # (redundant) comparison is needed for an index search.
+                f"""
+                    SELECT
+                        rowid,
+                        timestamp,
+                        program_id,
+                        pain_intensity,
+                        pain_location,
+                        username
+                    FROM treatment_entries
+                    WHERE patient_id = ?
+                    {"" if before is None else (
+                        "AND timestamp <= ? AND (timestamp, rowid) < (?, ?)"
+                    )}
+                    ORDER BY timestamp DESC, rowid DESC
+                    LIMIT ?
+                """,
+                (
+                    patient_id,
+                    *(() if before is None else (before[0], *before)),
+                    limit,
+                ),
+                connection,
+            ).fetchall()
+        ]
 
-        treatment_list: List[Treatment] = list(treatment_iter)
+    @staticmethod
+    def iter_to_model(
+        treatment_iter: Iterable["Treatment"],
+    ) -> RecordListModel:
+        """Convert an iterable of Treatment objects into a RecordListModel.
 
-        for treatment in treatment_list:
-            model.append(treatment)
+        Args:
+            treatment_iter (Iterable[Treatment]): An iterable of treatments to
+                convert
 
-        return model
+        Returns:
+            RecordListModel: The converted model
+        """
+        return RecordListModel(Treatment.get_values, treatment_iter)
@@ -4,7 +4,8 @@ Ideal for viewing users in lists, because all columns are added to a
 Gtk.SizeGroup
 """
 
-from typing import Dict, Union
+from typing import Dict, Optional, Union
+from functools import partial
 
 from gi.repository import GLib, Gtk  # type: ignore
 
@@ -37,12 +38,20 @@ class UserRow(Gtk.Box):
 
     user: user_util.User
 
-    def __init__(self, user: user_util.User, username: str, page: Page):
+    def __init__(
+        self,
+        user: user_util.User,
+        username: str,
+        can_edit: bool,
+        page: Page,
+    ):
         """Create a new UserRow.
 
         Args:
             user (user_util.User): The user to represent
             username (str): The username of the current user
+            can_edit (bool): Whether the current user can edit the user, see
+                auth_util.Session.can_edit()
             page (Page): The page the UserRow is going to appear on.
         """
         super().__init__(orientation=Gtk.Orientation.VERTICAL)
@@ -50,11 +59,11 @@ class UserRow(Gtk.Box):
         self.user = user
         self.page = page
 
-        self.access_level: int = auth_util.ACCESS_LEVELS[
-            auth_util.get_access_level(username)
-        ]
         self.active_user: str = username
 
+        # Whether the active user can edit the user this row represents
+        self.can_edit: bool = can_edit
+
         h_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
 
         self.pack_start(h_box, expand=True, fill=True, padding=0)
@@ -70,7 +79,7 @@ class UserRow(Gtk.Box):
             if size_groups.get(column, None) is None:
                 size_groups[column] = Gtk.SizeGroup(Gtk.SizeGroupMode.BOTH)
 
-            text = GLib.markup_escape_text(str(user.__dict__.get(column)))
+            text = GLib.markup_escape_text(str(getattr(user, column)))
 
             if column == "access_level":
                 text = auth_util.ACCESS_LEVEL_TRANSLATIONS[text]
@@ -93,12 +102,6 @@ class UserRow(Gtk.Box):
                 padding=4,
             )
 
-        # Whether the active user can edit the user this row represents
-        self.can_edit: bool = (
-            self.access_level > auth_util.ACCESS_LEVELS[self.user.access_level]
-            or self.active_user == self.user.username
-        )
-
         # Password button
         if size_groups.get("PASSWORD_BUTTON", None) is None:
             size_groups["PASSWORD_BUTTON"] = Gtk.SizeGroup(
@@ -183,20 +186,43 @@ class UserRow(Gtk.Box):
         dialog.destroy()
 
         if response == Gtk.ResponseType.YES:
-            auth_util.delete_user(
-                self.user.username,
-                self.active_user,
-                self.get_toplevel().active_user_password,
-            )
-            if self.active_user == self.user.username:
-                self.get_toplevel().log_out()
-            else:
-                self.page.prepare()
+            window: Gtk.Window = self.get_toplevel()
+
+            try:
+                # Hashing the password takes a while, don't block the main
+                # loop
+                auth_util.delete_user(
+                    self.user.username,
+                    self.active_user,
+                    window.active_user_password,
+                    partial(self.on_deleted, window, self.user.username),
+                )
+            except ValueError as v_err:
+                window.show_error(" ".join(v_err.args))
 
         elif response == Gtk.ResponseType.NO:
             pass
 
 
+    def on_deleted(
+        self, window: Gtk.Window, username: str, error: Optional[ValueError]
+    ) -> None:
+        """Log out or show an error once the user is deleted.
+
+        The page removes the row, see UsersPage.on_user_deleted(), so the
+        window is passed in.
+
+        Args:
+            window (Gtk.Window): The window the row was shown in
+            username (str): The deleted user's username
+            error (ValueError, optional): Why the user wasn't deleted or None
+        """
+        if error is not None:
+            window.show_error(" ".join(error.args))
+        elif self.active_user == username:
+            window.log_out()
+
+
 class UserHeader(Gtk.Box):
     """A widget that acts as a header for UserRow widgets."""
 
@@ -4,36 +4,26 @@ Utility functions that deal with the sqlite database 'users'.
 Focused on displaying users. More low-level user utility in auth_util.py
 """
 
-from typing import Generator, Iterable, List, Union, Tuple
-
-import os
+from typing import Generator, Iterable, Optional, Union, Tuple
 
 import sqlite3
-import atexit
-
-from gi.repository import GObject, Gio  # type: ignore
 
 from . import auth_util
+from . import database_util
 
+from .model_util import RecordListModel
 
-try:
-    os.mkdir(os.path.expanduser("~/.liegensteuerung"))
-except FileExistsError:
-    pass
-finally:
-    os.chdir(os.path.expanduser("~/.liegensteuerung"))
-
-DATABASE_NAME = "liegensteuerung.db"
 
 DISPLAY_COLUMNS: Tuple[str, ...] = ("username", "access_level")
 
-connection = sqlite3.connect(DATABASE_NAME)
-cursor = connection.cursor()
-atexit.register(connection.close)
 
+class User:
+    """A User represents a database entry for a user.
+
+    Users are plain records, see model_util.RecordListModel.
+    """
 
-class User(GObject.Object):
-    """A User represents a database entry for a user."""
+    __slots__ = ("username", "access_level")
 
     username: str
     access_level: str
@@ -50,12 +40,10 @@ class User(GObject.Object):
             access_level (str): The user's access level.
                 One of ('admin', 'doctor', 'helper')
         """
-        super().__init__()
-
         self.username = username
 
         if isinstance(access_level, int):
-            if access_level in auth_util.ACCESS_LEVELS.values():
+            if access_level in auth_util.ACCESS_LEVEL_NAMES:
                 access_level = auth_util.ACCESS_LEVEL_NAMES[access_level]
             else:
                 raise ValueError(
@@ -67,11 +55,46 @@ class User(GObject.Object):
 
         self.access_level = access_level
 
+    def get_values(self) -> Tuple[str, str]:
+        """Get the user's values, e.g. to compare users.
+
+        Returns:
+            Tuple[str, str]: The username and the access level
+        """
+        return (self.username, self.access_level)
+
     @staticmethod
-    def get_all() -> Generator["User", None, None]:
-        """Yield all users in the database."""
-        for user_row in cursor.execute(
-            "SELECT username, access_level FROM users"
+    def get(username: str) -> Optional["User"]:
+        """Get a user from the database.
+
+        Args:
+            username (str): The user's username
+
+        Returns:
+            Optional[User]: The user or None if there is no such user
+        """
+        user_row: Optional[Tuple[str, int]] = database_util.execute(
+            "SELECT username, access_level FROM users WHERE username = ?",
+            (username,),
+        ).fetchone()
+
+        if user_row is None:
+            return None
+
+        return User(*user_row)
+
+    @staticmethod
+    def get_all(
+        connection: Optional[sqlite3.Connection] = None,
+    ) -> Generator["User", None, None]:
+        """Yield all users in the database.
+
+        Args:
+            connection (sqlite3.Connection, optional): The connection to use
+                instead of the shared one (see database_util.execute())
+        """
+        for user_row in database_util.execute(
+            "SELECT username, access_level FROM users", (), connection
         ).fetchall():
             username: str = user_row[0]
             access_level: int = user_row[1]
@@ -79,20 +102,13 @@ class User(GObject.Object):
             yield User(username, access_level)
 
     @staticmethod
-    def iter_to_model(user_iter: Iterable["User"]) -> Gio.ListStore:
-        """Convert an iterable of User objects into a Gio.ListStore.
+    def iter_to_model(user_iter: Iterable["User"]) -> RecordListModel:
+        """Convert an iterable of User objects into a RecordListModel.
 
         Args:
             user_iter (Iterable[User]): An iterable of users to convert
 
         Returns:
-            Gio.ListStore: The converted model
+            RecordListModel: The converted model
         """
-        model: Gio.ListStore = Gio.ListStore()
-
-        user_list: List[User] = list(user_iter)
-
-        for user in user_list:
-            model.append(user)
-
-        return model
+        return RecordListModel(User.get_values, user_iter)
@@ -1,15 +1,19 @@
 """A page that prompts the user manage all existent users."""
 
 from typing import Union, Optional, List
+from functools import partial
 
-from gi.repository import GObject, Gio, Gtk  # type: ignore
+from gi.repository import GObject, Gtk  # type: ignore
 
 from .page import Page, PageClass
 
+from .change_util import ChangeHub, changes
+from .model_util import RecordListModel, bind_records, update_model
 from .user_row import UserRow, UserHeader
 from .user_util import User
 
 from . import auth_util
+from . import database_util
 
 
 @Gtk.Template(resource_path="/de/linusmathieu/Liegensteuerung/users_page.ui")
@@ -37,6 +41,9 @@ class UsersPage(Gtk.Box, Page, metaclass=PageClass):
 
     add_button: Union[Gtk.Button, Gtk.Template.Child] = Gtk.Template.Child()
 
+    # Counts user queries, so results of outdated ones are discarded
+    users_request: int = 0
+
     def __init__(self, **kwargs):
         """Create a new SelectUserPage.
 
@@ -45,28 +52,114 @@ class UsersPage(Gtk.Box, Page, metaclass=PageClass):
         """
         super().__init__(**kwargs)
 
+        self.user_model: RecordListModel = RecordListModel(User.get_values)
+
+        # The session the rows were created for, they depend on its rights
+        self.row_session: Optional[auth_util.Session] = None
+
     def prepare(self) -> None:
         """Prepare the page to be shown."""
         self.update_users()
 
     def prepare_return(self) -> None:
-        """Prepare the page to be shown when returning from another page."""
-        # Inefficient to re-load all users, but everything else is more work
-        self.update_users()
+        """Prepare the page to be shown when returning from another page.
+
+        Users that were changed in the meantime are already updated, see
+        on_user_changed().
+        """
+        if self.row_session is not self.get_toplevel().session:
+            self.update_users()
 
     def update_users(self) -> None:
-        """Re-query all users."""
-        self.user_list_box.bind_model(
-            User.iter_to_model(User.get_all()),
-            UserRow,
-            self.get_toplevel().active_user,
-            self,
+        """Re-query all users in the background."""
+        if self.row_session is not self.get_toplevel().session:
+            self.row_session = self.get_toplevel().session
+            self.user_model.remove_all()
+
+        self.users_request += 1
+
+        database_util.read(
+            lambda connection: list(User.get_all(connection)),
+            partial(self.on_users_loaded, self.users_request),
         )
+
+    def on_users_loaded(self, request: int, users: List[User]) -> None:
+        """Update the changed rows once the users are re-queried.
+
+        Args:
+            request (int): The users_request the users were queried for. If
+                it is outdated, the users are discarded
+            users (List[User]): The users
+        """
+        if request != self.users_request:
+            return
+
+        update_model(self.user_model, users)
+        self.show_rows()
+
+    def show_rows(self) -> None:
+        """Show new rows."""
         self.user_list_box.show_all()
 
         for row in self.user_list_box.get_children():
             row.set_activatable(False)
 
+    def get_user_position(self, username: str) -> Optional[int]:
+        """Get the position of a user in the list.
+
+        Args:
+            username (str): The user's username
+
+        Returns:
+            Optional[int]: The position or None if the user isn't listed
+        """
+        for position, user in enumerate(self.user_model.records):
+            if user.username == username:
+                return position
+
+        return None
+
+    def on_user_changed(self, hub: ChangeHub, username: str) -> None:
+        """Add or update the row of an added or modified user.
+
+        Args:
+            hub (ChangeHub): The hub that emitted the change
+            username (str): The user's username
+        """
+        # The list wasn't loaded yet
+        if self.row_session is None:
+            return
+
+        # The active user's rights changed, all rows may have to change
+        if username == self.row_session.username:
+            # The session may not have seen the change yet
+            self.row_session.invalidate()
+            self.user_model.remove_all()
+            self.update_users()
+            return
+
+        user: Optional[User] = User.get(username)
+        position: Optional[int] = self.get_user_position(username)
+
+        if position is not None:
+            self.user_model.splice(position, 1, [] if user is None else [user])
+        elif user is not None:
+            self.user_model.splice(len(self.user_model.records), 0, [user])
+
+        self.show_rows()
+
+    def on_user_deleted(self, hub: ChangeHub, username: str) -> None:
+        """Remove the row of a deleted user.
+
+        Args:
+            hub (ChangeHub): The hub that emitted the change
+            username (str): The user's username
+        """
+        position: Optional[int] = self.get_user_position(username)
+
+        if position is not None:
+            self.user_model.splice(position, 1, [])
+
     def do_parent_set(self, old_parent: Optional[Gtk.Widget]) -> None:
         """React to the parent being set.
 
@@ -84,8 +177,32 @@ class UsersPage(Gtk.Box, Page, metaclass=PageClass):
         )
         self.header_box.show_all()
 
+        bind_records(self.user_list_box, self.user_model, self.create_user_row)
+
         self.add_button.connect("clicked", self.on_add_clicked)
 
+        changes.connect("user-added", self.on_user_changed)
+        changes.connect("user-modified", self.on_user_changed)
+        changes.connect("user-deleted", self.on_user_deleted)
+
+    def create_user_row(self, user: User) -> UserRow:
+        """Create a row for a user in the list.
+
+        Args:
+            user (User): The user to create a row for
+
+        Returns:
+            UserRow: The row
+        """
+        assert self.row_session is not None
+
+        return UserRow(
+            user,
+            self.row_session.username,
+            self.row_session.can_edit(user.username, user.access_level),
+            self,
+        )
+
     def on_add_clicked(self, button: Gtk.Button) -> None:
         """React to the "Add user" button being clicked.
 
@@ -0,0 +1,365 @@
+"""Estimate the pusher positions from camera frames.
+
+Markers are attached to both ends of the table and to both pushers. They are
+either ArUco markers (needs the cv2.aruco module) or colored blobs. The
+pusher positions are the projections of the pusher markers onto the axis
+between the two table markers, scaled to millimetres.
+
+The vision stage is disabled by default. It is configured in the "vision"
+section of ~/.liegensteuerung/camera.json (see VisionSettings), e.g.:
+    {
+        "vision": {
+            "enabled": true,
+            "method": "aruco",
+            "markers": {
+                "table_start": 0,
+                "table_end": 1,
+                "pusher_left": 2,
+                "pusher_right": 3
+            },
+            "table_length": 1200
+        }
+    }
+
+For the method "color", every marker is given as a pair of HSV bounds
+instead of an ArUco id, e.g. "pusher_left": [[50, 100, 100], [70, 255, 255]].
+"""
+
+from typing import Dict, NamedTuple, Optional, Tuple, Any
+
+import time
+
+import cv2  # type: ignore
+import numpy  # type: ignore
+
+from . import camera_util
+
+
+MARKER_NAMES: Tuple[str, ...] = (
+    "table_start",
+    "table_end",
+    "pusher_left",
+    "pusher_right",
+)
+
+PUSHER_MARKER_NAMES: Tuple[str, ...] = ("pusher_left", "pusher_right")
+
+# Names of the PLC's pusher position nodes, see opcua_util.node_ids["setup"]
+PLC_POSITION_NODES: Tuple[str, ...] = ("left_pusher", "right_pusher")
+
+# Colored blobs smaller than this are considered noise
+MIN_BLOB_PIXELS: int = 32
+
+
+class VisionSettings(NamedTuple):
+    """The settings of the vision stage.
+
+    Attributes:
+        enabled (bool): Whether the vision stage runs at all
+        method (str): "aruco" or "color"
+        dictionary (str): The name of the ArUco dictionary (cv2.aruco.DICT_*)
+        markers (Dict[str, Any]): The ArUco id or the HSV bounds of each
+            marker in MARKER_NAMES
+        table_length (float): The distance between the table markers in mm
+        position_offset (float): Added to every estimated position in mm, to
+            match the PLC's zero point
+        smoothing (float): Weight of the newest estimate (0-1). Lower values
+            reduce jitter but react slower
+        tolerance (float): How many mm an estimate may differ from the PLC's
+            position before the cross-check fails
+        check_interval (float): Seconds between two cross-checks with the PLC
+    """
+
+    enabled: bool = False
+    method: str = "aruco"
+    dictionary: str = "DICT_4X4_50"
+    markers: Dict[str, Any] = {
+        "table_start": 0,
+        "table_end": 1,
+        "pusher_left": 2,
+        "pusher_right": 3,
+    }
+    table_length: float = 1000.0
+    position_offset: float = 0.0
+    smoothing: float = 0.5
+    tolerance: float = 10.0
+    check_interval: float = 1.0
+
+
+def load_settings() -> VisionSettings:
+    """Load the vision settings configured by the user.
+
+    Returns:
+        VisionSettings: The configured settings. Unknown keys are ignored.
+    """
+    settings: Dict[str, Any] = camera_util.load_config().get("vision", {})
+
+    return VisionSettings(
+        **{
+            key: value
+            for key, value in settings.items()
+            if key in VisionSettings._fields
+        }
+    )
+
+
+def is_aruco_available() -> bool:
+    """Return whether the installed OpenCV has the aruco module.
+
+    Returns:
+        bool: Whether ArUco markers can be detected
+    """
+    return hasattr(cv2, "aruco")
+
+
+class ArucoDetector:
+    """Find the centers of ArUco markers in frames."""
+
+    def __init__(self, settings: VisionSettings):
+        """Create a new ArucoDetector.
+
+        Args:
+            settings (VisionSettings): The vision settings
+
+        Raises:
+            ValueError: if the aruco module or the dictionary isn't available
+        """
+        if not is_aruco_available():
+            raise ValueError("The installed OpenCV has no aruco module")
+
+        try:
+            dictionary = cv2.aruco.getPredefinedDictionary(
+                getattr(cv2.aruco, settings.dictionary)
+            )
+        except AttributeError:
+            raise ValueError(f"{settings.dictionary} is not an ArUco dict")
+
+        self.names_by_id: Dict[int, str] = {
+            int(marker_id): name
+            for name, marker_id in settings.markers.items()
+            if name in MARKER_NAMES
+        }
+
+        # OpenCV 4.7 replaced the module level functions with a class
+        if hasattr(cv2.aruco, "ArucoDetector"):
+            detector = cv2.aruco.ArucoDetector(
+                dictionary, cv2.aruco.DetectorParameters()
+            )
+            self._detect = detector.detectMarkers
+        else:
+            parameters = cv2.aruco.DetectorParameters_create()
+            self._detect = lambda image: cv2.aruco.detectMarkers(
+                image, dictionary, parameters=parameters
+            )
+
+    def detect(self, frame: numpy.ndarray) -> Dict[str, numpy.ndarray]:
+        """Find the markers in a frame.
+
+        Args:
+            frame (numpy.ndarray): A BGR frame
+
+        Returns:
+            Dict[str, numpy.ndarray]: The center (x, y) of each marker that was
+                found, by marker name
+        """
+        corners, ids, _ = self._detect(
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        )
+
+        if ids is None:
+            return {}
+
+        # corners: one (1, 4, 2) array per marker -> centers: (n, 2)
+        centers: numpy.ndarray = numpy.concatenate(corners).mean(axis=1)
+
+        return {
+            self.names_by_id[marker_id]: center
+            for marker_id, center in zip(ids.ravel().tolist(), centers)
+            if marker_id in self.names_by_id
+        }
+
+
+class ColorDetector:
+    """Find the centers of colored blobs in frames."""
+
+    def __init__(self, settings: VisionSettings):
+        """Create a new ColorDetector.
+
+        Args:
+            settings (VisionSettings): The vision settings
+        """
+        self.bounds: Dict[str, Tuple[numpy.ndarray, numpy.ndarray]] = {
+            name: (
+                numpy.array(bounds[0], dtype=numpy.uint8),
+                numpy.array(bounds[1], dtype=numpy.uint8),
+            )
+            for name, bounds in settings.markers.items()
+            if name in MARKER_NAMES
+        }
+
+    def detect(self, frame: numpy.ndarray) -> Dict[str, numpy.ndarray]:
+        """Find the markers in a frame.
+
+        Args:
+            frame (numpy.ndarray): A BGR frame
+
+        Returns:
+            Dict[str, numpy.ndarray]: The center (x, y) of each marker that was
+                found, by marker name
+        """
+        hsv_frame: numpy.ndarray = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+
+        centers: Dict[str, numpy.ndarray] = {}
+
+        for name, (lower, upper) in self.bounds.items():
+            ys, xs = numpy.nonzero(cv2.inRange(hsv_frame, lower, upper))
+
+            if len(xs) >= MIN_BLOB_PIXELS:
+                centers[name] = numpy.array((xs.mean(), ys.mean()))
+
+        return centers
+
+
+def estimate_positions(
+    centers: Dict[str, numpy.ndarray], table_length: float
+) -> Optional[numpy.ndarray]:
+    """Project the pusher markers onto the table axis.
+
+    Args:
+        centers (Dict[str, numpy.ndarray]): Marker centers by marker name
+        table_length (float): The distance between the table markers in mm
+
+    Returns:
+        Optional[numpy.ndarray]: The positions of the left and right pusher
+            in mm from table_start or None if a marker is missing
+    """
+    if any(name not in centers for name in MARKER_NAMES):
+        return None
+
+    start: numpy.ndarray = centers["table_start"]
+    axis: numpy.ndarray = centers["table_end"] - start
+
+    axis_length_squared: float = float(axis @ axis)
+
+    if axis_length_squared == 0:
+        return None
+
+    pushers: numpy.ndarray = numpy.stack(
+        [centers[name] for name in PUSHER_MARKER_NAMES]
+    )
+
+    return (pushers - start) @ axis / axis_length_squared * table_length
+
+
+class PusherTracker:
+    """Track the pusher positions and cross-check them against the PLC.
+
+    Attributes:
+        settings (VisionSettings): The vision settings
+        positions (numpy.ndarray, optional): The smoothed positions of the
+            left and right pusher in mm or None if they are unknown
+        deviations (numpy.ndarray, optional): How many mm the positions
+            differed from the PLC's positions at the last cross-check or None
+            if no check was possible
+    """
+
+    settings: VisionSettings
+    positions: Optional[numpy.ndarray]
+    deviations: Optional[numpy.ndarray]
+
+    def __init__(self, settings: Optional[VisionSettings] = None):
+        """Create a new PusherTracker.
+
+        Args:
+            settings (VisionSettings, optional): The settings to use. Defaults
+                to the settings loaded from camera_util.CONFIG_PATH
+
+        Raises:
+            ValueError: if the configured method is not available
+        """
+        self.settings = settings if settings is not None else load_settings()
+
+        self.detector: Any
+        if self.settings.method == "aruco":
+            self.detector = ArucoDetector(self.settings)
+        elif self.settings.method == "color":
+            self.detector = ColorDetector(self.settings)
+        else:
+            raise ValueError(f"{self.settings.method} is not a valid method")
+
+        self.positions = None
+        self.deviations = None
+
+        self._last_check_time: float = 0.0
+
+    def update(self, frame: numpy.ndarray) -> Optional[numpy.ndarray]:
+        """Feed a new frame to the tracker.
+
+        Args:
+            frame (numpy.ndarray): A BGR frame
+
+        Returns:
+            Optional[numpy.ndarray]: The smoothed positions of the left and
+                right pusher in mm or None if they are unknown
+        """
+        estimate: Optional[numpy.ndarray] = estimate_positions(
+            self.detector.detect(frame), self.settings.table_length
+        )
+
+        if estimate is None:
+            # Keep the last positions, markers are often covered shortly
+            return self.positions
+
+        estimate += self.settings.position_offset
+
+        if self.positions is None:
+            self.positions = estimate
+        else:
+            self.positions = (
+                self.settings.smoothing * estimate
+                + (1 - self.settings.smoothing) * self.positions
+            )
+
+        return self.positions
+
+    def is_check_due(self) -> bool:
+        """Return whether the next cross-check with the PLC is due.
+
+        Returns:
+            bool: Whether check_against_plc() should be called
+        """
+        return (
+            time.monotonic() - self._last_check_time
+            >= self.settings.check_interval
+        )
+
+    def check_against_plc(self) -> bool:
+        """Compare the tracked positions with the PLC's pusher positions.
+
+        Returns:
+            bool: False if a position differs by more than settings.tolerance,
+                True otherwise (also if no comparison was possible)
+        """
+        self._last_check_time = time.monotonic()
+
+        if self.positions is None:
+            self.deviations = None
+            return True
+
+        try:
+            # Imported here so that the camera works without the opcua module
+            from . import opcua_util
+
+            setup_nodes = opcua_util.Connection()["setup"]
+            plc_positions: numpy.ndarray = numpy.array(
+                [float(setup_nodes[name]) for name in PLC_POSITION_NODES]
+            )
+        except Exception:
+            # The PLC is optional for the camera: an unreachable PLC, a
+            # missing node or a missing opcua module must not stop capture
+            self.deviations = None
+            return True
+
+        self.deviations = numpy.abs(self.positions - plc_positions)
+
+        return bool((self.deviations <= self.settings.tolerance).all())
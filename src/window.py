@@ -8,6 +8,7 @@ from . import auth_util
 from . import patient_util
 from . import program_util
 from . import page
+from .change_util import ChangeHub, changes
 from . import (
     edit_patient_page,
     edit_program_page,
@@ -78,6 +79,8 @@ class LiegensteuerungWindow(Gtk.ApplicationWindow):
 
         active_user (str, optional): The user that is logged in or None if no
             user is logged in.
+        session (auth_util.Session, optional): The active user's session or
+            None if no user is logged in
         active_user_password (str, optional): The active user's password
         active_patient (patient_util.Patient, optional): The selected patient
             or None
@@ -141,7 +144,7 @@ class LiegensteuerungWindow(Gtk.ApplicationWindow):
         Gtk.Template.Child, Gtk.Button
     ] = Gtk.Template.Child()
 
-    active_user: Optional[str] = None
+    session: Optional[auth_util.Session] = None
     active_user_password: Optional[str] = None
     active_patient: Optional[patient_util.Patient] = None
     active_program: Optional[program_util.Program] = None
@@ -163,6 +166,29 @@ class LiegensteuerungWindow(Gtk.ApplicationWindow):
 
         self.log_out()
 
+    @property
+    def active_user(self) -> Optional[str]:
+        """Get the user that is logged in.
+
+        Returns:
+            Optional[str]: The user's username or None if no user is logged in
+        """
+        return None if self.session is None else self.session.username
+
+    @active_user.setter
+    def active_user(self, username: Optional[str]) -> None:
+        """Log a user in or, if username is None, the active user out.
+
+        Args:
+            username (Optional[str]): The user's username or None
+        """
+        if self.session is not None:
+            self.session.close()
+
+        self.session = (
+            None if username is None else auth_util.Session(username)
+        )
+
     def on_show(self, widget) -> None:
         """React to being shown.
 
@@ -184,6 +210,8 @@ class LiegensteuerungWindow(Gtk.ApplicationWindow):
 
         self.log_out_button.connect("clicked", self.on_log_out_clicked)
 
+        changes.connect("database-error", self.on_database_error)
+
     def log_out(self) -> None:
         """Log out and go to the log in or register page."""
         if not auth_util.does_admin_exist():
@@ -309,15 +337,10 @@ class LiegensteuerungWindow(Gtk.ApplicationWindow):
 
         self.log_out_button.set_visible(self.active_user is not None)
 
-        is_admin: bool = (
-            self.active_user is not None
-            and auth_util.get_access_level(self.active_user) == "admin"
+        self.users_button.set_visible(
+            self.session is not None
+            and self.session.has_access_level("doctor")
         )
-        is_doctor: bool = (
-            self.active_user is not None
-            and auth_util.get_access_level(self.active_user) == "doctor"
-        )
-        self.users_button.set_visible(is_admin or is_doctor)
 
         self.patient_button_revealer.set_reveal_child(
             self.active_patient is not None
@@ -344,6 +367,15 @@ class LiegensteuerungWindow(Gtk.ApplicationWindow):
         self.error_bar.set_visible(True)
         self.error_bar.set_revealed(True)
 
+    def on_database_error(self, hub: ChangeHub, error: Exception) -> None:
+        """Tell the user that a background database job failed.
+
+        Args:
+            hub (ChangeHub): The hub that emitted the error
+            error (Exception): The job's error
+        """
+        self.show_error(f"Datenbankfehler: {error}")
+
     def on_back_clicked(self, button: Gtk.Button) -> None:
         """React to the back button being clicked. Go back.
 
@@ -366,13 +398,13 @@ class LiegensteuerungWindow(Gtk.ApplicationWindow):
         Args:
             button (Gtk.Button): The clicked button
         """
-        assert self.active_user is not None
+        assert self.session is not None
 
         self.switch_page(
             "register",
             new_user=False,
-            username=self.active_user,
-            access_level=auth_util.get_access_level(self.active_user),
+            username=self.session.username,
+            access_level=self.session.access_level,
         )
 
     def on_users_clicked(self, button: Gtk.Button) -> None:
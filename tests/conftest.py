@@ -0,0 +1,43 @@
+"""Shared fixtures for the tests."""
+
+from types import ModuleType
+from typing import Callable
+import importlib.util
+import os
+import sys
+
+import pytest
+
+SOURCE_DIRECTORY: str = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"
+)
+
+
+def import_source(module: str) -> ModuleType:
+    """Import a module from the source tree, as part of liegensteuerung.
+
+    Args:
+        module (str): The module's name, e.g. "database_util"
+
+    Returns:
+        ModuleType: The module
+    """
+    if "liegensteuerung" not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            "liegensteuerung",
+            os.path.join(SOURCE_DIRECTORY, "__init__.py"),
+            submodule_search_locations=[SOURCE_DIRECTORY],
+        )
+        package = importlib.util.module_from_spec(spec)
+        sys.modules["liegensteuerung"] = package
+        spec.loader.exec_module(package)
+
+    return importlib.import_module(f"liegensteuerung.{module}")
+
+
+@pytest.fixture
+def source() -> Callable[[str], ModuleType]:
+    """Import modules from the source tree, see import_source()."""
+    pytest.importorskip("gi")
+
+    return import_source
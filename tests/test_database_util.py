@@ -0,0 +1,149 @@
+"""Tests for database_util.DatabaseWorker."""
+
+from typing import List
+from concurrent.futures import Future
+import sqlite3
+import time
+
+import pytest
+
+
+@pytest.fixture
+def database(source, tmp_path):
+    """Create a migrated database and a DatabaseWorker for it."""
+    database_util = source("database_util")
+
+    path: str = str(tmp_path / "test.db")
+
+    connection: sqlite3.Connection = database_util.connect(path)
+    database_util.migrate(connection)
+
+    worker = database_util.DatabaseWorker(path, commit_delay=0.05)
+
+    yield path, connection, worker
+
+    worker.close()
+    connection.close()
+
+
+def test_failing_write_releases_write_lock(database):
+    """A failed write must not keep the worker's transaction open."""
+    path, connection, worker = database
+
+    # Violates the foreign key to patients
+    failed: Future = worker.write(
+        "INSERT INTO treatment_entries (patient_id, timestamp) VALUES (?, ?)",
+        (12345, 1),
+    )
+
+    with pytest.raises(sqlite3.IntegrityError):
+        failed.result(timeout=2)
+
+    # Let the failed write's transaction time out
+    time.sleep(0.2)
+
+    written: Future = worker.write(
+        "INSERT INTO patients (first_name) VALUES (?)", ("Anna",)
+    )
+
+    # Done once committed, without sync() or close()
+    patient_id: int = written.result(timeout=2)
+
+    assert connection.execute(
+        "SELECT first_name FROM patients WHERE id = ?", (patient_id,)
+    ).fetchone() == ("Anna",)
+
+    # The main connection can write again
+    connection.execute("INSERT INTO patients (first_name) VALUES ('Ben')")
+    connection.commit()
+
+
+def test_only_failing_write_is_rolled_back(database):
+    """A transaction whose only write failed is ended after the delay."""
+    path, connection, worker = database
+
+    failed: Future = worker.write(
+        "INSERT INTO treatment_entries (patient_id, timestamp) VALUES (?, ?)",
+        (12345, 1),
+    )
+
+    with pytest.raises(sqlite3.IntegrityError):
+        failed.result(timeout=2)
+
+    other_connection: sqlite3.Connection = sqlite3.connect(path, timeout=2)
+    other_connection.execute(
+        "INSERT INTO patients (first_name) VALUES ('Carla')"
+    )
+    other_connection.commit()
+    other_connection.close()
+
+
+def test_read_sees_submitted_writes(database):
+    """A read runs after earlier writes, even before they are committed."""
+    path, connection, worker = database
+
+    worker.write("INSERT INTO patients (first_name) VALUES (?)", ("Dora",))
+
+    read: Future = worker.submit(
+        lambda worker_connection: worker_connection.execute(
+            "SELECT first_name FROM patients"
+        ).fetchall()
+    )
+
+    assert read.result(timeout=2) == [("Dora",)]
+
+
+def test_failing_job_calls_error_callback(database):
+    """Errors are passed to the error callback in the main thread."""
+    from gi.repository import GLib  # type: ignore
+
+    path, connection, worker = database
+
+    errors: List[Exception] = []
+
+    failed: Future = worker.submit(
+        lambda worker_connection: worker_connection.execute(
+            "SELECT * FROM missing_table"
+        ),
+        callback=lambda result: pytest.fail("Callback called"),
+        error_callback=errors.append,
+    )
+
+    with pytest.raises(sqlite3.OperationalError):
+        failed.result(timeout=2)
+
+    deadline: float = time.monotonic() + 2
+
+    while not errors and time.monotonic() < deadline:
+        GLib.MainContext.default().iteration(False)
+
+    assert len(errors) == 1
+    assert isinstance(errors[0], sqlite3.OperationalError)
+
+
+def test_only_foreign_changes_are_counted(source, database, monkeypatch):
+    """Commits of the worker don't count as changes by other programs."""
+    database_util = source("database_util")
+
+    path, connection, worker = database
+
+    monkeypatch.setattr(database_util, "connection", connection)
+    monkeypatch.setattr(database_util, "worker", worker)
+    monkeypatch.setattr(database_util, "seen_data_version", None)
+
+    change_count: int = database_util.get_foreign_change_count()
+
+    worker.write(
+        "INSERT INTO patients (first_name) VALUES (?)", ("Emil",)
+    ).result(timeout=2)
+
+    assert database_util.get_foreign_change_count() == change_count
+
+    other_connection: sqlite3.Connection = sqlite3.connect(path, timeout=2)
+    other_connection.execute(
+        "INSERT INTO patients (first_name) VALUES ('Frieda')"
+    )
+    other_connection.commit()
+    other_connection.close()
+
+    assert database_util.get_foreign_change_count() == change_count + 1
@@ -0,0 +1,81 @@
+"""Tests for patient_util.PatientListModel."""
+
+from typing import List
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def patient_util(source, tmp_path, monkeypatch):
+    """Use a migrated database with five patients as the shared one."""
+    database_util = source("database_util")
+
+    connection: sqlite3.Connection = database_util.connect(
+        str(tmp_path / "test.db")
+    )
+    database_util.migrate(connection)
+
+    connection.executemany(
+        "INSERT INTO patients (first_name, last_name) VALUES ('', ?)",
+        [("Berg",), ("Dorn",), ("Dreher",), ("Horn",), ("Kern",)],
+    )
+    connection.commit()
+
+    monkeypatch.setattr(database_util, "connection", connection)
+
+    yield source("patient_util")
+
+    connection.close()
+
+
+def get_last_names(model) -> List[str]:
+    """Get the last names of the exposed patients."""
+    return [
+        model.get_patient(position).last_name
+        for position in range(model.do_get_n_items())
+    ]
+
+
+def test_added_patient_is_inserted(patient_util):
+    """An added patient gets its row without re-querying."""
+    model = patient_util.PatientListModel(page_size=2)
+    model.set_query(None)
+
+    patient = patient_util.Patient.add("", "cramer", "", "", None, "")
+
+    assert model.apply_added(patient)
+    assert get_last_names(model) == ["Berg", "cramer", "Dorn"]
+    assert model.total_count == 6
+
+    # The next page starts after the exposed patients
+    assert model.expose_more()
+    assert get_last_names(model) == ["Berg", "cramer", "Dorn", "Dreher"]
+
+
+def test_modified_patient_is_moved(patient_util):
+    """A modified patient that belongs after the exposed ones is removed."""
+    model = patient_util.PatientListModel(page_size=2)
+    model.set_query(None)
+
+    patient = model.get_patient(0)
+    patient.last_name = "Zorn"
+
+    assert model.apply_modified(patient)
+    assert get_last_names(model) == ["Dorn"]
+    assert model.total_count == 5
+
+
+def test_deleted_patient_is_removed(patient_util):
+    """A deleted patient's row is removed, also in a search."""
+    model = patient_util.PatientListModel(page_size=2)
+    model.set_query("d")
+
+    assert get_last_names(model) == ["Dorn", "Dreher"]
+
+    model.apply_deleted(model.get_patient(0))
+
+    assert get_last_names(model) == ["Dreher"]
+
+    # Where a modified patient belongs in a search isn't known
+    assert not model.apply_modified(model.get_patient(0))
@@ -0,0 +1,115 @@
+"""Tests for transfer_util's import and export."""
+
+from typing import Any, Dict, List
+import io
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def transfer(source, tmp_path):
+    """Create a migrated source and target database."""
+    database_util = source("database_util")
+
+    connections: List[sqlite3.Connection] = []
+
+    for name in ("source.db", "target.db"):
+        connection: sqlite3.Connection = database_util.connect(
+            str(tmp_path / name)
+        )
+        database_util.migrate(connection)
+        connections.append(connection)
+
+    yield source("transfer_util"), connections[0], connections[1]
+
+    for connection in connections:
+        connection.close()
+
+
+def round_trip(
+    transfer_util, source_connection, target_connection, file_format
+) -> Dict[str, Any]:
+    """Export all tables and import them into the target database.
+
+    Args:
+        transfer_util: The transfer_util module
+        source_connection (sqlite3.Connection): The database to export
+        target_connection (sqlite3.Connection): The database to import into
+        file_format (str): One of transfer_util.FORMATS
+
+    Returns:
+        Dict[str, Any]: The ImportResult of each table by name
+    """
+    importer = transfer_util.Importer(target_connection)
+    results: Dict[str, Any] = {}
+
+    for name in transfer_util.IMPORT_ORDER:
+        transfer_file: io.StringIO = io.StringIO()
+        transfer_util.write_rows(
+            transfer_util.export_rows(source_connection, name),
+            transfer_util.get_columns(source_connection, name),
+            transfer_file,
+            file_format,
+        )
+        transfer_file.seek(0)
+
+        results[name] = importer.import_rows(
+            name,
+            transfer_util.read_rows(transfer_file, file_format),
+            file_format,
+        )
+
+    return results
+
+
+@pytest.mark.parametrize("file_format", ["csv", "jsonl"])
+def test_round_trip_keeps_empty_text(transfer, file_format):
+    """Empty text stays empty text, empty numbers become NULL."""
+    transfer_util, source_connection, target_connection = transfer
+
+    source_connection.execute(
+        """
+            INSERT INTO patients
+                (first_name, last_name, birthday, gender, weight, comment)
+            VALUES ('Anna', 'Berg', '2000-01-01', '', NULL, '')
+        """
+    )
+    source_connection.commit()
+
+    results = round_trip(
+        transfer_util, source_connection, target_connection, file_format
+    )
+
+    assert results["patients"].imported == 1
+    assert target_connection.execute(
+        "SELECT first_name, gender, weight, comment FROM patients"
+    ).fetchall() == [("Anna", "", None, "")]
+
+
+def test_jsonl_empty_number_is_not_null(transfer):
+    """In JSON Lines, only null means NULL."""
+    transfer_util, source_connection, target_connection = transfer
+
+    with pytest.raises(ValueError):
+        transfer_util.Importer(target_connection).import_rows(
+            "patients", [{"first_name": "Anna", "weight": ""}], "jsonl"
+        )
+
+
+@pytest.mark.parametrize("patient_id", [None, ""])
+def test_treatment_without_patient_is_skipped(transfer, patient_id):
+    """Rows without a required reference are skipped, not inserted."""
+    transfer_util, source_connection, target_connection = transfer
+
+    result = transfer_util.Importer(target_connection).import_rows(
+        "treatments",
+        [
+            {"patient_id": patient_id, "timestamp": "1"},
+            {"timestamp": "2"},
+        ],
+        "csv",
+    )
+
+    assert result.skipped == 2
+    assert result.imported == 0